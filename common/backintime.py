@@ -26,7 +26,9 @@ from time import sleep
 
 import config
 import logger
+import progress
 import snapshots
+import retention
 import tools
 import sshtools
 import mount
@@ -271,6 +273,23 @@ def createParsers(app_name = 'backintime'):
     checkConfigCP.set_defaults(func = checkConfig)
     parsers[command] = checkConfigCP
 
+    command = 'convert-fileinfo'
+    nargs = '*'
+    description = "Convert permissions of snapshots taken with older versions " +\
+                  "from 'fileinfo.bz2' into the indexed 'fileinfo.db'."
+    convertFileInfoCP =    subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    convertFileInfoCP.set_defaults(func = convertFileInfo)
+    parsers[command] = convertFileInfoCP
+    convertFileInfoCP.add_argument              ('SNAPSHOT_ID',
+                                                 type = str,
+                                                 action = 'store',
+                                                 nargs = '*',
+                                                 help = 'ID of snapshots which should be converted. ' +\
+                                                 'Convert all snapshots if no SNAPSHOT_ID is given.')
+
     command = 'decode'
     nargs = '*'
     aliases.append((command, nargs))
@@ -419,6 +438,12 @@ def createParsers(app_name = 'backintime'):
                                                  epilog = epilogCommon,
                                                  help = description,
                                                  description = description)
+    smartRemoveCP.add_argument                  ('--dry-run',
+                                                 action = 'store_true',
+                                                 help = 'Only show which snapshots would be removed.')
+    smartRemoveCP.add_argument                  ('--explain',
+                                                 action = 'store_true',
+                                                 help = 'Show for every snapshot why it will be kept or removed.')
     smartRemoveCP.set_defaults(func = smartRemove)
     parsers[command] = smartRemoveCP
 
@@ -431,6 +456,12 @@ def createParsers(app_name = 'backintime'):
                                                  epilog = epilogCommon,
                                                  help = description,
                                                  description = description)
+    snapshotsListCP.add_argument                ('--sizes',
+                                                 action = 'store_true',
+                                                 help = 'Show exclusive and shared size and '
+                                                        'number of inodes for each snapshot. '
+                                                        'New snapshots will be scanned first. '
+                                                        'Only supported in local mode.')
     snapshotsListCP.set_defaults(func = snapshotsList)
     parsers[command] = snapshotsListCP
 
@@ -458,6 +489,18 @@ def createParsers(app_name = 'backintime'):
     snapshotsPathCP.set_defaults(func = snapshotsPath)
     parsers[command] = snapshotsPathCP
 
+    command = 'status'
+    description = 'Show progress of the snapshot which is currently taken.'
+    statusCP =             subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    statusCP.add_argument                       ('--follow',
+                                                 action = 'store_true',
+                                                 help = 'Keep showing progress until the snapshot is done.')
+    statusCP.set_defaults(func = status)
+    parsers[command] = statusCP
+
     command = 'unmount'
     nargs = 0
     aliases.append((command, nargs))
@@ -835,14 +878,37 @@ def snapshotsList(args):
     cfg = getConfig(args)
     _mount(cfg)
 
+    sizes = {}
+    if args.sizes:
+        sizes = snapshots.Snapshots(cfg).updateUsage(
+                lambda sid: logger.info('Scan snapshot {}'.format(sid)))
+        if sizes is None:
+            logger.error('Failed to get snapshot sizes')
+            if not args.keep_mount:
+                _umount(cfg)
+            sys.exit(RETURN_ERR)
+
     if args.quiet:
         msg = '{}'
+        sizeMsg = '{sid} {total} {exclusive} {shared} {inodes}'
     else:
         msg = 'SnapshotID: {}'
+        sizeMsg = 'SnapshotID: {sid}  Exclusive: {exclusive}  Shared: {shared}  Inodes: {inodes}'
     no_sids = True
     #use snapshots.listSnapshots instead of iterSnapshots because of sorting
     for sid in snapshots.listSnapshots(cfg, reverse = False):
-        print(msg.format(sid), file=force_stdout)
+        if args.sizes and str(sid) in sizes:
+            u = sizes[str(sid)]
+            if args.quiet:
+                print(sizeMsg.format(sid = sid, **u._asdict()), file=force_stdout)
+            else:
+                print(sizeMsg.format(sid = sid,
+                                     exclusive = tools.formatBytes(u.exclusive),
+                                     shared = tools.formatBytes(u.shared),
+                                     inodes = u.inodes),
+                      file=force_stdout)
+        else:
+            print(msg.format(sid), file=force_stdout)
         no_sids = False
     if no_sids:
         logger.error("There are no snapshots in '%s'" % cfg.profileName())
@@ -934,6 +1000,45 @@ def lastSnapshotPath(args):
         _umount(cfg)
     sys.exit(RETURN_OK)
 
+def status(args):
+    """
+    Command for printing progress of the snapshot which is currently taken
+    in current profile.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if a snapshot is running, 1 if not
+    """
+    force_stdout = setQuiet(args)
+    cfg = getConfig(args)
+    sn = snapshots.Snapshots(cfg)
+    if args.quiet:
+        msg = '{percent} {sent} {speed}'
+    else:
+        msg = 'Progress: {percent}%  Sent: {sent}  Speed: {speed}  Message: {message}'
+    last = None
+    ret = RETURN_ERR
+    while sn.busy():
+        ret = RETURN_OK
+        pg = progress.current(cfg)
+        message = sn.takeSnapshotMessage()
+        line = msg.format(percent = pg.intValue('percent') if pg else 0,
+                          sent = pg.strValue('sent', '-') if pg else '-',
+                          speed = pg.strValue('speed', '-') if pg else '-',
+                          message = message[1].replace('\n', ' ') if message else '')
+        if line != last:
+            print(line, file = force_stdout, flush = True)
+            last = line
+        if not args.follow:
+            break
+        sleep(progress.ProgressChannel.INTERVAL)
+    if ret != RETURN_OK:
+        logger.error("No snapshot is running in '%s'" % cfg.profileName())
+    sys.exit(ret)
+
 def unmount(args):
     """
     Command for unmounting all filesystems.
@@ -1038,6 +1143,39 @@ def decode(args):
     _umount(cfg)
     sys.exit(RETURN_OK)
 
+def convertFileInfo(args):
+    """
+    Command for converting old style 'fileinfo.bz2' into 'fileinfo.db'.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if successful, 1 if not
+    """
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    _mount(cfg)
+    ret = RETURN_OK
+    snapshotsList = snapshots.listSnapshots(cfg, reverse = False)
+    if args.SNAPSHOT_ID:
+        sids = [cli.selectSnapshot(snapshotsList, cfg, sid, 'SnapshotID to convert')
+                for sid in args.SNAPSHOT_ID]
+    else:
+        sids = snapshotsList
+    for sid in sids:
+        try:
+            if sid.convertFileInfo():
+                print('Converted {}'.format(sid), file = force_stdout)
+        except Exception as e:
+            logger.error('Failed to convert {} in snapshot {}: {}'.format(
+                         sid.FILEINFO_LEGACY, sid, str(e)))
+            ret = RETURN_ERR
+    _umount(cfg)
+    sys.exit(ret)
+
 def remove(args, force = False):
     """
     Command for removing snapshots.
@@ -1084,7 +1222,7 @@ def smartRemove(args):
         SystemExit:     0 if okay
                         2 if Smart-Remove is not configured
     """
-    setQuiet(args)
+    force_stdout = setQuiet(args)
     printHeader()
     cfg = getConfig(args)
     sn = snapshots.Snapshots(cfg)
@@ -1092,13 +1230,22 @@ def smartRemove(args):
     enabled, keep_all, keep_one_per_day, keep_one_per_week, keep_one_per_month = cfg.smartRemove()
     if enabled:
         _mount(cfg)
-        del_snapshots = sn.smartRemoveList(datetime.today(),
-                                           keep_all,
-                                           keep_one_per_day,
-                                           keep_one_per_week,
-                                           keep_one_per_month)
-        logger.info('Smart Remove will remove {} snapshots'.format(len(del_snapshots)))
-        sn.smartRemove(del_snapshots, log = logger.info)
+        keep, del_snapshots = sn.smartRemovePlan(datetime.today(),
+                                                 keep_all,
+                                                 keep_one_per_day,
+                                                 keep_one_per_week,
+                                                 keep_one_per_month)
+        if args.explain:
+            for line in retention.explain(snapshots.listSnapshots(cfg), keep):
+                print(line, file = force_stdout)
+        if args.dry_run:
+            logger.info('Smart Remove would remove {} snapshots'.format(len(del_snapshots)))
+            if not args.explain:
+                for sid in del_snapshots:
+                    print('SnapshotID: {}'.format(sid), file = force_stdout)
+        else:
+            logger.info('Smart Remove will remove {} snapshots'.format(len(del_snapshots)))
+            sn.smartRemove(del_snapshots, log = logger.info)
         _umount(cfg)
         sys.exit(RETURN_OK)
     else:
@@ -0,0 +1,273 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import json
+import time
+import hashlib
+import fnmatch
+
+import logger
+
+
+class ExcludeMatcher(object):
+    """
+    Decide which paths can be skipped while scanning include folders.
+
+    Only a safe subset of rsync's exclude patterns is supported: absolute
+    paths without wildcards and patterns without any '/' which match the
+    name of files or folders anywhere. All other patterns are ignored which
+    means the scan will cover more than rsync does. Changes in those paths
+    only cause an unnecessary rsync run but never a missed snapshot.
+
+    Args:
+        excludes (list):    list of exclude patterns
+    """
+    WILDCARDS = '*?['
+
+    def __init__(self, excludes):
+        self.paths = set()
+        self.names = []
+        self.folderNames = []
+        for pattern in excludes:
+            folderOnly = pattern.endswith(os.sep) and len(pattern) > 1
+            pattern = pattern.rstrip(os.sep)
+            if not pattern:
+                continue
+            if pattern.startswith(os.sep):
+                if not any(i in pattern for i in self.WILDCARDS):
+                    self.paths.add(pattern)
+            elif os.sep not in pattern:
+                pattern = pattern.replace('**', '*')
+                if folderOnly:
+                    self.folderNames.append(pattern)
+                else:
+                    self.names.append(pattern)
+
+    def match(self, path, name, isFolder):
+        """
+        Check if ``path`` is excluded.
+
+        Args:
+            path (str):         full path
+            name (str):         basename of ``path``
+            isFolder (bool):    ``True`` if ``path`` is a folder
+
+        Returns:
+            bool:               ``True`` if ``path`` is excluded
+        """
+        if path in self.paths:
+            return True
+        for pattern in self.names:
+            if fnmatch.fnmatchcase(name, pattern):
+                return True
+        if isFolder:
+            for pattern in self.folderNames:
+                if fnmatch.fnmatchcase(name, pattern):
+                    return True
+        return False
+
+class ChangeJournal(object):
+    """
+    Detect if include folders changed since the last snapshot without
+    running rsync.
+
+    Every include folder is summarized by a Merkle tree digest over name,
+    inode, mode, owner, size, mtime and ctime of all files and folders
+    inside. The digests are taken right before rsync starts and stored in
+    the local data folder afterwards. On the next run a new scan with
+    identical digests means nothing changed since the last rsync.
+
+    Files which were modified less than :py:attr:`RACY_SECONDS` before the
+    scan started could change again without a visible change in their
+    timestamps. Include folders with such files get no digest at all so
+    the next run will always call rsync.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID that should be used in ``cfg``
+    """
+    VERSION = 1
+    RACY_SECONDS = 2
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        self.profileID = profile_id
+        self.fileName = cfg.changeJournalFile(profile_id)
+
+    def scan(self, includeFolders):
+        """
+        Create digests for all ``includeFolders``.
+
+        Args:
+            includeFolders (list):  folders to include. list of tuples (item, int)
+                                    where ``int`` is ``0`` if ``item`` is a
+                                    folder or ``1`` if ``item`` is a file
+
+        Returns:
+            dict:                   {folder: digest} where digest is ``None``
+                                    if the folder had racy files
+        """
+        excludes = list(self.config.exclude(self.profileID))
+        excludes.extend((self.config.snapshotsPath(self.profileID),
+                         self.config._LOCAL_DATA_FOLDER,
+                         self.config._MOUNT_ROOT))
+        matcher = ExcludeMatcher(excludes)
+        racyTime = (time.time() - self.RACY_SECONDS) * 10**9
+        digests = {}
+        for folder, item_type in includeFolders:
+            self.racy = False
+            digest = self.treeDigest(folder, matcher, racyTime)
+            digests[folder] = None if self.racy else digest
+        return digests
+
+    def treeDigest(self, path, matcher, racyTime, st = None):
+        """
+        Recursive Merkle tree digest of ``path``.
+
+        Args:
+            path (str):                 full path to file or folder
+            matcher (ExcludeMatcher):   skip excluded paths
+            racyTime (int):             ``st_mtime_ns`` or ``st_ctime_ns``
+                                        newer than this mark the digest as racy
+            st (os.stat_result):        result of :py:func:`os.lstat` for
+                                        ``path`` if it is already known
+
+        Returns:
+            str:                        hex digest
+        """
+        h = hashlib.sha1()
+        if st is None:
+            try:
+                st = os.lstat(path)
+            except OSError as e:
+                h.update('error {}'.format(e.errno).encode())
+                return h.hexdigest()
+        h.update(self.statKey(st))
+        if st.st_mtime_ns >= racyTime or st.st_ctime_ns >= racyTime:
+            self.racy = True
+        if stat.S_ISDIR(st.st_mode):
+            try:
+                names = sorted(os.listdir(path))
+            except OSError as e:
+                h.update('error {}'.format(e.errno).encode())
+                return h.hexdigest()
+            for name in names:
+                child = os.path.join(path, name)
+                try:
+                    childSt = os.lstat(child)
+                except OSError:
+                    # treeDigest will add the error
+                    childSt = None
+                isFolder = childSt is not None and stat.S_ISDIR(childSt.st_mode)
+                if matcher.match(child, name, isFolder):
+                    continue
+                h.update(os.fsencode(name) + b'\0')
+                h.update(self.treeDigest(child, matcher, racyTime, childSt).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def statKey(st):
+        """
+        Serialize all attributes of ``st`` which are relevant for rsync.
+
+        Args:
+            st (os.stat_result):    result of :py:func:`os.lstat`
+
+        Returns:
+            bytes:                  serialized attributes
+        """
+        return '{} {} {} {} {} {} {}\n'.format(st.st_ino, st.st_mode,
+                                               st.st_uid, st.st_gid,
+                                               st.st_size, st.st_mtime_ns,
+                                               st.st_ctime_ns).encode()
+
+    def load(self):
+        """
+        Load digests stored after the last snapshot.
+
+        Returns:
+            dict:   stored journal or ``None`` if there is no valid journal
+        """
+        try:
+            with open(self.fileName, 'rt') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read change journal {}: {}'.format(self.fileName, str(e)), self)
+            return None
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            return None
+        return data
+
+    def save(self, sid, filterDigest, digests):
+        """
+        Store digests of a successful rsync run.
+
+        Args:
+            sid (SID):              latest snapshot after this run
+            filterDigest (str):     digest of rsync options, see
+                                    :py:func:`snapshots.Snapshots.rsyncFilterDigest`
+            digests (dict):         digests created with :py:func:`scan`
+                                    before rsync started
+        """
+        data = {'version': self.VERSION,
+                'snapshot': str(sid),
+                'filter_digest': filterDigest,
+                'folders': digests}
+        tmp = self.fileName + '.tmp'
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.fileName)
+        except OSError as e:
+            logger.debug('Failed to write change journal {}: {}'.format(self.fileName, str(e)), self)
+
+    def clear(self):
+        """
+        Remove stored digests so the next run will call rsync.
+        """
+        try:
+            os.remove(self.fileName)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug('Failed to remove change journal {}: {}'.format(self.fileName, str(e)), self)
+
+    def unchanged(self, sid, filterDigest, digests):
+        """
+        Compare ``digests`` with those stored after the last snapshot.
+
+        Args:
+            sid (SID):              latest snapshot
+            filterDigest (str):     digest of current rsync options
+            digests (dict):         current digests created with :py:func:`scan`
+
+        Returns:
+            bool:                   ``True`` if nothing changed since the last
+                                    rsync run
+        """
+        data = self.load()
+        if not data:
+            return False
+        if data.get('snapshot') != str(sid) or data.get('filter_digest') != filterDigest:
+            return False
+        if None in digests.values():
+            return False
+        return data.get('folders') == digests
@@ -0,0 +1,387 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import json
+import zlib
+import sqlite3
+
+import logger
+import tools
+from changejournal import ExcludeMatcher
+
+
+def excludeMatcher(cfg, profile_id = None):
+    """
+    Matcher for all excludes of a profile including the folders Back In Time
+    always excludes itself.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+
+    Returns:
+        changejournal.ExcludeMatcher:   matcher
+    """
+    excludes = list(cfg.exclude(profile_id))
+    excludes.extend((cfg.snapshotsPath(profile_id),
+                     cfg._LOCAL_DATA_FOLDER,
+                     cfg._MOUNT_ROOT))
+    return ExcludeMatcher(excludes)
+
+def walk(includeFolders, matcher):
+    """
+    Iterate over all regular files in ``includeFolders``.
+
+    Args:
+        includeFolders (list):      folders to include. list of tuples
+                                    (item, int) where ``int`` is ``0`` if
+                                    ``item`` is a folder or ``1`` if ``item``
+                                    is a file
+        matcher (changejournal.ExcludeMatcher): skip excluded paths
+
+    Yields:
+        tuple:                      (path, os.stat_result)
+    """
+    folders = []
+    for item, itemType in includeFolders:
+        if itemType:
+            try:
+                st = os.lstat(item)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                yield item, st
+        else:
+            folders.append(item)
+    while folders:
+        folder = folders.pop()
+        try:
+            names = os.listdir(folder)
+        except OSError as e:
+            logger.debug('Failed to scan {}: {}'.format(folder, str(e)))
+            continue
+        for name in names:
+            path = os.path.join(folder, name)
+            try:
+                st = os.lstat(path)
+            except OSError as e:
+                logger.debug('Failed to stat {}: {}'.format(path, str(e)))
+                continue
+            isFolder = stat.S_ISDIR(st.st_mode)
+            if matcher.match(path, name, isFolder):
+                continue
+            if isFolder:
+                folders.append(path)
+            elif stat.S_ISREG(st.st_mode):
+                yield path, st
+
+class ChecksumStore(object):
+    """
+    Persistent digests of source files and snapshot files which replace
+    rsync's ``--checksum`` on every file by a check of only those files
+    which could have changed unnoticed.
+
+    rsync's quick check skips files with equal size and mtime. Before rsync
+    runs, :py:func:`suspects` compares each source file which passes the
+    quick check against the file in the ``--link-dest`` snapshot by content.
+    Digests are cached, so a source file is only hashed again if
+    (device, inode, size, mtime, ctime) changed. A snapshot file is hashed
+    only once in its life because snapshots never change. Its ctime is not
+    part of the key because hardlinking it into a new snapshot changes it.
+    Only files whose digests differ are passed to a second rsync run with
+    ``--checksum``.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    SCHEMA = ('CREATE TABLE source (path BLOB PRIMARY KEY, dev INTEGER, '
+              'ino INTEGER, size INTEGER, mtime INTEGER, ctime INTEGER, '
+              'digest BLOB, run INTEGER) WITHOUT ROWID',
+              'CREATE TABLE snapshot (dev INTEGER, ino INTEGER, size INTEGER, '
+              'mtime INTEGER, digest BLOB, run INTEGER, '
+              'PRIMARY KEY (dev, ino)) WITHOUT ROWID',
+              'CREATE TABLE meta (key TEXT PRIMARY KEY, value)')
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.currentProfile()
+        self.profileID = profile_id
+        self.fileName = cfg.checksumStoreFile(profile_id)
+        self.hashed = 0
+        self.run = 0
+
+    def connect(self):
+        """
+        Open the store and create it if necessary.
+
+        Returns:
+            sqlite3.Connection: open database connection
+        """
+        conn = sqlite3.connect(self.fileName)
+        try:
+            if not conn.execute("SELECT name FROM sqlite_master "
+                                "WHERE type = 'table' AND name = 'meta'").fetchone():
+                with conn:
+                    for sql in self.SCHEMA:
+                        conn.execute(sql)
+        except:
+            conn.close()
+            raise
+        return conn
+
+    def sourceDigest(self, conn, path, st):
+        """
+        Digest of source file ``path``. Only hashed if its stat changed.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            path (str):                 full path
+            st (os.stat_result):        result of :py:func:`os.lstat`
+
+        Returns:
+            bytes:                      digest
+
+        Raises:
+            OSError:                    if ``path`` can not be read
+        """
+        key = os.fsencode(path)
+        row = conn.execute('SELECT dev, ino, size, mtime, ctime, digest FROM source '
+                           'WHERE path = ?', (key,)).fetchone()
+        if row and row[:5] == (st.st_dev, st.st_ino, st.st_size,
+                               st.st_mtime_ns, st.st_ctime_ns):
+            conn.execute('UPDATE source SET run = ? WHERE path = ?', (self.run, key))
+            return row[5]
+        digest = tools.fileDigest(path)
+        self.hashed += 1
+        conn.execute('INSERT OR REPLACE INTO source VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     (key, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns,
+                      st.st_ctime_ns, digest, self.run))
+        return digest
+
+    def snapshotDigest(self, conn, path, st):
+        """
+        Digest of snapshot file ``path``. Only hashed once per inode.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            path (str):                 full path
+            st (os.stat_result):        result of :py:func:`os.lstat`
+
+        Returns:
+            bytes:                      digest
+
+        Raises:
+            OSError:                    if ``path`` can not be read
+        """
+        row = conn.execute('SELECT size, mtime, digest FROM snapshot '
+                           'WHERE dev = ? AND ino = ?',
+                           (st.st_dev, st.st_ino)).fetchone()
+        if row and row[:2] == (st.st_size, st.st_mtime_ns):
+            conn.execute('UPDATE snapshot SET run = ? WHERE dev = ? AND ino = ?',
+                         (self.run, st.st_dev, st.st_ino))
+            return row[2]
+        digest = tools.fileDigest(path)
+        self.hashed += 1
+        conn.execute('INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?, ?, ?)',
+                     (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, digest, self.run))
+        return digest
+
+    def suspects(self, includeFolders, linkDest):
+        """
+        Find source files which rsync's quick check would skip although their
+        content differs from the ``--link-dest`` snapshot.
+
+        Args:
+            includeFolders (list):  folders to include. list of tuples (item, int)
+                                    where ``int`` is ``0`` if ``item`` is a
+                                    folder or ``1`` if ``item`` is a file
+            linkDest (list):        :py:class:`snapshots.SID` objects in the
+                                    same order they are passed to rsync
+
+        Returns:
+            list:                   full paths of suspect source files
+
+        Raises:
+            sqlite3.Error:          if the store can not be written
+        """
+        matcher = excludeMatcher(self.config, self.profileID)
+        suspects = []
+        self.hashed = 0
+        conn = self.connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+                self.run = (row[0] if row else 0) + 1
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (self.run,))
+                for path, st in walk(includeFolders, matcher):
+                    try:
+                        if self.suspect(conn, path, st, linkDest):
+                            suspects.append(path)
+                    except OSError as e:
+                        # let rsync decide
+                        logger.debug('Failed to compare {}: {}'.format(path, str(e)), self)
+                        suspects.append(path)
+                # forget files which are gone
+                conn.execute('DELETE FROM source WHERE run < ?', (self.run,))
+                conn.execute('DELETE FROM snapshot WHERE run < ?', (self.run,))
+        finally:
+            conn.close()
+        logger.debug('Hashed {} files, found {} suspects'.format(self.hashed, len(suspects)), self)
+        return suspects
+
+    def suspect(self, conn, path, st, linkDest):
+        """
+        Compare one source file with the file rsync would hardlink.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            path (str):                 full path of source file
+            st (os.stat_result):        result of :py:func:`os.lstat`
+            linkDest (list):            :py:class:`snapshots.SID` objects
+
+        Returns:
+            bool:                       ``True`` if the content differs
+
+        Raises:
+            OSError:                    if a file can not be read
+        """
+        for sid in linkDest:
+            other = sid.pathBackup(path)
+            try:
+                otherSt = os.lstat(other)
+            except OSError:
+                continue
+            if not stat.S_ISREG(otherSt.st_mode) or \
+               (otherSt.st_size, otherSt.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                continue
+            return self.sourceDigest(conn, path, st) != self.snapshotDigest(conn, other, otherSt)
+        # rsync will transfer it anyway
+        return False
+
+class RollingChecksum(object):
+    """
+    Verify a different slice of all files by checksum on every snapshot
+    instead of all files at once. Every file belongs to the slice
+    ``crc32(path) % slices`` so each file is compared by content at least
+    once every ``slices`` snapshots while a single run only reads a
+    fraction of the data.
+
+    The slice which is due next and the last snapshot which verified each
+    slice are stored per profile in
+    :py:func:`config.Config.checksumSlicesFile`.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    VERSION = 1
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.currentProfile()
+        self.profileID = profile_id
+        self.fileName = cfg.checksumSlicesFile(profile_id)
+        self.slices = cfg.checksumSlices(profile_id)
+
+    @staticmethod
+    def bucket(path, slices):
+        """
+        Slice ``path`` belongs to. Stable across runs and machines.
+
+        Args:
+            path (str):     full path
+            slices (int):   number of slices
+
+        Returns:
+            int:            slice index ``0 <= index < slices``
+        """
+        return zlib.crc32(os.fsencode(path)) % slices
+
+    def load(self):
+        """
+        Load coverage state. A changed number of slices starts over with the
+        first slice.
+
+        Returns:
+            dict:   ``{'next': int, 'verified': {str(index): str(sid)}}``
+        """
+        data = None
+        try:
+            with open(self.fileName, 'rt') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read checksum slices {}: {}'.format(self.fileName, str(e)), self)
+        if not isinstance(data, dict) or data.get('version') != self.VERSION \
+           or data.get('slices') != self.slices:
+            return {'next': 0, 'verified': {}}
+        return data
+
+    def nextSlice(self):
+        """
+        Index of the slice which should be verified by the next snapshot.
+
+        Returns:
+            int:    slice index
+        """
+        return self.load()['next'] % self.slices
+
+    def files(self, includeFolders, index):
+        """
+        All files in ``includeFolders`` which belong to slice ``index``.
+
+        Args:
+            includeFolders (list):  folders to include. list of tuples
+                                    (item, int) where ``int`` is ``0`` if
+                                    ``item`` is a folder or ``1`` if ``item``
+                                    is a file
+            index (int):            slice index
+
+        Returns:
+            list:                   full paths
+        """
+        matcher = excludeMatcher(self.config, self.profileID)
+        return [path for path, st in walk(includeFolders, matcher)
+                if self.bucket(path, self.slices) == index]
+
+    def save(self, index, sid):
+        """
+        Mark slice ``index`` as verified by snapshot ``sid`` and continue
+        with the next slice.
+
+        Args:
+            index (int):            slice index
+            sid (snapshots.SID):    snapshot which verified the slice
+        """
+        data = self.load()
+        data['version'] = self.VERSION
+        data['slices'] = self.slices
+        data['next'] = (index + 1) % self.slices
+        data['verified'][str(index)] = str(sid)
+        tmp = self.fileName + '.tmp'
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.fileName)
+        except OSError as e:
+            logger.debug('Failed to write checksum slices {}: {}'.format(self.fileName, str(e)), self)
@@ -20,6 +20,7 @@ import os
 import sys
 
 import tools
+import logger
 import snapshots
 import bcolors
 
@@ -52,7 +53,7 @@ def remove(cfg, snapshot_ids = None, force = None):
             return
 
     s = snapshots.Snapshots(cfg)
-    [s.remove(sid) for sid in sids]
+    s.removeSnapshots(sids, log = logger.debug)
 
 def checkConfig(cfg, crontab = True):
     import mount
@@ -23,6 +23,7 @@ import gettext
 import socket
 import random
 import shlex
+import hashlib
 try:
     import pwd
 except ImportError:
@@ -1201,6 +1202,28 @@ class Config(configfile.ConfigFileWithProfiles):
     def setUseChecksum(self, value, profile_id = None):
         return self.setProfileBoolValue('snapshots.use_checksum', value, profile_id)
 
+    def checksumStore(self, profile_id = None):
+        #?Keep digests of source and snapshot files when using checksums.
+        #?Only files which changed since they were hashed last time are
+        #?read again and only those whose content differs from the previous
+        #?snapshot are compared by rsync with --checksum.
+        #?Only used in local modes.
+        return self.profileBoolValue('snapshots.checksum_store.enabled', False, profile_id)
+
+    def setChecksumStore(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.checksum_store.enabled', value, profile_id)
+
+    def checksumSlices(self, profile_id = None):
+        #?Rolling checksum verification if 'Use checksum' is disabled. Each
+        #?snapshot compares one of this many slices of all files by checksum
+        #?so all files are verified once every this many snapshots. Files are
+        #?assigned to slices by a hash of their path. Not used in
+        #?ssh_encfs mode. 0 to disable.;0-365
+        return self.profileIntValue('snapshots.use_checksum.slices', 0, profile_id)
+
+    def setChecksumSlices(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.use_checksum.slices', value, profile_id)
+
     def logLevel(self, profile_id = None):
         #?Log level used during takeSnapshot.\n1 = Error\n2 = Changes\n3 = Info;1-3
         return self.profileIntValue('snapshots.log_level', 3, profile_id)
@@ -1215,6 +1238,133 @@ class Config(configfile.ConfigFileWithProfiles):
     def setTakeSnapshotRegardlessOfChanges(self, value, profile_id = None):
         return self.setProfileBoolValue('snapshots.take_snapshot_regardless_of_changes', value, profile_id)
 
+    def rsyncWorkers(self, profile_id = None):
+        #?Number of rsync processes which take a snapshot in parallel. Include
+        #?folders will be split up between them. Use 1 to run only one rsync
+        #?process for all include folders.;1-32
+        return self.profileIntValue('snapshots.rsync_workers', 1, profile_id)
+
+    def setRsyncWorkers(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.rsync_workers', value, profile_id)
+
+    def checkpoint(self, profile_id = None):
+        #?Sync every include folder with its own rsync process and record
+        #?finished folders in 'new_snapshot'. A continued snapshot will skip
+        #?folders which were already finished.
+        return self.profileBoolValue('snapshots.checkpoint.enabled', False, profile_id)
+
+    def setCheckpoint(self, value, profile_id = None):
+        self.setProfileBoolValue('snapshots.checkpoint.enabled', value, profile_id)
+
+    def messageRate(self, profile_id = None):
+        #?Maximum number of status messages per second which are written
+        #?for the GUI and sent to plugins while rsync is running. Errors are
+        #?always sent immediately. Use 0 to send every message.;0-100
+        return self.profileIntValue('snapshots.message_rate', 4, profile_id)
+
+    def setMessageRate(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.message_rate', value, profile_id)
+
+    def restoreWorkers(self, profile_id = None):
+        #?Number of rsync processes which restore files in parallel. Only
+        #?used if files from different folders are restored to a new
+        #?destination.;1-32
+        return self.profileIntValue('snapshots.restore_workers', 1, profile_id)
+
+    def setRestoreWorkers(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.restore_workers', value, profile_id)
+
+    def linkDestCount(self, profile_id = None):
+        #?Number of earlier snapshots rsync may hardlink unchanged files from
+        #?(--link-dest). Besides the newest snapshots this includes the last
+        #?snapshot which contained an include folder that is missing in
+        #?those.;1-20
+        return self.profileIntValue('snapshots.link_dest.count', 1, profile_id)
+
+    def setLinkDestCount(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.link_dest.count', value, profile_id)
+
+    def removeWorkers(self, profile_id = None):
+        #?Number of snapshots which are removed in parallel by smart-remove
+        #?and the other remove rules. Only used in local modes.;1-32
+        return self.profileIntValue('snapshots.remove_workers', 4, profile_id)
+
+    def setRemoveWorkers(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.remove_workers', value, profile_id)
+
+    def permissionsFromRsync(self, profile_id = None):
+        #?Collect permissions of new and changed files from the output of the
+        #?main rsync process and take unchanged ones from the previous
+        #?snapshot instead of scanning the whole new snapshot again.
+        #?Changed owners are only noticed if rsync runs as root.
+        return self.profileBoolValue('snapshots.permissions_from_rsync', False, profile_id)
+
+    def setPermissionsFromRsync(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.permissions_from_rsync', value, profile_id)
+
+    def changeJournal(self, profile_id = None):
+        #?Scan include folders for changes before running rsync and skip the
+        #?snapshot if nothing changed since the last rsync run. Only simple
+        #?exclude patterns are applied during the scan, changes in other
+        #?excluded files will still start rsync.
+        return self.profileBoolValue('snapshots.change_journal', False, profile_id)
+
+    def setChangeJournal(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.change_journal', value, profile_id)
+
+    def encfsPathCache(self, profile_id = None):
+        #?Keep paths encoded and decoded with 'encfsctl' in a cache file in
+        #?the local data folder so they don't need to be encoded again on
+        #?the next run. The cache contains plain and encrypted names.
+        return self.profileBoolValue('snapshots.encfs.path_cache', False, profile_id)
+
+    def setEncfsPathCache(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.encfs.path_cache', value, profile_id)
+
+    def snapshotCatalog(self, profile_id = None):
+        #?Keep a catalog of all snapshots next to the snapshots folder and use
+        #?it instead of scanning the folder as long as the folder didn't change.
+        return self.profileBoolValue('snapshots.catalog.enabled', True, profile_id)
+
+    def setSnapshotCatalog(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.catalog.enabled', value, profile_id)
+
+    def snapshotUsage(self, profile_id = None):
+        #?Update the hardlink aware size (exclusive and shared bytes) of new
+        #?snapshots after each run. This is also used to predict how many
+        #?snapshots need to be removed to keep min free space and inodes.
+        #?Only used in local mode.
+        return self.profileBoolValue('snapshots.usage.enabled', False, profile_id)
+
+    def setSnapshotUsage(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.usage.enabled', value, profile_id)
+
+    def versionIndex(self, profile_id = None):
+        #?Store which files changed in each snapshot while taking it. The
+        #?Snapshots dialog uses it to list snapshots which contain a file
+        #?without scanning all snapshots. Not used in ssh_encfs mode.
+        return self.profileBoolValue('snapshots.version_index.enabled', False, profile_id)
+
+    def setVersionIndex(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.version_index.enabled', value, profile_id)
+
+    def dedup(self, profile_id = None):
+        #?Hash all files which rsync transferred completely new and replace
+        #?them with hardlinks to identical files in earlier snapshots. This
+        #?saves space if files or folders were renamed or moved.
+        #?Only used in local mode.
+        return self.profileBoolValue('snapshots.dedup.enabled', False, profile_id)
+
+    def setDedup(self, value, profile_id = None):
+        return self.setProfileBoolValue('snapshots.dedup.enabled', value, profile_id)
+
+    def dedupMinSize(self, profile_id = None):
+        #?Only deduplicate files with at least this size in KiB.;0-99999999
+        return self.profileIntValue('snapshots.dedup.min_size', 1024, profile_id)
+
+    def setDedupMinSize(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.dedup.min_size', value, profile_id)
+
     def userCallbackNoLogging(self, profile_id = None):
         #?Do not catch std{out|err} from user-callback script.
         #?The script will only write to current TTY.
@@ -1248,12 +1398,25 @@ class Config(configfile.ConfigFileWithProfiles):
     def takeSnapshotLogFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "takesnapshot_%s.log" % self.fileId(profile_id))
 
+    def takeSnapshotLogIndexFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "takesnapshot_%s.log.idx" % self.fileId(profile_id))
+
     def takeSnapshotMessageFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.message" % self.fileId(profile_id))
 
     def takeSnapshotProgressFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.progress" % self.fileId(profile_id))
 
+    def takeSnapshotProgressChannel(self, profile_id = None):
+        #shared memory is not written to disk. Different data folders must
+        #not share the same record
+        folder = '/dev/shm'
+        if not os.access(folder, os.W_OK):
+            folder = self._LOCAL_DATA_FOLDER
+        digest = hashlib.md5(self._LOCAL_DATA_FOLDER.encode()).hexdigest()[:8]
+        return os.path.join(folder, "backintime-%s-%s-worker%s.progress"
+                            % (os.geteuid(), digest, self.fileId(profile_id)))
+
     def takeSnapshotInstanceFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.lock" % self.fileId(profile_id))
 
@@ -1314,6 +1477,39 @@ class Config(configfile.ConfigFileWithProfiles):
     def lastSnapshotSymlink(self, profile_id = None):
         return os.path.join(self.snapshotsFullPath(profile_id), 'last_snapshot')
 
+    def rsyncCapsCacheFile(self):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'rsync_caps.json')
+
+    def changeJournalFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'changejournal_%s.json' % self.fileId(profile_id))
+
+    def encfsPathCacheFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'encfs_pathcache_%s.json' % self.fileId(profile_id))
+
+    def snapshotCatalogFile(self, profile_id = None):
+        # stored next to the snapshots folder because writing it inside would
+        # change the folders mtime which is used to validate the catalog
+        path = self.snapshotsFullPath(profile_id)
+        return os.path.join(os.path.dirname(path), '%s.catalog' % os.path.basename(path))
+
+    def snapshotUsageFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'usage_%s.db' % self.fileId(profile_id))
+
+    def dedupIndexFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'dedup_%s.db' % self.fileId(profile_id))
+
+    def checksumStoreFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'checksums_%s.db' % self.fileId(profile_id))
+
+    def versionIndexFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'versions_%s.db' % self.fileId(profile_id))
+
+    def digestCacheFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'digests_%s.db' % self.fileId(profile_id))
+
+    def checksumSlicesFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'checksum_slices_%s.json' % self.fileId(profile_id))
+
     def encfsconfigBackupFolder(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, 'encfsconfig_backup_%s' % self.fileId(profile_id))
 
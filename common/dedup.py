@@ -0,0 +1,210 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import sqlite3
+
+import logger
+import tools
+
+
+class ContentIndex(object):
+    """
+    Persistent index of file contents in all snapshots of one profile which
+    is used to hardlink files that rsync transferred again although the same
+    content is already stored in an earlier snapshot. This happens if files
+    or folders were renamed or moved because ``--link-dest`` only looks at
+    the same path in the previous snapshot.
+
+    The index maps size and hash of a file to one path inside a snapshot and
+    its inode number. Entries are never trusted blindly. A match is only
+    used if the stored path (or the same path in the previous snapshot which
+    got hardlinked by rsync) still has the same inode and if mode, owner and
+    mtime are identical to the new file, just like rsync requires for
+    ``--link-dest``. Stale entries are replaced by the new file.
+
+    Only files in the local snapshot folder can be hardlinked so this works
+    in local mode only.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    SCHEMA = ('CREATE TABLE content (size INTEGER, digest BLOB, sid TEXT, '
+              'path BLOB, ino INTEGER, PRIMARY KEY (size, digest)) WITHOUT ROWID')
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.currentProfile()
+        self.profileID = profile_id
+        self.path = cfg.snapshotsFullPath(profile_id)
+        self.fileName = cfg.dedupIndexFile(profile_id)
+        self.minSize = cfg.dedupMinSize(profile_id) * 1024
+
+    @property
+    def supported(self):
+        return self.config.snapshotsMode(self.profileID) == 'local'
+
+    def connect(self):
+        """
+        Open the index and create it if necessary.
+
+        Returns:
+            sqlite3.Connection: open database connection
+        """
+        conn = sqlite3.connect(self.fileName)
+        try:
+            if not conn.execute("SELECT name FROM sqlite_master "
+                                "WHERE type = 'table' AND name = 'content'").fetchone():
+                with conn:
+                    conn.execute(self.SCHEMA)
+        except:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def sameMeta(a, b):
+        """
+        Check if two files could be hardlinked without changing any
+        attribute rsync would preserve.
+
+        Args:
+            a (os.stat_result): first file
+            b (os.stat_result): second file
+
+        Returns:
+            bool:               ``True`` if size, mode, owner and mtime are
+                                equal
+        """
+        return (a.st_size, a.st_mode, a.st_uid, a.st_gid, a.st_mtime_ns) == \
+               (b.st_size, b.st_mode, b.st_uid, b.st_gid, b.st_mtime_ns)
+
+    def deduplicate(self, newSnapshot, sid, prevSid, files):
+        """
+        Hardlink ``files`` in ``newSnapshot`` to identical files in earlier
+        snapshots and add all other ``files`` to the index.
+
+        Args:
+            newSnapshot (snapshots.NewSnapshot):    snapshot which is currently
+                                                    taken
+            sid (snapshots.SID):                    ID ``newSnapshot`` will
+                                                    get after renaming
+            prevSid (snapshots.SID):                previous snapshot used for
+                                                    ``--link-dest`` or ``None``
+            files (list):                           paths of newly transferred
+                                                    files as printed by rsync
+                                                    (relative to the backup
+                                                    folder)
+
+        Returns:
+            tuple:                                  (number of hardlinked
+                                                    files, reclaimed bytes)
+
+        Raises:
+            sqlite3.Error:                          if the index can not be
+                                                    written
+        """
+        def resolve(sidName, path):
+            # files of the current run are still in 'new_snapshot'
+            if sidName == sid.sid:
+                yield newSnapshot.pathBackup(path)
+                return
+            yield os.path.join(self.path, sidName, 'backup', path)
+            if prevSid and sidName != prevSid.sid:
+                yield prevSid.pathBackup(path)
+
+        count = reclaimed = 0
+        conn = self.connect()
+        try:
+            with conn:
+                for name in files:
+                    path = newSnapshot.pathBackup(name)
+                    try:
+                        st = os.lstat(path)
+                        if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1 or st.st_size < self.minSize:
+                            continue
+                        digest = tools.fileDigest(path)
+                    except OSError as e:
+                        logger.debug('Failed to hash {}: {}'.format(path, str(e)), self)
+                        continue
+                    row = conn.execute('SELECT sid, path, ino FROM content '
+                                       'WHERE size = ? AND digest = ?',
+                                       (st.st_size, digest)).fetchone()
+                    if row:
+                        target = self.match(resolve(row[0], os.fsdecode(row[1])), row[2], st)
+                        if target:
+                            if self.link(target, path):
+                                count += 1
+                                reclaimed += st.st_blocks * 512
+                            continue
+                    conn.execute('INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?)',
+                                 (st.st_size, digest, sid.sid, os.fsencode(name), st.st_ino))
+        finally:
+            conn.close()
+        return count, reclaimed
+
+    def match(self, candidates, ino, st):
+        """
+        Find the first candidate which still is the indexed inode and has the
+        same attributes as the new file.
+
+        Args:
+            candidates (iterable):  full paths
+            ino (int):              inode number stored in the index
+            st (os.stat_result):    new file
+
+        Returns:
+            str:                    full path or ``None``
+        """
+        for candidate in candidates:
+            try:
+                other = os.lstat(candidate)
+            except OSError:
+                continue
+            if other.st_ino == ino:
+                if self.sameMeta(other, st):
+                    return candidate
+                return None
+        return None
+
+    def link(self, target, path):
+        """
+        Replace ``path`` with a hardlink to ``target``.
+
+        Args:
+            target (str):   existing file in an earlier snapshot
+            path (str):     new file with identical content
+
+        Returns:
+            bool:           ``True`` if successful
+        """
+        tmp = path + '.bit-dedup'
+        try:
+            os.link(target, tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            # e.g. too many links or a read-only folder
+            logger.debug('Failed to hardlink {} to {}: {}'.format(path, target, str(e)), self)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        return True
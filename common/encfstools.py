@@ -16,6 +16,9 @@
 
 import os
 import grp
+import json
+import hashlib
+import collections
 import gettext
 import subprocess
 import re
@@ -323,13 +326,270 @@ class EncFS_SSH(EncFS_mount):
                 d['hash_id'] = d['hash_id_1']
             return d
 
-class Encode(object):
+class PathCache(object):
+    """
+    Bounded LRU cache for paths encoded or decoded by encfsctl.
+
+    encfs encrypts every path component with an IV chained from its parent
+    folders. So the result for a path also gives the results for all its
+    parent folders which are cached, too.
+
+    Args:
+        maxSize (int):  maximum number of cached paths
+        binary (bool):  ``True`` if paths are :py:class:`bytes`
+    """
+    def __init__(self, maxSize = 100000, binary = False):
+        self.maxSize = maxSize
+        self.binary = binary
+        self.sep = os.sep.encode() if binary else os.sep
+        self.data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, path):
+        """
+        Get cached result for ``path`` and mark it as recently used.
+
+        Args:
+            path (str):     plain or encrypted path
+
+        Returns:
+            str:            cached result or ``None``
+        """
+        try:
+            self.data.move_to_end(path)
+        except KeyError:
+            return None
+        return self.data[path]
+
+    def set(self, path, result):
+        """
+        Cache ``result`` for ``path`` and all its parent folders.
+
+        Args:
+            path (str):     plain or encrypted path
+            result (str):   encrypted or plain path
+        """
+        parts = path.split(self.sep)
+        resultParts = result.split(self.sep)
+        if len(parts) == len(resultParts):
+            for i in range(1, len(parts)):
+                prefix = self.sep.join(parts[:i])
+                if prefix:
+                    self._set(prefix, self.sep.join(resultParts[:i]))
+        self._set(path, result)
+
+    def _set(self, path, result):
+        self.data[path] = result
+        self.data.move_to_end(path)
+        while len(self.data) > self.maxSize:
+            self.data.popitem(last = False)
+
+    def load(self, fileName, section, digest):
+        """
+        Load cached paths from ``section`` in ``fileName``.
+
+        Args:
+            fileName (str): full path to the cache file
+            section (str):  'encode' or 'decode'
+            digest (str):   digest of the encfs config. The cache is only
+                            used if it was created with the same config
+        """
+        try:
+            with open(fileName, 'rt') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read encfs path cache {}: {}'.format(fileName, str(e)), self)
+            return
+        if data.get('digest') != digest:
+            return
+        for path, result in data.get(section, []):
+            if self.binary:
+                path, result = os.fsencode(path), os.fsencode(result)
+            self._set(path, result)
+
+    def save(self, fileName, section, digest):
+        """
+        Save cached paths into ``section`` of ``fileName``.
+
+        Args:
+            fileName (str): full path to the cache file
+            section (str):  'encode' or 'decode'
+            digest (str):   digest of the encfs config
+        """
+        data = {}
+        try:
+            with open(fileName, 'rt') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if data.get('digest') != digest:
+            data = {'digest': digest}
+        if self.binary:
+            data[section] = [(os.fsdecode(k), os.fsdecode(v)) for k, v in self.data.items()]
+        else:
+            data[section] = list(self.data.items())
+        tmp = fileName + '.tmp'
+        try:
+            with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wt') as f:
+                json.dump(data, f)
+            os.replace(tmp, fileName)
+        except OSError as e:
+            logger.debug('Failed to write encfs path cache {}: {}'.format(fileName, str(e)), self)
+
+class EncfsctlCodec(object):
+    """
+    Base class for :py:class:`Encode` and :py:class:`Decode`. Paths are
+    sent to 'encfsctl' in pipe mode. Multiple paths are written before their
+    results are read back so encfsctl doesn't have to wait for us.
+    Results are cached in a :py:class:`PathCache` which can optionally be
+    stored in the local data folder (see
+    :py:func:`config.Config.encfsPathCache`).
+
+    Subclasses need to set ``self.newline``, ``self.cache`` and implement
+    :py:func:`startProcess` and :py:func:`result`.
+    """
+    #maximum size of paths written to encfsctl which are not answered yet.
+    #Must be small enough that neither stdin nor stdout pipe will fill up.
+    MAX_IN_FLIGHT = 16 * 1024
+    CACHE_SECTION = None
+
+    def process(self):
+        """
+        Start encfsctl if it is not running yet.
+
+        Returns:
+            subprocess.Popen:   running encfsctl process
+        """
+        if not 'p' in vars(self):
+            self.startProcess()
+        if not self.p.returncode is None:
+            logger.warning('\'encfsctl %s\' process terminated. Restarting.' %self.CACHE_SECTION, self)
+            del self.p
+            self.startProcess()
+        return self.p
+
+    def path(self, path):
+        """
+        Encode or decode a single ``path``.
+        """
+        return self.paths([path])[0]
+
+    def paths(self, paths):
+        """
+        Encode or decode all ``paths`` at once.
+
+        Args:
+            paths (list):   plain or encrypted paths
+
+        Returns:
+            list:           encrypted or plain paths in the same order
+        """
+        missing = []
+        seen = set()
+        for path in paths:
+            if path not in seen and self.cache.get(path) is None:
+                missing.append(path)
+            seen.add(path)
+        if missing:
+            for path, ret in zip(missing, self.pipeline(missing)):
+                ret = self.result(path, ret)
+                if ret is not None:
+                    self.cache.set(path, ret)
+        ret = []
+        for path in paths:
+            result = self.cache.get(path)
+            if result is None:
+                result = self.result(path, self.cache.sep[:0])
+            ret.append(result)
+        return ret
+
+    def pipeline(self, paths):
+        """
+        Write ``paths`` to encfsctl and read their results. At most
+        :py:data:`MAX_IN_FLIGHT` bytes are written ahead of the results.
+
+        Args:
+            paths (list):   plain or encrypted paths
+
+        Returns:
+            list:           raw results from encfsctl in the same order
+        """
+        proc = self.process()
+        results = []
+        pending = collections.deque()
+        inFlight = 0
+        for path in paths:
+            data = path + self.newline
+            while pending and inFlight + len(data) > self.MAX_IN_FLIGHT:
+                inFlight -= pending.popleft()
+                results.append(proc.stdout.readline().strip(self.newline))
+            proc.stdin.write(data)
+            pending.append(len(data))
+            inFlight += len(data)
+        while pending:
+            pending.popleft()
+            results.append(proc.stdout.readline().strip(self.newline))
+        return results
+
+    def result(self, path, ret):
+        """
+        Check the result ``ret`` from encfsctl for ``path``. Empty results
+        are not valid.
+
+        Returns:
+            str:    value which should be cached or ``None`` if ``ret`` is
+                    not valid
+        """
+        return ret or None
+
+    def cacheConfig(self):
+        """
+        Get file and digest for the persistent path cache.
+
+        Returns:
+            tuple:  (fileName, digest) or ``(None, None)`` if the persistent
+                    cache is disabled or the encfs config is not available
+        """
+        cfg, profile_id = self.config, self.encfs.profile_id
+        if not cfg.encfsPathCache(profile_id) or not hasattr(self.encfs, 'configFile'):
+            return (None, None)
+        try:
+            with open(self.encfs.configFile(), 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return (None, None)
+        return (cfg.encfsPathCacheFile(profile_id), digest)
+
+    def loadCache(self):
+        """
+        Load the persistent path cache if it is enabled.
+        """
+        fileName, digest = self.cacheConfig()
+        if fileName:
+            self.cache.load(fileName, self.CACHE_SECTION, digest)
+
+    def saveCache(self):
+        """
+        Save the persistent path cache if it is enabled.
+        """
+        fileName, digest = self.cacheConfig()
+        if fileName and len(self.cache):
+            self.cache.save(fileName, self.CACHE_SECTION, digest)
+
+class Encode(EncfsctlCodec):
     """
     encode path with encfsctl.
     ENCFS_SSH will replace config.ENCODE whit this
     """
+    CACHE_SECTION = 'encode'
+
     def __init__(self, encfs):
         self.encfs = encfs
+        self.config = encfs.config
         self.password = self.encfs.password
         self.chroot = self.encfs.rev_root.currentMountpoint
         if not self.chroot[-1] == os.sep:
@@ -342,6 +602,10 @@ class Encode(object):
         self.re_asterisk = re.compile(r'\*')
         self.re_separate_asterisk = re.compile(r'(.*?)(\*+)(.*)')
 
+        self.newline = '\n'
+        self.cache = PathCache()
+        self.loadCache()
+
     def __del__(self):
         self.close()
 
@@ -363,18 +627,10 @@ class Encode(object):
                                     stdout=subprocess.PIPE,
                                     universal_newlines = True)
 
-    def path(self, path):
+    def result(self, path, ret):
         """
-        write plain path to encfsctl stdin and read encrypted path from stdout
+        check encrypted path ``ret`` read from encfsctl stdout for plain ``path``
         """
-        if not 'p' in vars(self):
-            self.startProcess()
-        if not self.p.returncode is None:
-            logger.warning('\'encfsctl encode\' process terminated. Restarting.', self)
-            del self.p
-            self.startProcess()
-        self.p.stdin.write(path + '\n')
-        ret = self.p.stdout.readline().strip('\n')
         if not len(ret) and len(path):
             logger.debug('Failed to encode %s. Got empty string'
                          %path, self)
@@ -444,6 +700,7 @@ class Encode(object):
         if 'p' in vars(self) and self.p.returncode is None:
             logger.debug('stop \'encfsctl encode\' process', self)
             self.p.communicate()
+            self.saveCache()
 
 class Bounce(object):
     """
@@ -456,6 +713,9 @@ class Bounce(object):
     def path(self, path):
         return path
 
+    def paths(self, paths):
+        return list(paths)
+
     def exclude(self, path):
         return path
 
@@ -468,10 +728,12 @@ class Bounce(object):
     def close(self):
         pass
 
-class Decode(object):
+class Decode(EncfsctlCodec):
     """
     decode path with encfsctl.
     """
+    CACHE_SECTION = 'decode'
+
     def __init__(self, cfg, string = True):
         self.config = cfg
         self.mode = cfg.snapshotsMode()
@@ -565,6 +827,9 @@ class Decode(object):
         else:
             self.newline = b'\n'
 
+        self.cache = PathCache(binary = not string)
+        self.loadCache()
+
     def __del__(self):
         self.close()
 
@@ -596,28 +861,73 @@ class Decode(object):
             assert isinstance(path, str), 'path is not str type: %s' % path
         else:
             assert isinstance(path, bytes), 'path is not bytes type: %s' % path
-        if not 'p' in vars(self):
-            self.startProcess()
-        if not self.p.returncode is None:
-            logger.warning('\'encfsctl decode\' process terminated. Restarting.', self)
-            del self.p
-            self.startProcess()
-        self.p.stdin.write(path + self.newline)
-        ret = self.p.stdout.readline()
-        ret = ret.strip(self.newline)
+        return self.paths([path])[0]
+
+    def result(self, path, ret):
+        """
+        check plain path ``ret`` read from encfsctl stdout for crypted ``path``
+        """
         if ret:
             return ret
-        return path
+        return None if path else path
+
+    def paths(self, paths):
+        """
+        decode all ``paths`` at once. Paths which can not be decoded will be
+        returned as they are.
+        """
+        return [ret if ret is not None else path
+                for path, ret in zip(paths, super(Decode, self).paths(paths))]
 
     #TODO: rename this, 'list' is corrupting sphinx doc
     def list(self, list_):
         """
         decode a list of paths
         """
-        output = []
-        for path in list_:
-            output.append(self.path(path))
-        return output
+        return self.paths(list_)
+
+    def prefetchLog(self, lines):
+        """
+        decode all paths in ``lines`` at once so following calls of
+        :py:func:`log` for these lines will only hit the cache
+        """
+        collected = []
+        for line in lines:
+            collected.extend(self.logPaths(line))
+        if collected:
+            self.paths(collected)
+
+    def logPaths(self, line):
+        """
+        crypted paths in a line of takesnapshot.log which :py:func:`log`
+        would decode
+        """
+        #rsync cmd
+        if line.startswith('[I] rsync') or line.startswith('[I] nocache rsync'):
+            ret = []
+            for regex in (self.re_include_exclude, self.re_remote_path, self.re_link_dest):
+                for m in regex.finditer(line):
+                    ret.extend(self.re_all_except_asterisk.findall(m.group(2)))
+            return ret
+        #[C] Change lines
+        m = self.re_change.match(line)
+        if not m is None:
+            return self.arrowPaths(m.group(2))
+        #[I] Information lines
+        if not self.re_skip.match(line) is None:
+            return []
+        m = self.re_info.match(line)
+        if not m is None:
+            return self.arrowPaths(m.group(2))
+        #[E] Error lines
+        m = self.re_error.match(line)
+        if not m is None:
+            return [m.group(2)]
+        #cp cmd
+        m = self.re_info_cp.match(line)
+        if not m is None:
+            return [m.group(2), m.group(4)]
+        return []
 
     def log(self, line):
         """
@@ -665,6 +975,15 @@ class Decode(object):
         """
         return self.path(m.group(0))
 
+    def arrowPaths(self, path):
+        """
+        split rsync's 'dest -> src' into both paths like :py:func:`pathWithArrow`
+        """
+        m = self.re_all_except_arrow.match(path)
+        if not m is None:
+            return [m.group(1), m.group(3)]
+        return [path]
+
     def pathWithArrow(self, path):
         """
         rsync print symlinks like 'dest -> src'. This will decode both and also normal paths
@@ -692,3 +1011,4 @@ class Decode(object):
         if 'p' in vars(self) and self.p.returncode is None:
             logger.debug('stop \'encfsctl decode\' process', self)
             self.p.communicate()
+            self.saveCache()
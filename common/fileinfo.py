@@ -0,0 +1,292 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import bz2
+import stat
+import shutil
+import sqlite3
+import urllib.parse
+from tempfile import TemporaryDirectory
+
+import logger
+
+
+class FileInfoDict(dict):
+    """
+    A :py:class:`dict` that maps a path (as :py:class:`bytes`) to a
+    tuple (:py:class:`int`, :py:class:`bytes`, :py:class:`bytes`).
+    """
+    def __init__(self):
+        # default permissions for /
+        # only used if fileinfo.bz2 does not contain a value for /
+        # when it was created with version <= 1.1.12
+        # bugfix for https://github.com/bit-team/backintime/issues/708
+        self[b'/'] = (16877, b'root', b'root')
+
+    def __setitem__(self, key, value):
+        assert isinstance(key, bytes), "key '{}' is not bytes instance".format(key)
+        assert isinstance(value, tuple), "value '{}' is not tuple instance".format(value)
+        assert len(value) == 3, "value '{}' does not have 3 items".format(value)
+        assert isinstance(value[0], int), "first value '{}' is not int instance".format(value[0])
+        assert isinstance(value[1], bytes), "second value '{}' is not bytes instance".format(value[1])
+        assert isinstance(value[2], bytes), "third value '{}' is not bytes instance".format(value[2])
+        super(FileInfoDict, self).__setitem__(key, value)
+
+def subtreeFilter(paths):
+    """
+    Create a filter which matches all ``paths``, everything below them and
+    all their parent folders.
+
+    Args:
+        paths (list):   list of :py:class:`bytes` paths or ``None``
+
+    Returns:
+        method:         callable which takes a :py:class:`bytes` path and
+                        returns ``True`` if the path is needed
+    """
+    if paths is None:
+        return lambda path: True
+    roots = [i.rstrip(b'/') or b'/' for i in paths]
+    parents = set((b'/',))
+    for root in roots:
+        while root != b'/':
+            parents.add(root)
+            root = os.path.dirname(root)
+    prefixes = tuple(i + b'/' for i in roots if i != b'/')
+    if b'/' in roots:
+        return lambda path: True
+    return lambda path: path in parents or path.startswith(prefixes)
+
+def modeFromRsync(itemType, bits):
+    """
+    Convert file type and permission bits reported by rsync with
+    ``--out-format='%i %B'`` into a mode like :py:attr:`os.stat_result.st_mode`.
+
+    Args:
+        itemType (str): second character of rsyncs itemize string (%i).
+                        ``f`` for files and ``d`` for folders
+        bits (str):     permission bits like ``rwxr-sr-t`` (%B)
+
+    Returns:
+        int:            mode or ``None`` if ``itemType`` or ``bits`` are
+                        not supported
+    """
+    types = {'f': stat.S_IFREG, 'd': stat.S_IFDIR}
+    if itemType not in types or len(bits) != 9:
+        return None
+    mode = types[itemType]
+    for i, (r, w, x, special) in enumerate(((stat.S_IRUSR, stat.S_IWUSR, stat.S_IXUSR, stat.S_ISUID),
+                                            (stat.S_IRGRP, stat.S_IWGRP, stat.S_IXGRP, stat.S_ISGID),
+                                            (stat.S_IROTH, stat.S_IWOTH, stat.S_IXOTH, stat.S_ISVTX))):
+        triple = bits[i * 3:i * 3 + 3]
+        if triple[0] == 'r':
+            mode |= r
+        if triple[1] == 'w':
+            mode |= w
+        if triple[2] in 'xst':
+            mode |= x
+        if triple[2] in 'sStT':
+            mode |= special
+    return mode
+
+def readLegacy(fileName, paths = None):
+    """
+    Read permissions from an old style 'fileinfo.bz2' file. The file has to be
+    decompressed and parsed entirely but only items matching ``paths`` will be
+    kept in memory.
+
+    Args:
+        fileName (str): full path to 'fileinfo.bz2'
+        paths (list):   only keep these paths (as :py:class:`bytes`), their
+                        subfolders and parents. Keep all if ``None``
+
+    Returns:
+        FileInfoDict:   dict of: {path: (permission, user, group)}
+
+    Raises:
+        FileNotFoundError:  if ``fileName`` does not exist
+        PermissionError:    if ``fileName`` is not readable
+    """
+    d = FileInfoDict()
+    match = subtreeFilter(paths)
+    with bz2.BZ2File(fileName, 'rb') as fileinfo:
+        for line in fileinfo:
+            line = line.strip(b'\n')
+            if not line:
+                continue
+            index = line.find(b'/')
+            if index < 0:
+                continue
+            f = line[index:]
+            if not f or not match(f):
+                continue
+            info = line[:index].strip().split(b' ')
+            if len(info) == 3:
+                d[f] = (int(info[0]), info[1], info[2]) #perms, user, group
+    return d
+
+class FileInfoDB(object):
+    """
+    Read permissions (owner, group and mode) from a snapshots 'fileinfo.db'.
+    This is a SQLite database with one table sorted by path. So looking up
+    a single path or a whole subtree will only read the necessary pages
+    instead of parsing the full file like with the old 'fileinfo.bz2'.
+
+    Snapshots never change after they are taken, so the database is opened
+    read-only and immutable which also works on sshfs mounts without locking.
+
+    Args:
+        fileName (str): full path to 'fileinfo.db'
+
+    Raises:
+        sqlite3.Error:  if the database can not be opened
+    """
+    SCHEMA = ('CREATE TABLE fileinfo (path BLOB PRIMARY KEY, '
+              'mode INTEGER, user BLOB, grp BLOB) WITHOUT ROWID')
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        uri = 'file:{}?mode=ro&immutable=1'.format(urllib.parse.quote(fileName))
+        self.conn = sqlite3.connect(uri, uri = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __getitem__(self, path):
+        info = self.get(path)
+        if info is None:
+            raise KeyError(path)
+        return info
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM fileinfo').fetchone()[0]
+
+    def get(self, path):
+        """
+        Get permissions for a single ``path``.
+
+        Args:
+            path (bytes):   full path as it was during backup
+
+        Returns:
+            tuple:          (permission, user, group) or ``None``
+        """
+        row = self.conn.execute('SELECT mode, user, grp FROM fileinfo WHERE path = ?',
+                                (path,)).fetchone()
+        if row:
+            return (row[0], bytes(row[1]), bytes(row[2]))
+
+    def subtree(self, path):
+        """
+        Iterate over ``path`` and everything below it.
+
+        Args:
+            path (bytes):   full path as it was during backup
+
+        Yields:
+            tuple:          (path, (permission, user, group))
+        """
+        path = path.rstrip(b'/') or b'/'
+        if path == b'/':
+            cur = self.conn.execute('SELECT path, mode, user, grp FROM fileinfo')
+        else:
+            # all children are between 'path/' and 'path0' because
+            # '0' is the next character after '/'
+            cur = self.conn.execute('SELECT path, mode, user, grp FROM fileinfo '
+                                    'WHERE path = ? OR (path >= ? AND path < ?)',
+                                    (path, path + b'/', path + b'0'))
+        for row in cur:
+            yield (bytes(row[0]), (row[1], bytes(row[2]), bytes(row[3])))
+
+    def load(self, paths = None):
+        """
+        Load permissions into a :py:class:`FileInfoDict`.
+
+        Args:
+            paths (list):   only load these paths (as :py:class:`bytes`), their
+                            subfolders and parents. Load all if ``None``
+
+        Returns:
+            FileInfoDict:   dict of: {path: (permission, user, group)}
+        """
+        d = FileInfoDict()
+        if paths is None:
+            paths = (b'/',)
+        for path in paths:
+            for key, info in self.subtree(path):
+                d[key] = info
+            parent = path.rstrip(b'/')
+            while parent and parent != b'/':
+                parent = os.path.dirname(parent)
+                info = self.get(parent)
+                if info is not None:
+                    d[parent] = info
+        return d
+
+    @classmethod
+    def write(cls, fileName, fileInfoDict):
+        """
+        Write ``fileInfoDict`` into a new database ``fileName``. The database
+        is build in a local temporary folder first and copied afterwards
+        because SQLite doesn't work reliable on network filesystems.
+
+        Args:
+            fileName (str):                 full path to 'fileinfo.db'
+            fileInfoDict (FileInfoDict):    dict of: {path: (permission, user, group)}
+
+        Raises:
+            OSError:        if ``fileName`` can not be written
+        """
+        with TemporaryDirectory() as d:
+            tmp = os.path.join(d, os.path.basename(fileName))
+            conn = sqlite3.connect(tmp)
+            try:
+                conn.execute(cls.SCHEMA)
+                conn.executemany('INSERT INTO fileinfo VALUES (?, ?, ?, ?)',
+                                 ((path, info[0], info[1], info[2])
+                                  for path, info in sorted(fileInfoDict.items())))
+                conn.commit()
+            finally:
+                conn.close()
+            shutil.copyfile(tmp, fileName)
+
+def convert(legacyFileName, fileName):
+    """
+    Convert an old style 'fileinfo.bz2' into 'fileinfo.db'.
+
+    Args:
+        legacyFileName (str):   full path to existing 'fileinfo.bz2'
+        fileName (str):         full path to the new 'fileinfo.db'
+
+    Returns:
+        int:                    number of converted items
+    """
+    d = readLegacy(legacyFileName)
+    FileInfoDB.write(fileName, d)
+    logger.debug('Converted {} items from {} into {}'.format(
+                 len(d), legacyFileName, fileName))
+    return len(d)
@@ -15,12 +15,17 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import mmap
+import time
+import struct
 
 import configfile
+import logger
 
 class ProgressFile(configfile.ConfigFile):
 
     RSYNC           = 50
+    REMOVE          = 60
 
     def __init__(self, cfg, filename = None):
         super(ProgressFile, self).__init__()
@@ -37,3 +42,176 @@ class ProgressFile(configfile.ConfigFile):
 
     def fileReadable(self):
         return os.access(self.filename, os.R_OK)
+
+class ProgressChannel(object):
+    """
+    Progress of a running snapshot in a fixed size record in shared memory
+    (``/dev/shm``). The worker updates the record in place at most every
+    :py:attr:`INTERVAL` seconds instead of writing a new
+    :py:class:`ProgressFile` for every line of rsync's output. Readers
+    (GUI, systray icon and ``backintime status``) read the record without
+    any locking.
+
+    The record starts with a sequence number which is odd while the worker
+    updates the record. Readers retry until they got the same even sequence
+    number before and after reading the values.
+
+    Args:
+        cfg (config.Config):    current config
+        filename (str):         full path of the record. Defaults to
+                                :py:func:`config.Config.takeSnapshotProgressChannel`
+    """
+    MAGIC    = b'BITP'
+    VERSION  = 1
+    INTERVAL = 0.5
+    # magic, version, sequence, pid, status, percent, time, sent, speed
+    LAYOUT   = struct.Struct('<4sHIiiid24s24s')
+
+    def __init__(self, cfg, filename = None):
+        self.config = cfg
+        self.filename = filename
+        if self.filename is None:
+            self.filename = self.config.takeSnapshotProgressChannel()
+        self.mmap = None
+        self.seq = 0
+        self.status = None
+        self.lastPublish = 0.0
+
+    def open(self):
+        """
+        Create the record for writing.
+
+        Raises:
+            OSError:    if the record can not be created or belongs to an
+                        other user
+        """
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            if os.fstat(fd).st_uid != os.geteuid():
+                raise PermissionError('{} belongs to an other user'.format(self.filename))
+            os.ftruncate(fd, self.LAYOUT.size)
+            self.mmap = mmap.mmap(fd, self.LAYOUT.size)
+        finally:
+            os.close(fd)
+
+    def publish(self, status, percent = 0, sent = '', speed = '', force = False):
+        """
+        Update the record. Updates with the same ``status`` are dropped if
+        the last one is less than :py:attr:`INTERVAL` seconds ago.
+
+        Args:
+            status (int):   :py:attr:`ProgressFile.RSYNC` or
+                            :py:attr:`ProgressFile.REMOVE`
+            percent (int):  progress in percent
+            sent (str):     sent bytes as reported by rsync
+            speed (str):    transfer speed as reported by rsync
+            force (bool):   publish even if the last update was just now
+
+        Raises:
+            OSError:        if the record can not be created
+        """
+        now = time.monotonic()
+        if not force and status == self.status and now - self.lastPublish < self.INTERVAL:
+            return
+        if self.mmap is None:
+            self.open()
+        self.status = status
+        self.lastPublish = now
+        self.seq += 1
+        struct.pack_into('<I', self.mmap, 6, self.seq)
+        self.LAYOUT.pack_into(self.mmap, 0, self.MAGIC, self.VERSION, self.seq,
+                              os.getpid(), status, percent, time.time(),
+                              sent.encode()[:24], speed.encode()[:24])
+        self.seq += 1
+        struct.pack_into('<I', self.mmap, 6, self.seq)
+
+    def read(self):
+        """
+        Read the current progress.
+
+        Returns:
+            dict:   with keys 'status', 'percent', 'sent', 'speed', 'pid'
+                    and 'time' or ``None`` if there is no valid record or the
+                    worker which wrote it is not running anymore
+        """
+        try:
+            fd = os.open(self.filename, os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return None
+        try:
+            if os.fstat(fd).st_uid != os.geteuid():
+                return None
+            for i in range(10):
+                data = os.pread(fd, self.LAYOUT.size, 0)
+                if len(data) < self.LAYOUT.size:
+                    return None
+                values = self.LAYOUT.unpack(data)
+                if values[0] != self.MAGIC or values[1] != self.VERSION:
+                    return None
+                if not values[2] % 2 and os.pread(fd, 4, 6) == data[6:10]:
+                    break
+                time.sleep(0.001)
+            else:
+                return None
+        except OSError as e:
+            logger.debug('Failed to read progress from {}: {}'.format(self.filename, str(e)), self)
+            return None
+        finally:
+            os.close(fd)
+
+        magic, version, seq, pid, status, percent, t, sent, speed = values
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return {'status':  status,
+                'percent': percent,
+                'sent':    sent.rstrip(b'\0').decode(errors = 'replace'),
+                'speed':   speed.rstrip(b'\0').decode(errors = 'replace'),
+                'pid':     pid,
+                'time':    t}
+
+    def close(self):
+        """
+        Remove the record.
+        """
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.status = None
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug('Failed to remove progress channel {}: {}'.format(self.filename, str(e)), self)
+
+def current(cfg):
+    """
+    Progress of a running snapshot or removal in the current profile. Read
+    from :py:class:`ProgressChannel` or from :py:class:`ProgressFile` if the
+    worker couldn't use shared memory.
+
+    Args:
+        cfg (config.Config):    current config
+
+    Returns:
+        ProgressFile:           progress with at least 'status' and
+                                'percent' or ``None`` if nothing is in
+                                progress
+    """
+    pg = ProgressFile(cfg)
+    values = ProgressChannel(cfg).read()
+    if values is not None:
+        pg.setIntValue('status', values['status'])
+        pg.setIntValue('percent', values['percent'])
+        for key in ('sent', 'speed'):
+            if values[key]:
+                pg.setStrValue(key, values[key])
+        return pg
+    if pg.fileReadable():
+        pg.load()
+        return pg
+    return None
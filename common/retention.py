@@ -0,0 +1,191 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import datetime
+from collections import OrderedDict
+
+
+class SnapshotMeta(object):
+    """
+    Cached metadata (failed flag and name) of snapshots. Values are taken
+    from the snapshot catalog if it is valid. Otherwise each value is read
+    from disk only once.
+
+    Args:
+        entries (dict): entries of :py:class:`snapshots.SnapshotCatalog` or
+                        ``None``
+    """
+    def __init__(self, entries = None):
+        self.entries = entries or {}
+        self.cache = {}
+
+    def get(self, sid, key):
+        entry = self.entries.get(sid.sid)
+        if entry is not None and entry.get(key) is not None:
+            return entry[key]
+        cache = self.cache.setdefault(sid.sid, {})
+        if key not in cache:
+            cache[key] = getattr(sid, key)
+        return cache[key]
+
+    def failed(self, sid):
+        return bool(self.get(sid, 'failed'))
+
+    def name(self, sid):
+        return self.get(sid, 'name')
+
+class RetentionPlanner(object):
+    """
+    Decide which snapshots should be kept by Smart-Remove in a single pass
+    over all snapshots.
+
+    Every rule splits time into windows (days, weeks, months and years)
+    and keeps the newest healthy snapshot inside each window. If all
+    snapshots in a window failed the newest one is kept anyway. Week windows
+    span eight days from Sunday to Sunday like they always did.
+
+    Args:
+        now (datetime.date):    day when Smart-Remove runs
+        keepAll (int):          keep all snapshots for the last ``keepAll`` days
+        keepOnePerDay (int):    keep one snapshot per day for the last
+                                ``keepOnePerDay`` days
+        keepOnePerWeek (int):   keep one snapshot per week for the last
+                                ``keepOnePerWeek`` weeks
+        keepOnePerMonth (int):  keep one snapshot per month for the last
+                                ``keepOnePerMonth`` months
+        keepNamed (bool):       don't remove snapshots with a name
+    """
+    def __init__(self,
+                 now,
+                 keepAll,
+                 keepOnePerDay,
+                 keepOnePerWeek,
+                 keepOnePerMonth,
+                 keepNamed = False):
+        self.now = now
+        self.keepAll = keepAll
+        self.keepOnePerDay = keepOnePerDay
+        self.keepOnePerWeek = keepOnePerWeek
+        self.keepOnePerMonth = keepOnePerMonth
+        self.keepNamed = keepNamed
+        # Sunday before now
+        self.weekStart = now - datetime.timedelta(days = now.weekday() + 1)
+
+    def windows(self, date, firstYear):
+        """
+        All windows which contain ``date``.
+
+        Args:
+            date (datetime.date):   date of a snapshot
+            firstYear (int):        year of the oldest snapshot
+
+        Yields:
+            tuple:                  (key, reason) where ``key`` identifies
+                                    the window
+        """
+        day = (self.now - date).days
+        if 0 <= day < self.keepOnePerDay:
+            yield ('day', day), 'one per day ({})'.format(date)
+
+        offset = (date - self.weekStart).days
+        first = (6 - offset) // 7
+        for week in (first, first + 1):
+            if 0 <= week < self.keepOnePerWeek and 0 <= offset + 7 * week < 8:
+                start = self.weekStart - datetime.timedelta(days = 7 * week)
+                yield ('week', week), 'one per week ({} - {})'.format(
+                      start, start + datetime.timedelta(days = 7))
+
+        month = (self.now.year - date.year) * 12 + self.now.month - date.month
+        if 0 <= month < self.keepOnePerMonth:
+            yield ('month', month), 'one per month ({:04}-{:02})'.format(date.year, date.month)
+
+        if firstYear <= date.year <= self.now.year:
+            yield ('year', date.year), 'one per year ({})'.format(date.year)
+
+    def plan(self, sids, meta = None):
+        """
+        Plan which snapshots should be kept and which should be removed.
+
+        Args:
+            sids (list):        :py:class:`snapshots.SID` objects sorted
+                                newest first
+            meta (SnapshotMeta):cached metadata for ``sids``
+
+        Returns:
+            tuple:              (keep, remove) where ``keep`` is an ordered dict
+                                {sid: [reason, ...]} of all snapshots which
+                                should be kept and ``remove`` is a list of
+                                snapshots which should be removed (newest
+                                first)
+        """
+        if meta is None:
+            meta = SnapshotMeta()
+        reasons = OrderedDict((sid, []) for sid in sids)
+        if not sids:
+            return reasons, []
+        reasons[sids[0]].append('last snapshot')
+        firstYear = sids[-1].date.year
+
+        first = OrderedDict()
+        healthy = {}
+        labels = {}
+        for sid in sids:
+            date = sid.date.date()
+            if 0 <= (self.now - date).days < self.keepAll:
+                reasons[sid].append('keep all for {} days'.format(self.keepAll))
+            keys = []
+            for key, label in self.windows(date, firstYear):
+                labels[key] = label
+                first.setdefault(key, sid)
+                if key not in healthy:
+                    keys.append(key)
+            # only check failed flag if this snapshot could still be kept
+            if keys and not meta.failed(sid):
+                for key in keys:
+                    healthy[key] = sid
+
+        for key, sid in first.items():
+            reasons[healthy.get(key, sid)].append(labels[key])
+
+        remove = []
+        for sid, reason in reasons.items():
+            if reason:
+                continue
+            if self.keepNamed and meta.name(sid):
+                reason.append('has a name')
+                continue
+            remove.append(sid)
+        keep = OrderedDict((sid, reason) for sid, reason in reasons.items() if reason)
+        return keep, remove
+
+def explain(sids, keep):
+    """
+    Report with the decision for every snapshot.
+
+    Args:
+        sids (list):    :py:class:`snapshots.SID` objects
+        keep (dict):    {sid: [reason, ...]} as returned by
+                        :py:func:`RetentionPlanner.plan`
+
+    Yields:
+        str:            one line per snapshot
+    """
+    for sid in sids:
+        if sid in keep:
+            yield '{}  keep    {}'.format(sid, ', '.join(keep[sid]))
+        else:
+            yield '{}  remove'.format(sid)
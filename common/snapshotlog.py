@@ -15,13 +15,20 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import io
 import os
 import re
+import bz2
+import struct
+import bisect
 import gettext
+import time
+import atexit
+import itertools
+import threading
 
 import logger
 import snapshots
-import tools
 
 _=gettext.gettext
 
@@ -54,6 +61,14 @@ class LogFilter(object):
              INFORMATION:       re.compile(r'^(?:\[I\]|[^\[])'),
              ERROR_AND_CHANGES: re.compile(r'^(?:\[E\]|\[C\]|[^\[])')}
 
+    # same filters for the line tags in :py:class:`LogIndex`
+    TAGS =  {None:              None,
+             NO_FILTER:         None,
+             ERROR:             re.compile(b'[E ]'),
+             CHANGES:           re.compile(b'[C ]'),
+             INFORMATION:       re.compile(b'[I ]'),
+             ERROR_AND_CHANGES: re.compile(b'[EC ]')}
+
     def __init__(self, mode = 0, decode = None):
         self.regex = self.REGEX[mode]
         self.decode = decode
@@ -89,6 +104,643 @@ class LogFilter(object):
         else:
             return line
 
+    def filterLines(self, lines, chunkSize = 1000):
+        """
+        Filter and decode all ``lines``. Paths will be decoded in chunks of
+        ``chunkSize`` lines at once instead of line by line.
+
+        Args:
+            lines (iterable):   log lines read from disk
+            chunkSize (int):    number of lines decoded at once
+
+        Yields:
+            str:                decoded line or ``None`` if the line was filtered
+        """
+        if not self.decode:
+            for line in lines:
+                yield self.filter(line)
+            return
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunkSize:
+                yield from self._filterChunk(chunk)
+                chunk = []
+        yield from self._filterChunk(chunk)
+
+    def _filterChunk(self, chunk):
+        self.decode.prefetchLog([line for line in chunk
+                                 if line and (not self.regex or self.regex.match(line))])
+        for line in chunk:
+            yield self.filter(line)
+
+class LogIndex(object):
+    """
+    Sidecar index for snapshot logs with one fixed size record for every log
+    line. A record holds the offset right behind the line and a one byte tag:
+    ``E``, ``C`` or ``I`` for lines starting with ``[E]``, ``[C]`` or ``[I]``,
+    ``[`` for other lines starting with a bracket and a blank for everything
+    else. Filtering a log only needs to scan the tags and will read nothing
+    but the matching lines.
+
+    Archived logs inside snapshots are compressed as a sequence of
+    independent bz2 streams with about :py:data:`CHUNK_SIZE` bytes each. The
+    index header lists where every chunk starts so single lines can be read
+    without decompressing everything in front of them. ``bzip2`` and
+    :py:class:`bz2.BZ2File` still read those files like a normal log.
+    """
+    MAGIC = b'BITLOGIX'
+    VERSION = 1
+    HEADER = struct.Struct('<8sII')     # magic, version, number of chunks
+    CHUNK = struct.Struct('<QQ')        # uncompressed start, compressed start
+    RECORD = struct.Struct('<Qc')       # end of line, tag
+    CHUNK_SIZE = 1024 * 1024
+
+    @staticmethod
+    def tag(line):
+        """
+        Get the tag for ``line``.
+
+        Args:
+            line (bytes):   log line
+
+        Returns:
+            bytes:          one byte tag
+        """
+        head = line[:3]
+        if head in (b'[E]', b'[C]', b'[I]'):
+            return head[1:2]
+        if head[:1] == b'[':
+            return b'['
+        return b' '
+
+    @classmethod
+    def records(cls, data, offset = 0):
+        """
+        Create index records for all complete lines in ``data``.
+
+        Args:
+            data (bytes):   log content
+            offset (int):   position of ``data`` inside the log
+
+        Returns:
+            tuple:          (records, end) where ``records`` are :py:class:`bytes`
+                            and ``end`` is the position right behind the
+                            last complete line
+        """
+        records = bytearray()
+        start = 0
+        while True:
+            end = data.find(b'\n', start) + 1
+            if not end:
+                break
+            records += cls.RECORD.pack(offset + end, cls.tag(data[start:start + 3]))
+            start = end
+        return bytes(records), offset + start
+
+    @classmethod
+    def header(cls, chunks = ()):
+        """
+        Create the index header.
+
+        Args:
+            chunks (list):  list of tuples (uncompressed start, compressed start)
+                            for compressed logs
+
+        Returns:
+            bytes:          header
+        """
+        return cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(chunks)) \
+               + b''.join(cls.CHUNK.pack(*i) for i in chunks)
+
+    @classmethod
+    def readHeader(cls, f):
+        """
+        Read the index header from file object ``f``.
+
+        Args:
+            f (file):   index opened in binary mode
+
+        Returns:
+            tuple:      (chunks, headerSize)
+
+        Raises:
+            ValueError: if ``f`` doesn't start with a valid header
+        """
+        data = f.read(cls.HEADER.size)
+        if len(data) < cls.HEADER.size:
+            raise ValueError('index header is incomplete')
+        magic, version, count = cls.HEADER.unpack(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError('unsupported index format')
+        data = f.read(count * cls.CHUNK.size)
+        if len(data) < count * cls.CHUNK.size:
+            raise ValueError('index chunk table is incomplete')
+        chunks = [cls.CHUNK.unpack_from(data, i * cls.CHUNK.size) for i in range(count)]
+        return chunks, cls.HEADER.size + len(data)
+
+class LogIndexWriter(object):
+    """
+    Keep the :py:class:`LogIndex` of a growing log up to date. If the index
+    doesn't match the current log it will be recreated first.
+
+    Args:
+        fileName (str):     full path to the index
+        logFileName (str):  full path to the log
+    """
+    def __init__(self, fileName, logFileName):
+        self.fileName = fileName
+        self.pending = b''
+        try:
+            logSize = os.path.getsize(logFileName)
+        except FileNotFoundError:
+            logSize = 0
+        self.end = self.indexedEnd()
+        if self.end == logSize:
+            self.f = open(fileName, 'ab')
+        else:
+            self.rebuild(logFileName)
+
+    def indexedEnd(self):
+        """
+        Get the position behind the last line in the current index.
+
+        Returns:
+            int:    position or ``None`` if there is no valid index
+        """
+        try:
+            with open(self.fileName, 'rb') as f:
+                chunks, headerSize = LogIndex.readHeader(f)
+                size = os.fstat(f.fileno()).st_size - headerSize
+                if chunks or size % LogIndex.RECORD.size:
+                    return None
+                if not size:
+                    return 0
+                f.seek(-LogIndex.RECORD.size, os.SEEK_END)
+                return LogIndex.RECORD.unpack(f.read(LogIndex.RECORD.size))[0]
+        except (OSError, ValueError):
+            return None
+
+    def rebuild(self, logFileName):
+        """
+        Recreate the index for all lines which are already in the log.
+
+        Args:
+            logFileName (str):  full path to the log
+        """
+        self.f = open(self.fileName, 'wb')
+        self.f.write(LogIndex.header())
+        self.end = 0
+        try:
+            with open(logFileName, 'rb') as log:
+                for data in iter(lambda: log.read(LogIndex.CHUNK_SIZE), b''):
+                    self.append(data)
+        except FileNotFoundError:
+            pass
+
+    def append(self, data):
+        """
+        Add records for new lines.
+
+        Args:
+            data (bytes):   content which was appended to the log
+        """
+        data = self.pending + data
+        records, end = LogIndex.records(data, self.end)
+        self.pending = data[end - self.end:]
+        self.f.write(records)
+        self.end = end
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def writeArchive(log, fileName, indexFileName):
+    """
+    Write ``log`` into ``fileName`` compressed in independent bz2 chunks and
+    create its :py:class:`LogIndex` in ``indexFileName``.
+
+    Args:
+        log:                    full log as :py:class:`bytes` or file object
+                                opened in binary mode
+        fileName (str):         full path to the compressed log
+        indexFileName (str):    full path to the index
+    """
+    if isinstance(log, bytes):
+        log = io.BytesIO(log)
+    chunks = []
+    records = bytearray()
+    offset = 0
+    with open(fileName, 'wb') as f:
+        chunk = bytearray()
+        for line in itertools.chain(log, (None,)):
+            if line is not None:
+                if not line.endswith(b'\n'):
+                    line += b'\n'
+                chunk += line
+                if len(chunk) < LogIndex.CHUNK_SIZE:
+                    continue
+            if chunk:
+                chunk = bytes(chunk)
+                chunks.append((offset, f.tell()))
+                f.write(bz2.compress(chunk))
+                rec, offset = LogIndex.records(chunk, offset)
+                records += rec
+                chunk = bytearray()
+    with open(indexFileName, 'wb') as f:
+        f.write(LogIndex.header(chunks))
+        f.write(records)
+
+class LogReader(object):
+    """
+    Lazily read and filter a log with the help of its :py:class:`LogIndex`.
+    Only the tags in the index are scanned for filtering and only matching
+    lines are read from disk.
+
+    Lines at the end of a growing log which are not in the index yet will
+    be indexed in memory. A log without any index (e.g. written by an older
+    version) is indexed in memory once.
+
+    Args:
+        logFileName (str):      full path to the log
+        indexFileName (str):    full path to the index
+        compressed (bool):      ``True`` if the log was written with
+                                :py:func:`writeArchive`. Those need a valid
+                                index
+
+    Raises:
+        OSError:                if the log can not be opened
+        ValueError:             if ``compressed`` is ``True`` and there is no
+                                valid index
+    """
+    BLOCK = 65536
+
+    def __init__(self, logFileName, indexFileName, compressed = False):
+        self.logFileName = logFileName
+        self.indexFileName = indexFileName
+        self.compressed = compressed
+        self.log = None
+        self.index = None
+        self.open()
+        self.truncated = False
+        if compressed and self.index is None:
+            self.close()
+            raise ValueError('No valid index for {}'.format(logFileName))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.indexed + len(self.extra) // LogIndex.RECORD.size
+
+    def open(self):
+        """
+        (Re-)open log and index and start from the beginning.
+        """
+        self.close()
+        self.log = open(self.logFileName, 'rb')
+        self.position = 0
+        self.size = 0
+        self.indexed = 0
+        self.extra = b''
+        self.extraStart = self.extraEnd = 0
+        self.chunks = []
+        self.chunkStarts = []
+        self.chunk = (None, b'')
+        try:
+            self.index = open(self.indexFileName, 'rb')
+            self.chunks, self.headerSize = LogIndex.readHeader(self.index)
+            self.chunkStarts = [i[0] for i in self.chunks]
+        except FileNotFoundError:
+            self.index = None
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read log index {}: {}'.format(self.indexFileName, str(e)), self)
+            if self.index:
+                self.index.close()
+            self.index = None
+        self.refresh()
+
+    def close(self):
+        for f in (self.log, self.index):
+            if f:
+                f.close()
+        self.log = self.index = None
+
+    def refresh(self):
+        """
+        Pick up lines which were added to the log since the last call. If
+        the log was replaced by a new one in the meantime everything will be
+        reset and :py:attr:`truncated` is set to ``True``.
+        """
+        if self.compressed:
+            if self.index:
+                self.indexed = self._indexSize()
+            return
+        try:
+            st = os.stat(self.logFileName)
+        except OSError:
+            st = None
+        if st is None or st.st_ino != os.fstat(self.log.fileno()).st_ino or st.st_size < self.size:
+            self.open()
+            self.truncated = True
+            return
+        self.size = st.st_size
+        indexedEnd = 0
+        if self.index:
+            self.indexed = self._indexSize()
+            while self.indexed:
+                indexedEnd = self._end(self.indexed - 1)
+                if indexedEnd <= self.size:
+                    break
+                # index was flushed before the log
+                self.indexed -= 1
+        if indexedEnd != self.extraStart:
+            self.extra = b''
+            self.extraStart = self.extraEnd = indexedEnd
+        if self.size > self.extraEnd:
+            self.log.seek(self.extraEnd)
+            records, self.extraEnd = LogIndex.records(self.log.read(self.size - self.extraEnd),
+                                                      self.extraEnd)
+            self.extra += records
+
+    def _indexSize(self):
+        size = os.fstat(self.index.fileno()).st_size - self.headerSize
+        return max(size, 0) // LogIndex.RECORD.size
+
+    def _records(self, position, count):
+        """
+        Read up to ``count`` raw records starting at ``position``.
+        """
+        data = b''
+        if position < self.indexed:
+            n = min(count, self.indexed - position)
+            self.index.seek(self.headerSize + position * LogIndex.RECORD.size)
+            data = self.index.read(n * LogIndex.RECORD.size)
+            position += n
+            count -= n
+        if count > 0:
+            start = (position - self.indexed) * LogIndex.RECORD.size
+            data += self.extra[start:start + count * LogIndex.RECORD.size]
+        return data
+
+    def _end(self, position):
+        """
+        Position right behind line number ``position`` in the log.
+        """
+        if position < 0:
+            return 0
+        return LogIndex.RECORD.unpack(self._records(position, 1))[0]
+
+    def _read(self, start, end):
+        """
+        Read the log between ``start`` and ``end``.
+        """
+        if not self.chunks:
+            self.log.seek(start)
+            return self.log.read(end - start)
+        i = bisect.bisect_right(self.chunkStarts, start) - 1
+        if self.chunk[0] != i:
+            self.log.seek(self.chunks[i][1])
+            if i + 1 < len(self.chunks):
+                data = self.log.read(self.chunks[i + 1][1] - self.chunks[i][1])
+            else:
+                data = self.log.read()
+            self.chunk = (i, bz2.decompress(data))
+        offset = self.chunkStarts[i]
+        return self.chunk[1][start - offset:end - offset]
+
+    def _blocks(self, start):
+        """
+        Iterate over all records starting at ``start`` in blocks.
+
+        Yields:
+            tuple:  (position, previous end, records, tags)
+        """
+        position = start
+        prevEnd = self._end(start - 1)
+        while position < len(self):
+            records = self._records(position, self.BLOCK)
+            tags = records[LogIndex.RECORD.size - 1::LogIndex.RECORD.size]
+            if not tags:
+                break
+            yield position, prevEnd, records, tags
+            prevEnd = LogIndex.RECORD.unpack_from(records, len(records) - LogIndex.RECORD.size)[0]
+            position += len(tags)
+
+    @staticmethod
+    def _matches(mode, tags):
+        regex = LogFilter.TAGS[mode]
+        if regex is None:
+            return range(len(tags))
+        return [m.start() for m in regex.finditer(tags)]
+
+    def iterLines(self, mode = None, start = 0):
+        """
+        Lazily iterate over all lines matching ``mode``.
+        :py:attr:`position` will always point behind the last yielded line.
+
+        Args:
+            mode (int):     Mode used for filtering. Take a look at
+                            :py:class:`snapshotlog.LogFilter`
+            start (int):    index position (line number) to start from
+
+        Yields:
+            str:            log lines without newline
+        """
+        self.refresh()
+        for position, prevEnd, records, tags in self._blocks(start):
+            for i in self._matches(mode, tags):
+                begin = LogIndex.RECORD.unpack_from(records, (i - 1) * LogIndex.RECORD.size)[0] if i else prevEnd
+                end = LogIndex.RECORD.unpack_from(records, i * LogIndex.RECORD.size)[0]
+                self.position = position + i + 1
+                yield self._read(begin, end).decode('utf-8', 'replace').rstrip('\n')
+            self.position = position + len(tags)
+
+    def tail(self, mode = None):
+        """
+        Lines matching ``mode`` which were added since the last call of
+        :py:func:`iterLines` or :py:func:`tail`. Check :py:attr:`truncated`
+        afterwards, if the log was replaced this will start from the
+        beginning again.
+
+        Args:
+            mode (int): Mode used for filtering
+
+        Returns:
+            generator:  new log lines
+        """
+        self.truncated = False
+        self.refresh()
+        return self.iterLines(mode, self.position)
+
+    def skip(self, mode, count, start = 0):
+        """
+        Skip ``count`` lines matching ``mode`` without reading them.
+
+        Args:
+            mode (int):     Mode used for filtering
+            count (int):    number of lines to skip
+            start (int):    index position to start from
+
+        Returns:
+            int:            index position behind the last skipped line
+        """
+        if count <= 0:
+            return start
+        self.refresh()
+        for position, prevEnd, records, tags in self._blocks(start):
+            matches = self._matches(mode, tags)
+            if len(matches) >= count:
+                return position + matches[count - 1] + 1
+            count -= len(matches)
+        return max(start, len(self))
+
+    def count(self, mode = None):
+        """
+        Number of lines matching ``mode``.
+
+        Args:
+            mode (int):     Mode used for filtering
+
+        Returns:
+            int:            number of lines
+        """
+        self.refresh()
+        return sum(len(self._matches(mode, tags)) for _, _, _, tags in self._blocks(0))
+
+    def page(self, mode, first, count):
+        """
+        Get ``count`` lines matching ``mode`` starting with the ``first``
+        matching line.
+
+        Args:
+            mode (int):     Mode used for filtering
+            first (int):    number of matching lines in front of the page
+            count (int):    maximum number of lines
+
+        Returns:
+            list:           list of str
+        """
+        return list(itertools.islice(self.iterLines(mode, self.skip(mode, first)), count))
+
+class LogWriter(object):
+    """
+    Append lines to the log and its :py:class:`LogIndex` in a background
+    thread. Lines are collected in a bounded buffer and written in batches
+    once :py:attr:`BATCH_SIZE` bytes are waiting. Files are flushed at least
+    every :py:attr:`FLUSH_INTERVAL` seconds.
+
+    Args:
+        fileName (str):         full path to the log
+        indexFileName (str):    full path to the index
+    """
+    BATCH_SIZE     = 64 * 1024
+    MAX_SIZE       = 16 * 1024 * 1024
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, fileName, indexFileName):
+        self.fileName = fileName
+        self.pid = os.getpid()
+        self.logFile = open(fileName, 'ab')
+        self.index = LogIndexWriter(indexFileName, fileName)
+        self.buffer = []
+        self.size = 0
+        self.flushRequests = 0
+        self.flushed = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def append(self, data):
+        """
+        Add ``data`` to the buffer. Blocks if the buffer is full.
+
+        Args:
+            data (bytes):   complete lines
+        """
+        with self.condition:
+            while self.size >= self.MAX_SIZE and self.thread.is_alive():
+                self.condition.wait()
+            if not self.buffer or self.size + len(data) >= self.BATCH_SIZE:
+                #start the flush timer or write a full batch
+                self.condition.notify_all()
+            self.buffer.append(data)
+            self.size += len(data)
+
+    def flush(self):
+        """
+        Wait until all buffered lines are written and flushed.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.flushRequests += 1
+            request = self.flushRequests
+            self.condition.notify_all()
+            while self.flushed < request and self.thread.is_alive():
+                self.condition.wait(1)
+
+    def close(self):
+        """
+        Write all buffered lines and stop the background thread.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        atexit.unregister(self.close)
+        self.thread.join()
+
+    def run(self):
+        lastFlush = time.monotonic()
+        unflushed = False
+        try:
+            while True:
+                with self.condition:
+                    while not (self.closed or self.size >= self.BATCH_SIZE
+                               or self.flushRequests > self.flushed):
+                        timeout = lastFlush + self.FLUSH_INTERVAL - time.monotonic()
+                        if (self.buffer or unflushed) and timeout <= 0:
+                            break
+                        self.condition.wait(timeout if self.buffer or unflushed else None)
+                    data = b''.join(self.buffer)
+                    self.buffer = []
+                    self.size = 0
+                    request, closed = self.flushRequests, self.closed
+                    self.condition.notify_all()
+
+                if data:
+                    self.logFile.write(data)
+                    self.index.append(data)
+                    unflushed = True
+                if unflushed and (closed or request > self.flushed
+                                  or time.monotonic() - lastFlush >= self.FLUSH_INTERVAL):
+                    self.logFile.flush()
+                    self.index.flush()
+                    unflushed = False
+                    lastFlush = time.monotonic()
+                with self.condition:
+                    self.flushed = request
+                    self.condition.notify_all()
+                if closed:
+                    return
+        except Exception as e:
+            logger.error('Failed to write snapshot log {}: {}'.format(self.fileName, str(e)), self)
+        finally:
+            self.logFile.close()
+            self.index.close()
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+
 class SnapshotLog(object):
     """
     Read and write Snapshot log to "~/.local/share/backintime/takesnapshot_<N>.log".
@@ -112,25 +764,27 @@ class SnapshotLog(object):
             self.profile = cfg.currentProfile()
         self.logLevel = cfg.logLevel()
         self.logFileName = cfg.takeSnapshotLogFile(self.profile)
-        self.logFile = None
-
-        self.timer = tools.Alarm(self.flush, overwrite = False)
+        self.logIndexFileName = cfg.takeSnapshotLogIndexFile(self.profile)
+        self.writer = None
+        self.writerLock = threading.Lock()
+        self.logReader = None
 
     def __del__(self):
-        if self.logFile:
-            self.logFile.close()
+        self.close()
 
     def get(self, mode = None, decode = None, skipLines = 0):
         """
-        Read the log, filter and decode it and yield its lines.
+        Read the log, filter and decode it and yield its lines. The
+        :py:class:`LogReader` is kept in :py:attr:`logReader` so lines added
+        later can be fetched with :py:func:`LogReader.tail`.
 
         Args:
             mode (int):                 Mode used for filtering. Take a look at
                                         :py:class:`snapshotlog.LogFilter`
             decode (encfstools.Decode): instance used for decoding lines or ``None``
             skipLines (int):            skip ``n`` lines before yielding lines.
-                                        This is used to append only new lines
-                                        to LogView
+                                        Skipped lines are only counted in
+                                        the index and never read
 
         Yields:
             str:                        filtered and decoded log lines
@@ -138,18 +792,15 @@ class SnapshotLog(object):
         logFilter = LogFilter(mode, decode)
         count = logFilter.header.count('\n')
         try:
-            with open(self.logFileName, 'rt') as f:
-                if logFilter.header and not skipLines:
-                    yield logFilter.header
-                for line in f.readlines():
-                    line = logFilter.filter(line.rstrip('\n'))
-                    if not line is None:
-                        count += 1
-                        if count <= skipLines:
-                            continue
-                        yield line
+            self.logReader = LogReader(self.logFileName, self.logIndexFileName)
+            if logFilter.header and not skipLines:
+                yield logFilter.header
+            start = self.logReader.skip(mode, skipLines - count)
+            for line in logFilter.filterLines(self.logReader.iterLines(mode, start)):
+                if not line is None:
+                    yield line
         except Exception as e:
-            msg = ('Failed to get take_snapshot log from {}:'.format(self.logFile), str(e))
+            msg = ('Failed to get take_snapshot log from {}:'.format(self.logFileName), str(e))
             logger.debug(' '.join(msg), self)
             for line in msg:
                 yield line
@@ -166,11 +817,10 @@ class SnapshotLog(object):
             msg  = "Last snapshot didn't finish but can be continued.\n\n"
             msg += "======== continue snapshot (profile %s): %s ========\n"
         else:
-            if os.path.exists(self.logFileName):
-                if self.logFile:
-                    self.logFile.close()
-                    self.logFile = None
-                os.remove(self.logFileName)
+            self.close()
+            for fileName in (self.logFileName, self.logIndexFileName):
+                if os.path.exists(fileName):
+                    os.remove(fileName)
             msg = "========== Take snapshot (profile %s): %s ==========\n"
         self.append(msg %(self.profile, date.strftime('%c')), 1)
 
@@ -190,14 +840,26 @@ class SnapshotLog(object):
         """
         if level > self.logLevel:
             return
-        if not self.logFile:
-            self.logFile = open(self.logFileName, 'at')
-        self.logFile.write(msg + '\n')
-        self.timer.start(5)
+        writer = self.writer
+        if writer is None or writer.closed or writer.pid != os.getpid():
+            with self.writerLock:
+                writer = self.writer
+                if writer is None or writer.closed or writer.pid != os.getpid():
+                    writer = self.writer = LogWriter(self.logFileName, self.logIndexFileName)
+        writer.append((msg + '\n').encode('utf-8', 'replace'))
 
     def flush(self):
         """
         Force write log to file.
         """
-        if self.logFile:
-            self.logFile.flush()
+        if self.writer and self.writer.pid == os.getpid():
+            self.writer.flush()
+
+    def close(self):
+        """
+        Write all pending lines and close the log. It will be opened again
+        by the next :py:func:`append`.
+        """
+        if self.writer and self.writer.pid == os.getpid():
+            self.writer.close()
+        self.writer = None
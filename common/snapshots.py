@@ -18,6 +18,7 @@
 
 import json
 import os
+import math
 import stat
 import datetime
 import gettext
@@ -29,6 +30,13 @@ import shutil
 import time
 import re
 import fcntl
+import functools
+import collections
+import threading
+import concurrent.futures
+import hashlib
+import sqlite3
+from contextlib import contextmanager
 from tempfile import TemporaryDirectory
 
 import config
@@ -40,6 +48,14 @@ import mount
 import progress
 import bcolors
 import snapshotlog
+import fileinfo
+import changejournal
+import versionindex
+import checksums
+import dedup
+import retention
+import usage
+from fileinfo import FileInfoDict
 from applicationinstance import ApplicationInstance
 from exceptions import MountException, LastSnapshotSymlink
 
@@ -55,12 +71,22 @@ class Snapshots:
     """
     SNAPSHOT_VERSION = 3
     GLOBAL_FLOCK = '/tmp/backintime.lock'
+    #: max number of --link-dest options rsync supports
+    LINK_DEST_MAX = 20
+    #: max number of older snapshots searched for a missing include folder
+    LINK_DEST_SEARCH = 30
 
     def __init__(self, cfg = None):
         self.config = cfg
         if self.config is None:
             self.config = config.Config()
         self.snapshotLog = snapshotlog.SnapshotLog(self.config)
+        #new files reported by rsync, collected for deduplication
+        self.dedupFiles = None
+        #changed files reported by rsync, collected for the version index
+        self.versionChanges = None
+        #progress of the current snapshot if checkpoints are enabled
+        self.checkpoint = None
 
         self.clearIdCache()
         self.clearNameCache()
@@ -70,13 +96,21 @@ class Snapshots:
         #or:             497.84M   4% -449.39kB/s   ??:??:??
         #but filter out: 517.38K  26%   14.46MB/s    0:00:53 (xfr#53, to-chk=169/452)
         #                because this shows current run time
-        self.reRsyncProgress = re.compile(r'.*?'                            #trash at start
-                                          r'(\d*[,\.]?\d+[KkMGT]?)\s+'      #bytes sent
-                                          r'(\d*)%\s+'                      #percent done
-                                          r'(-?\d*[,\.]?\d*[KkMGT]?B/s)\s+' #speed
-                                          r'([\d\?]+:[\d\?]{2}:[\d\?]{2})'  #estimated time of arrival
-                                          r'(.*$)')                         #trash at the end
-
+        self.reRsyncProgress = re.compile(rb'.*?'                            #trash at start
+                                          rb'(\d*[,\.]?\d+[KkMGT]?)\s+'      #bytes sent
+                                          rb'(\d*)%\s+'                      #percent done
+                                          rb'(-?\d*[,\.]?\d*[KkMGT]?B/s)\s+' #speed
+                                          rb'([\d\?]+:[\d\?]{2}:[\d\?]{2})'  #estimated time of arrival
+                                          rb'(.*$)')                         #trash at the end
+
+        self.rsyncWorkerProgress = {}
+        #shared memory progress record, False if it can't be used
+        self.progressChannel = None
+        #latest coalesced takeSnapshot message which was not sent yet
+        self.pendingMessage = None
+        self.lastMessageSent = 0.0
+        self.messageStats = {}
+        self.resetMessageStats()
         self.lastBusyCheck = datetime.datetime(1,1,1)
         self.flock = None
         self.restorePermissionFailed = False
@@ -84,7 +118,8 @@ class Snapshots:
     #TODO: make own class for takeSnapshotMessage
     def clearTakeSnapshotMessage(self):
         files = (self.config.takeSnapshotMessageFile(), \
-                 self.config.takeSnapshotProgressFile())
+                 self.config.takeSnapshotProgressFile(), \
+                 self.config.takeSnapshotProgressChannel())
         for f in files:
             if os.path.exists(f):
                 os.remove(f)
@@ -126,7 +161,68 @@ class Snapshots:
         return(mid, message)
 
     #TODO: make own class for takeSnapshotMessage
-    def setTakeSnapshotMessage(self, type_id, message, timeout = -1):
+    def setTakeSnapshotMessage(self, type_id, message, timeout = -1, coalesce = False):
+        """
+        Add ``message`` to the snapshot log and send it to the GUI and all
+        plugins.
+
+        Args:
+            type_id (int):      0 for info, 1 for error
+            message (str):      message text
+            timeout (int):      timeout for plugins' notifications
+            coalesce (bool):    only keep the message in memory if the last
+                                one was sent less than
+                                1/:py:func:`config.Config.messageRate` seconds
+                                ago. It will be sent by
+                                :py:func:`flushTakeSnapshotMessage` unless a
+                                newer message replaced it. Errors are never
+                                coalesced
+        """
+        self.messageStats['messages'] += 1
+        if 1 == type_id:
+            self.snapshotLog.append('[E] ' + message, 1)
+        else:
+            self.snapshotLog.append('[I] '  + message, 3)
+
+        if coalesce and type_id != 1:
+            rate = self.config.messageRate()
+            if rate > 0 and time.monotonic() - self.lastMessageSent < 1 / rate:
+                if self.pendingMessage is not None:
+                    self.messageStats['coalesced'] += 1
+                self.pendingMessage = (type_id, message, timeout)
+                return
+        if self.pendingMessage is not None:
+            self.messageStats['coalesced'] += 1
+        self.pendingMessage = None
+        self.sendTakeSnapshotMessage(type_id, message, timeout)
+
+    def flushTakeSnapshotMessage(self, force = True):
+        """
+        Send the latest message which was coalesced by
+        :py:func:`setTakeSnapshotMessage`.
+
+        Args:
+            force (bool):   send it even if the last message was sent just now
+        """
+        if self.pendingMessage is None:
+            return
+        rate = self.config.messageRate()
+        if not force and rate > 0 and time.monotonic() - self.lastMessageSent < 1 / rate:
+            return
+        message, self.pendingMessage = self.pendingMessage, None
+        self.sendTakeSnapshotMessage(*message)
+
+    def sendTakeSnapshotMessage(self, type_id, message, timeout = -1):
+        """
+        Write ``message`` into the takeSnapshot message file and send it to
+        all plugins.
+
+        Args:
+            type_id (int):      0 for info, 1 for error
+            message (str):      message text
+            timeout (int):      timeout for plugins' notifications
+        """
+        start = time.perf_counter()
         data = str(type_id) + '\n' + message
 
         try:
@@ -137,11 +233,6 @@ class Snapshots:
                          %(self.config.takeSnapshotMessageFile(), str(e)),
                          self)
 
-        if 1 == type_id:
-            self.snapshotLog.append('[E] ' + message, 1)
-        else:
-            self.snapshotLog.append('[I] '  + message, 3)
-
         try:
             profile_id =self.config.currentProfile()
             profile_name = self.config.profileName(profile_id)
@@ -150,6 +241,69 @@ class Snapshots:
             logger.debug('Failed to send message to plugins: %s'
                          %str(e),
                          self)
+        self.lastMessageSent = time.monotonic()
+        self.messageStats['sent'] += 1
+        self.messageStats['seconds'] += time.perf_counter() - start
+
+    def resetMessageStats(self):
+        """
+        Reset counters for takeSnapshot messages: number of ``messages``
+        passed to :py:func:`setTakeSnapshotMessage`, how many of them were
+        ``sent`` and ``coalesced`` (replaced by a newer message before they
+        were sent) and ``seconds`` spent on sending them.
+        """
+        self.messageStats = {'messages': 0, 'sent': 0, 'coalesced': 0, 'seconds': 0.0}
+
+    def publishProgress(self, status, percent = 0, sent = '', speed = '', force = False):
+        """
+        Publish progress of the current snapshot or removal in
+        :py:class:`progress.ProgressChannel`. If shared memory can't be used
+        fall back to writing :py:class:`progress.ProgressFile`.
+
+        Args:
+            status (int):   :py:attr:`progress.ProgressFile.RSYNC` or
+                            :py:attr:`progress.ProgressFile.REMOVE`
+            percent (int):  progress in percent
+            sent (str):     sent bytes as reported by rsync
+            speed (str):    transfer speed as reported by rsync
+            force (bool):   don't drop this update even if the last one was
+                            just now
+        """
+        if self.progressChannel is None:
+            self.progressChannel = progress.ProgressChannel(self.config)
+        if self.progressChannel:
+            try:
+                self.progressChannel.publish(status, percent, sent, speed, force)
+                return
+            except OSError as e:
+                logger.warning('Failed to publish progress in {}. Use {} instead: {}'.format(
+                               self.progressChannel.filename,
+                               self.config.takeSnapshotProgressFile(), str(e)), self)
+                self.progressChannel = False
+        pg = progress.ProgressFile(self.config)
+        pg.setIntValue('status', status)
+        pg.setIntValue('percent', percent)
+        if sent:
+            pg.setStrValue('sent', sent)
+        if speed:
+            pg.setStrValue('speed', speed)
+        pg.save()
+
+    def clearProgress(self):
+        """
+        Remove progress published with :py:func:`publishProgress`.
+        """
+        if self.progressChannel:
+            self.progressChannel.close()
+        self.progressChannel = None
+        try:
+            os.remove(self.config.takeSnapshotProgressFile())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug('Failed to remove snapshot progress file %s: %s'
+                         %(self.config.takeSnapshotProgressFile(), str(e)),
+                         self)
 
     def busy(self):
         instance = ApplicationInstance(self.config.takeSnapshotInstanceFile(), False)
@@ -343,54 +497,171 @@ class Snapshots:
         if key_path not in fileInfoDict or not os.path.exists(path):
             return
         info = fileInfoDict[key_path]
+        ids = (self.uid(info[1], callback), self.gid(info[2], callback))
+        for ok, msg in self.setPermission(path, info, ids, os.stat(path)):
+            self.restoreCallback(callback, ok, msg)
 
-        #restore uid/gid
-        uid = self.uid(info[1], callback)
-        gid = self.gid(info[2], callback)
+    def setPermission(self, path, info, ids, st, dir_fd = None, name = None):
+        """
+        Change owner, group and mode of ``path`` to ``info`` like
+        :py:func:`restorePermission` but without looking up anything.
 
-        #current file stats
-        st = os.stat(path)
+        Args:
+            path (bytes):           full path of the file
+            info (tuple):           (mode, user, group) from
+                                    :py:class:`FileInfoDict`
+            ids (tuple):            (uid, gid) for ``info``
+            st (os.stat_result):    current stat of ``path``
+            dir_fd (int):           file descriptor of the parent folder.
+                                    If given all syscalls use ``name``
+                                    relative to ``dir_fd``
+            name (bytes):           name of the file in ``dir_fd``
 
-        # logger.debug('%(path)s: uid %(target_uid)s/%(cur_uid)s, gid %(target_gid)s/%(cur_gid)s, mod %(target_mod)s/%(cur_mod)s'
-        #              %{'path': path.decode(),
-        #                'target_uid': uid,
-        #                'cur_uid': st.st_uid,
-        #                'target_gid': gid,
-        #                'cur_gid': st.st_gid,
-        #                'target_mod': info[0],
-        #                'cur_mod': st.st_mode
-        #                })
+        Returns:
+            list:                   messages as tuples (ok, msg) for
+                                    :py:func:`restoreCallback`
+        """
+        target = path if dir_fd is None else name
+        uid, gid = ids
+        messages = []
 
         if uid != -1 or gid != -1:
             ok = False
             if uid != st.st_uid:
                 try:
-                    os.chown(path, uid, gid)
+                    os.chown(target, uid, gid, dir_fd = dir_fd)
                     ok = True
                 except:
                     pass
-                self.restoreCallback(callback, ok, "chown %s %s : %s" % (path.decode(errors = 'ignore'), uid, gid))
-                st = os.stat(path)
+                messages.append((ok, "chown %s %s : %s" % (path.decode(errors = 'ignore'), uid, gid)))
+                st = os.stat(target, dir_fd = dir_fd)
 
             #if restore uid/gid failed try to restore at least gid
             if not ok and gid != st.st_gid:
                 try:
-                    os.chown(path, -1, gid)
+                    os.chown(target, -1, gid, dir_fd = dir_fd)
                     ok = True
                 except:
                     pass
-                self.restoreCallback(callback, ok, "chgrp %s %s" % (path.decode(errors = 'ignore'), gid))
-                st = os.stat(path)
+                messages.append((ok, "chgrp %s %s" % (path.decode(errors = 'ignore'), gid)))
+                st = os.stat(target, dir_fd = dir_fd)
 
         #restore perms
         ok = False
         if info[0] != st.st_mode:
             try:
-                os.chmod(path, info[0])
+                os.chmod(target, info[0], dir_fd = dir_fd)
                 ok = True
             except:
                 pass
-            self.restoreCallback(callback, ok, "chmod %s %04o" % (path.decode(errors = 'ignore'), info[0]))
+            messages.append((ok, "chmod %s %04o" % (path.decode(errors = 'ignore'), info[0])))
+        return messages
+
+    def restorePermissions(self, restored_paths, restore_to, fileInfoDict, callback = None):
+        """
+        Restore permissions of all restored files and folders. Restored
+        folders are walked on file descriptors (``openat``, ``fstatat``) like
+        :py:func:`tools.removeTree` so all syscalls for their content are
+        relative to the folder. Folders are changed after their content,
+        deepest first, followed by the parents of the restored paths.
+
+        Args:
+            restored_paths (list):          tuples (path, src_delta) with
+                                            the original path and the number
+                                            of leading characters which are
+                                            replaced by ``restore_to``
+            restore_to (str):               full path the files were
+                                            restored to or empty if they were
+                                            restored to their original location
+            fileInfoDict (FileInfoDict):    permissions of the restored paths
+            callback (method):              callable instance which will
+                                            handle messages
+        """
+        restore_to = os.fsencode(restore_to)
+        ids = {}
+        for mode, user, group in fileInfoDict.values():
+            if (user, group) not in ids:
+                ids[(user, group)] = (self.uid(user, callback), self.gid(group, callback))
+
+        # ordered sets of {original path: current path}
+        folders = collections.OrderedDict()
+        roots = collections.OrderedDict()
+        for path, src_delta in restored_paths:
+            path = os.fsencode(path)
+            if not restore_to:
+                curr_path = b'/'
+                for path_item in path.strip(b'/').split(b'/'):
+                    curr_path = os.path.join(curr_path, path_item)
+                    folders[curr_path] = curr_path
+            else:
+                folders[path] = restore_to + path[src_delta:]
+            real_path = restore_to + path[src_delta:]
+            if os.path.isdir(real_path) and not os.path.islink(real_path):
+                roots[path] = real_path
+
+        flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+        def walk(key, real):
+            try:
+                fd = os.open(real, flags)
+            except OSError as e:
+                logger.debug('Failed to open {}: {}'.format(real, str(e)), self)
+                return
+            try:
+                # list of tuples (folder fd, iterator over names, key, full path)
+                stack = [(fd, iter(os.listdir(fd)), key, real)]
+            except OSError as e:
+                logger.debug('Failed to list {}: {}'.format(real, str(e)), self)
+                os.close(fd)
+                return
+            try:
+                while stack:
+                    fd, names, key, real = stack[-1]
+                    for name in names:
+                        name = os.fsencode(name)
+                        item_key = os.path.join(key, name)
+                        info = fileInfoDict.get(item_key)
+                        if info is None:
+                            # not part of the snapshot
+                            continue
+                        item_real = os.path.join(real, name)
+                        try:
+                            st = os.stat(name, dir_fd = fd, follow_symlinks = False)
+                        except OSError:
+                            continue
+                        if stat.S_ISDIR(st.st_mode):
+                            folders[item_key] = item_real
+                            try:
+                                sub = os.open(name, flags, dir_fd = fd)
+                            except OSError as e:
+                                logger.debug('Failed to open {}: {}'.format(item_real, str(e)), self)
+                                continue
+                            try:
+                                stack.append((sub, iter(os.listdir(sub)), item_key, item_real))
+                            except OSError as e:
+                                logger.debug('Failed to list {}: {}'.format(item_real, str(e)), self)
+                                os.close(sub)
+                                continue
+                            break
+                        if stat.S_ISLNK(st.st_mode):
+                            try:
+                                st = os.stat(name, dir_fd = fd)
+                            except OSError:
+                                # broken symlink
+                                continue
+                        for ok, msg in self.setPermission(item_real, info, ids[info[1:]], st,
+                                                          dir_fd = fd, name = name):
+                            self.restoreCallback(callback, ok, msg)
+                    else:
+                        os.close(stack.pop()[0])
+            finally:
+                for item in stack:
+                    os.close(item[0])
+
+        for key, real in roots.items():
+            walk(key, real)
+
+        for key in sorted(folders, key = lambda i: i.count(b'/'), reverse = True):
+            self.restorePermission(key, folders[key], fileInfoDict, callback)
 
     def restore(self,
                 sid,
@@ -403,16 +674,17 @@ class Snapshots:
         """
         Restore one or more files from snapshot ``sid`` to either original
         or a different destination. Restore is done with rsync. If available
-        permissions will be restored from ``fileinfo.bz2``.
+        permissions will be restored from ``fileinfo.db``.
 
         Args:
             sid (SID):                  snapshot from whom to restore
             paths (:py:class:`list`, :py:class:`tuple` or :py:class:`str`):
                                         single path (str) or multiple
                                         paths (list, tuple) that should be
-                                        restored. For every path this will run
-                                        a new rsync process. Permissions will be
-                                        restored for all paths in one run
+                                        restored. Paths are restored in groups
+                                        by :py:func:`restoreGroups`.
+                                        Permissions will be restored for all
+                                        paths in one run
             callback (method):          callable instance which will handle
                                         messages
             restore_to (str):           full path to restore to. If empty
@@ -457,49 +729,38 @@ class Snapshots:
             cmd_prefix.append('--update')
 
         restored_paths = []
+        src_base = sid.pathBackup(use_mode = ['ssh'])
+        if not src_base.endswith(os.sep):
+            src_base += os.sep
+        groups = collections.OrderedDict()
         for path in paths:
             tools.makeDirs(os.path.dirname(path))
-            src_path = path
+            base = src_base
+            name = path.lstrip(os.sep) or os.curdir
             src_delta = 0
-            src_base = sid.pathBackup(use_mode = ['ssh'])
-            if not src_base.endswith(os.sep):
-                src_base += os.sep
-            cmd = cmd_prefix[:]
             if restore_to:
-                items = os.path.split(src_path)
+                items = os.path.split(path)
                 aux = items[0].lstrip(os.sep)
                 #bugfix: restore system root ended in <src_base>//.<src_path>
                 if aux:
-                    src_base = os.path.join(src_base, aux) + '/'
-                src_path = '/' + items[1]
+                    base = os.path.join(src_base, aux) + '/'
+                name = items[1]
                 if items[0] == '/':
                     src_delta = 0
                 else:
                     src_delta = len(items[0])
-
-            cmd.append(self.rsyncRemotePath('%s.%s' %(src_base, src_path), use_mode = ['ssh']))
-            cmd.append('%s/' %restore_to)
-            proc = tools.Execute(cmd,
-                                 callback = callback,
-                                 filters = (self.filterRsyncProgress,),
-                                 parent = self)
-            self.restoreCallback(callback, True, proc.printable_cmd)
-            proc.run()
-            self.restoreCallback(callback, True, ' ')
+            groups.setdefault(base, []).append(name)
             restored_paths.append((path, src_delta))
-        try:
-            os.remove(self.config.takeSnapshotProgressFile())
-        except Exception as e:
-            logger.debug('Failed to remove snapshot progress file %s: %s'
-                         %(self.config.takeSnapshotProgressFile(), str(e)),
-                         self)
+
+        self.restoreGroups(groups, cmd_prefix, restore_to, callback)
+        self.clearProgress()
 
         #restore permissions
         logger.info('Restore permissions', self)
         self.restoreCallback(callback, True, ' ')
         self.restoreCallback(callback, True, _("Restore permissions:"))
         self.restorePermissionFailed = False
-        fileInfoDict = sid.fileInfo
+        fileInfoDict = sid.fileInfoFor(paths)
 
         #cache uids/gids
         for uid, name in info.listValue('user', ('int:uid', 'str:name')):
@@ -508,45 +769,7 @@ class Snapshots:
             self.gid(name.encode(), callback = callback, backup = gid)
 
         if fileInfoDict:
-            all_dirs = [] #restore dir permissions after all files are done
-            for path, src_delta in restored_paths:
-                #explore items
-                snapshot_path_to = sid.pathBackup(path).rstrip('/')
-                root_snapshot_path_to = sid.pathBackup().rstrip('/')
-                #use bytes instead of string from here
-                if isinstance(path, str):
-                    path = path.encode()
-                if isinstance(restore_to, str):
-                    restore_to = restore_to.encode()
-
-                if not restore_to:
-                    path_items = path.strip(b'/').split(b'/')
-                    curr_path = b'/'
-                    for path_item in path_items:
-                        curr_path = os.path.join(curr_path, path_item)
-                        if curr_path not in all_dirs:
-                            all_dirs.append(curr_path)
-                else:
-                    if path not in all_dirs:
-                        all_dirs.append(path)
-
-                if os.path.isdir(snapshot_path_to) and not os.path.islink(snapshot_path_to):
-                    head = len(root_snapshot_path_to.encode())
-                    for explore_path, dirs, files in os.walk(snapshot_path_to.encode()):
-                        for item in dirs:
-                            item_path = os.path.join(explore_path, item)[head:]
-                            if item_path not in all_dirs:
-                                all_dirs.append(item_path)
-
-                        for item in files:
-                            item_path = os.path.join(explore_path, item)[head:]
-                            real_path = restore_to + item_path[src_delta:]
-                            self.restorePermission(item_path, real_path, fileInfoDict, callback)
-
-            all_dirs.reverse()
-            for item_path in all_dirs:
-                real_path = restore_to + item_path[src_delta:]
-                self.restorePermission(item_path, real_path, fileInfoDict, callback)
+            self.restorePermissions(restored_paths, restore_to, fileInfoDict, callback)
 
             self.restoreCallback(callback, True, '')
             if self.restorePermissionFailed:
@@ -557,6 +780,65 @@ class Snapshots:
 
         instance.exitApplication()
 
+    def restoreGroups(self, groups, cmd_prefix, restore_to, callback = None):
+        """
+        Restore all files and folders with one rsync process for each source
+        folder using ``--files-from``. All paths restored to their original
+        location share the same source folder and are restored by a single
+        rsync. With ``restore_to`` every parent folder of the restored paths
+        is a separate group. Up to :py:func:`config.Config.restoreWorkers`
+        groups are restored in parallel if their names don't collide in
+        ``restore_to``.
+
+        Args:
+            groups (dict):          {source folder: [names relative to the
+                                    source folder]}
+            cmd_prefix (list):      rsync command and options
+            restore_to (str):       full path to restore to. If empty restore
+                                    to original destination
+            callback (method):      callable instance which will handle
+                                    messages
+        """
+        workers = min(self.config.restoreWorkers(), len(groups))
+        if workers > 1:
+            names = [name for group in groups.values() for name in group]
+            if len(names) != len(set(names)):
+                workers = 1
+
+        self.rsyncWorkerProgress = {}
+        procs = []
+        with TemporaryDirectory() as d:
+            for index, (base, names) in enumerate(groups.items()):
+                filesFrom = os.path.join(d, str(index))
+                with open(filesFrom, 'wb') as f:
+                    for name in names:
+                        f.write(os.fsencode(name) + b'\0')
+                cmd = cmd_prefix + ['--from0', '--files-from=' + filesFrom]
+                cmd.append(self.rsyncRemotePath(base, use_mode = ['ssh']))
+                cmd.append('%s/' %restore_to)
+                if workers > 1:
+                    filters = (functools.partial(self.filterRsyncProgress, worker = index),)
+                else:
+                    filters = (self.filterRsyncProgress,)
+                procs.append(tools.Execute(cmd,
+                                           callback = callback,
+                                           filters = filters,
+                                           parent = self))
+
+            if workers > 1:
+                logger.info('Restore {} groups with {} rsync processes in parallel'
+                            .format(len(procs), workers), self)
+                for proc in procs:
+                    self.restoreCallback(callback, True, proc.printable_cmd)
+                for i in range(0, len(procs), workers):
+                    tools.ExecuteParallel(procs[i:i + workers], parent = self).run()
+                self.restoreCallback(callback, True, ' ')
+                return
+            for proc in procs:
+                self.restoreCallback(callback, True, proc.printable_cmd)
+                proc.run()
+                self.restoreCallback(callback, True, ' ')
+
     def backupSuffix(self):
         """
         Get suffix for backup files.
@@ -575,12 +857,86 @@ class Snapshots:
         """
         if isinstance(sid, RootSnapshot):
             return
-        rsync = tools.rsyncRemove(self.config)
-        with TemporaryDirectory() as d:
-            rsync.append(d + os.sep)
-            rsync.append(self.rsyncRemotePath(sid.path(use_mode = ['ssh', 'ssh_encfs'])))
-            tools.Execute(rsync).run()
-            shutil.rmtree(sid.path())
+        with SnapshotCatalog(self.config).modify() as entries:
+            if self.config.snapshotsMode() in ('local', 'local_encfs'):
+                tools.removeTree(sid.path())
+            else:
+                rsync = tools.rsyncRemove(self.config)
+                with TemporaryDirectory() as d:
+                    rsync.append(d + os.sep)
+                    rsync.append(self.rsyncRemotePath(sid.path(use_mode = ['ssh', 'ssh_encfs'])))
+                    tools.Execute(rsync).run()
+                shutil.rmtree(sid.path())
+            if entries is not None:
+                entries.pop(sid.sid, None)
+
+    def removeSnapshots(self, sids, log = None, title = None):
+        """
+        Remove multiple snapshots. In local modes up to
+        :py:func:`config.Config.removeWorkers` snapshots are removed at the
+        same time by a pool of threads using :py:func:`tools.removeTree`.
+        Progress of all threads is reported from the calling thread through
+        ``log`` and the progress file.
+
+        Args:
+            sids (list):    list of :py:class:`SID` that should be removed
+            log (method):   callable method that will handle progress log
+            title (str):    prefix for progress messages
+
+        Returns:
+            list:           list of :py:class:`SID` which were removed
+        """
+        sids = [sid for sid in sids if not isinstance(sid, RootSnapshot)]
+        if not sids:
+            return []
+        if not log:
+            log = lambda x: self.setTakeSnapshotMessage(0, x)
+        if title is None:
+            title = _('Removing snapshots')
+
+        workers = min(self.config.removeWorkers(), len(sids))
+        if self.config.snapshotsMode() not in ('local', 'local_encfs') or workers <= 1:
+            for i, sid in enumerate(sids, 1):
+                log(title + ' %s/%s' %(i, len(sids)))
+                self.remove(sid)
+            return sids
+
+        removed = []
+        counter = [0]
+        lock = threading.Lock()
+        def count(n):
+            with lock:
+                counter[0] += n
+
+        logger.info('Remove {} snapshots with {} threads'.format(len(sids), workers), self)
+        try:
+            with SnapshotCatalog(self.config).modify() as entries, \
+                 concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool:
+                futures = {pool.submit(tools.removeTree, sid.path(), count): sid for sid in sids}
+                pending = set(futures)
+                finished = -1
+                while pending:
+                    done, pending = concurrent.futures.wait(pending, timeout = 1)
+                    for future in done:
+                        sid = futures[future]
+                        try:
+                            future.result()
+                        except OSError as e:
+                            logger.error('Failed to remove snapshot {}: {}'.format(sid, str(e)), self)
+                            continue
+                        removed.append(sid)
+                        if entries is not None:
+                            entries.pop(sid.sid, None)
+                    if finished != len(sids) - len(pending):
+                        finished = len(sids) - len(pending)
+                        log(title + ' %s/%s' %(finished, len(sids)))
+                    self.publishProgress(progress.ProgressFile.REMOVE,
+                                         100 * finished // len(sids))
+            logger.info('Removed {} snapshots with {} files and folders'.format(
+                        len(removed), counter[0]), self)
+        finally:
+            self.clearProgress()
+        return removed
 
     def backup(self, force = False):
         """
@@ -711,6 +1067,9 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
                         if not ret_error:
                             self.freeSpace(now)
+                            if self.config.snapshotUsage():
+                                self.setTakeSnapshotMessage(0, _('Updating snapshot sizes'))
+                                self.updateUsage()
                             self.setTakeSnapshotMessage(0, _('Finalizing'))
 
                     time.sleep(2)
@@ -734,6 +1093,8 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 except MountException as ex:
                     logger.error(str(ex), self)
 
+                #write all pending log lines before others can take over
+                self.snapshotLog.close()
                 instance.exitApplication()
                 self.flockRelease()
                 logger.info('Unlock', self)
@@ -747,35 +1108,78 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         return ret_error
 
-    def filterRsyncProgress(self, line):
+    @tools.batchFilter
+    def filterRsyncProgress(self, lines, worker = None):
         """
-        Filter rsync's stdout for progress informations and store them in
-        '~/.local/share/backintime/worker<N>.progress' file.
+        Filter rsync's stdout for progress informations and publish the
+        latest one with :py:func:`publishProgress`. This works on raw output
+        (see :py:func:`tools.batchFilter`) so progress lines are dropped
+        before they get decoded.
 
         Args:
-            line (str): stdout line from rsync
+            lines (list):   stdout lines from rsync as :py:class:`bytes`
+            worker (int):   number of the rsync process if multiple rsync run
+                            in parallel. Progress of all of them will be
+                            merged with :py:func:`Snapshots.mergeRsyncProgress`
 
         Returns:
-            str:        ``line`` if it had no progress infos. ``None`` if
-                        ``line`` was a progress
+            list:           ``lines`` without progress infos
         """
         ret = []
-        for l in line.split('\n'):
-            m = self.reRsyncProgress.match(l)
+        last = None
+        for line in lines:
+            m = self.reRsyncProgress.match(line)
             if m:
-                # if m.group(5).strip():
-                #     return
-                pg = progress.ProgressFile(self.config)
-                pg.setIntValue('status', pg.RSYNC)
-                pg.setStrValue('sent', m.group(1))
-                pg.setIntValue('percent', int(m.group(2)))
-                pg.setStrValue('speed', m.group(3))
-                #pg.setStrValue('eta', m.group(4))
-                pg.save()
-                del(pg)
+                last = m
             else:
-                ret.append(l)
-        return '\n'.join(ret)
+                ret.append(line)
+        if last:
+            sent, percent, speed = last.group(1).decode(), int(last.group(2)), last.group(3).decode()
+            if worker is not None:
+                self.rsyncWorkerProgress[worker] = (sent, percent, speed)
+                sent, percent, speed = self.mergeRsyncProgress(self.rsyncWorkerProgress.values())
+            self.publishProgress(progress.ProgressFile.RSYNC, percent, sent, speed)
+            # rsync is busy with a big file, don't keep showing an old one
+            self.flushTakeSnapshotMessage(force = False)
+        return ret
+
+    def mergeRsyncProgress(self, progress):
+        """
+        Merge progress of multiple rsync processes. Sent bytes and speed will
+        be summed up, percent is the average of all processes.
+
+        Args:
+            progress (list):    list of tuple (sent, percent, speed) as
+                                reported by rsync
+
+        Returns:
+            tuple:              merged (sent, percent, speed)
+        """
+        units = ('', 'K', 'M', 'G', 'T')
+        def toBytes(value):
+            value = value.replace('B/s', '').replace(',', '.')
+            exponent = 0
+            if value and value[-1].upper() in units[1:]:
+                exponent = units.index(value[-1].upper())
+                value = value[:-1]
+            try:
+                return float(value) * 1024 ** exponent
+            except ValueError:
+                return 0.0
+        def fromBytes(value):
+            exponent = 0
+            while value >= 1024 and exponent < len(units) - 1:
+                value /= 1024
+                exponent += 1
+            return '%.2f%s' %(value, units[exponent])
+
+        progress = list(progress)
+        if not progress:
+            return ('0.00', 0, '0.00B/s')
+        sent = sum(toBytes(i[0]) for i in progress)
+        percent = sum(i[1] for i in progress) // len(progress)
+        speed = sum(toBytes(i[2]) for i in progress)
+        return (fromBytes(sent), percent, fromBytes(speed) + 'B/s')
 
     def rsyncCallback(self, line, params):
         """
@@ -789,12 +1193,18 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                             on changing list items will change original
                             list, too. If rsync reported an error ``params[0]``
                             will be set to ``True``. If rsync reported a changed
-                            file ``params[1]`` will be set to ``True``
+                            file ``params[1]`` will be set to ``True``.
+                            An optional third item (dict) will collect
+                            permissions of all itemized files, see
+                            :py:func:`Snapshots.collectItemizedPermission`
         """
         if not line:
             return
 
-        self.setTakeSnapshotMessage(0, _('Take snapshot') + " (rsync: %s)" % line)
+        if len(params) > 2 and line.startswith('BACKINTIME: '):
+            line = self.collectItemizedPermission(params[2], line)
+
+        self.setTakeSnapshotMessage(0, _('Take snapshot') + " (rsync: %s)" % line, coalesce = True)
 
         if line.endswith(')'):
             if line.startswith('rsync:'):
@@ -805,8 +1215,61 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         if len(line) >= 13:
             if line.startswith('BACKINTIME: '):
                 if line[12] != '.' and line[12:14] != 'cd':
+                    if self.checkpoint is not None and not self.checkpoint.changes:
+                        self.checkpoint.setChanges()
                     params[1] = True
                     self.snapshotLog.append('[C] ' + line[12:], 2)
+                    if self.dedupFiles is not None and line[12:24] == '>f+++++++++ ':
+                        self.dedupFiles.append(line[24:])
+                    # new, different size, mtime or checksum
+                    if self.versionChanges is not None and line[13] != 'd' \
+                       and line[14:17].strip('.'):
+                        name = line[24:]
+                        if line[13] == 'L':
+                            name = name.split(' -> ', 1)[0]
+                        self.versionChanges.append(name)
+
+    def collectItemizedPermission(self, itemized, line):
+        """
+        Parse permissions from a line of rsyncs output created with
+        ``--out-format='BACKINTIME: %i %B %U %G %n%L'``, store them in
+        ``itemized`` and return the line without permissions so it looks like
+        the default ``--out-format='BACKINTIME: %i %n%L'``.
+
+        Args:
+            itemized (dict):    dict of: {name: (type, bits, uid, gid)} where
+                                ``name`` is the path relative to the rsync
+                                source as :py:class:`bytes` and ``type`` the
+                                second character of rsyncs itemize string.
+                                Using sideeffect on changing dict item will
+                                change original dict, too.
+            line (str):         stdout line from rsync
+
+        Returns:
+            str:                ``line`` without permissions
+        """
+        try:
+            prefix, item, bits, uid, gid, name = line.split(' ', 5)
+            uid, gid = int(uid), int(gid)
+        except ValueError:
+            return line
+        if item.startswith('*'):
+            return line
+        # %L adds ' -> target' for symlinks and ' => target' for hardlinks.
+        # Other names can contain these too
+        path = name
+        if item[1] == 'L':
+            sep = ' -> '
+        elif item[0] == 'h':
+            sep = ' => '
+        else:
+            sep = None
+        if sep:
+            index = path.find(sep)
+            if index > 0:
+                path = path[:index]
+        itemized[path.encode()] = (item[1], bits, uid, gid)
+        return ' '.join((prefix, item, name))
 
     def makeDirs(self, path):
         """
@@ -850,12 +1313,18 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 cmd.append(self.rsyncRemotePath(self.config.sshSnapshotsPath()))
                 tools.Execute(cmd, parent = self).run()
 
-    def backupInfo(self, sid):
+    def backupInfo(self, sid, filterDigest = None, checksumSlice = None):
         """
         Save infos about the snapshot into the 'info' file.
 
         Args:
-            sid (SID):  snapshot that should get an info file
+            sid (SID):              snapshot that should get an info file
+            filterDigest (str):     digest of rsync options used for this
+                                    snapshot, see
+                                    :py:func:`Snapshots.rsyncFilterDigest`
+            checksumSlice (tuple):  ``(index, slices)`` of the slice which
+                                    was verified by checksum, see
+                                    :py:class:`checksums.RollingChecksum`
         """
         logger.info("Create info file", self)
         machine = self.config.host()
@@ -871,15 +1340,30 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         i.setListValue('user', ('int:uid', 'str:name'), list(self.userCache.items()))
         i.setListValue('group', ('int:gid', 'str:name'), list(self.groupCache.items()))
         i.setStrValue('filesystem_mounts', json.dumps(tools.filesystemMountInfo()))
+        if filterDigest:
+            i.setStrValue('filter_digest', filterDigest)
+        if checksumSlice:
+            i.setIntValue('checksum_slice', checksumSlice[0])
+            i.setIntValue('checksum_slices', checksumSlice[1])
         sid.info = i
 
-    def backupPermissions(self, sid):
+    def backupPermissions(self, sid, itemized = None, prev_sid = None, filterDigest = None):
         """
         Save permissions (owner, group, read-, write- and executable)
         for all files in Snapshot ``sid`` into snapshots fileInfoDict.
 
+        If ``itemized`` permissions from the main rsync process are given,
+        they will be merged with unchanged permissions from ``prev_sid``.
+        This is only possible if ``prev_sid`` was taken with the same rsync
+        options (``filterDigest``). Otherwise all files in ``sid`` will be
+        listed with a second rsync process and collected again.
+
         Args:
-            sid (SID):  snapshot that should be scanned
+            sid (SID):              snapshot that should be scanned
+            itemized (dict):        permissions collected by
+                                    :py:func:`Snapshots.collectItemizedPermission`
+            prev_sid (SID):         previous snapshot
+            filterDigest (str):     digest of rsync options used for ``sid``
         """
         logger.info('Save permissions', self)
         self.setTakeSnapshotMessage(0, _('Saving permissions...'))
@@ -890,6 +1374,16 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         else:
             decode = encfstools.Bounce()
 
+        if itemized is not None:
+            if prev_sid and filterDigest and \
+               prev_sid.info.strValue('filter_digest') == filterDigest:
+                sid.fileInfo = self.mergePermissions(itemized,
+                                                     prev_sid.fileInfo,
+                                                     decode)
+                return
+            logger.info('Previous snapshot was taken with different options. '
+                        'Collect all permissions again.', self)
+
         # backup permissions of /
         # bugfix for https://github.com/bit-team/backintime/issues/708
         self.backupPermissionsCallback(b'/', (fileInfoDict, decode))
@@ -897,18 +1391,95 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         rsync = ['rsync', '--dry-run', '-r', '--out-format=%n']
         rsync.extend(tools.rsyncSshArgs(self.config))
         rsync.append(self.rsyncRemotePath(sid.pathBackup(use_mode = ['ssh', 'ssh_encfs'])) + os.sep)
+        names = []
         with TemporaryDirectory() as d:
             rsync.append(d + os.sep)
             proc = tools.Execute(rsync,
-                                 callback = self.backupPermissionsCallback,
-                                 user_data = (fileInfoDict, decode),
+                                 callback = lambda line, names: names.append(line),
+                                 user_data = names,
                                  parent = self,
                                  conv_str = False,
                                  join_stderr = False)
             proc.run()
 
+        # decode all paths at once
+        for path in decode.paths(names):
+            self.collectPermission(fileInfoDict, b'/' + path.rstrip(b'/'))
+
         sid.fileInfo = fileInfoDict
 
+    def mergePermissions(self, itemized, previous, decode):
+        """
+        Merge permissions reported by the main rsync process with those from
+        the previous snapshot. As the new snapshot starts empty rsync will
+        report every folder. Files are only reported if they are new or have
+        changed. All others are taken from ``previous`` if they still exist
+        in their folder.
+
+        Args:
+            itemized (dict):            permissions collected by
+                                        :py:func:`Snapshots.collectItemizedPermission`
+            previous (FileInfoDict):    permissions of the previous snapshot
+            decode (encfstools.Decode): decode paths in ssh_encfs mode
+
+        Returns:
+            FileInfoDict:               dict of: {path: (permission, user, group)}
+        """
+        fileInfoDict = FileInfoDict()
+        # backup permissions of /
+        # bugfix for https://github.com/bit-team/backintime/issues/708
+        self.collectPermission(fileInfoDict, b'/')
+
+        folders = set((b'/',))
+        names = list(itemized)
+        for name, decoded in zip(names, decode.paths(names)):
+            itemType, bits, uid, gid = itemized[name]
+            path = os.path.normpath(b'/' + decoded)
+            mode = fileinfo.modeFromRsync(itemType, bits)
+            if mode is None:
+                # links, devices and specials
+                self.collectPermission(fileInfoDict, path)
+                continue
+            fileInfoDict[path] = (mode,
+                                  self.userName(uid).encode('utf-8', 'replace'),
+                                  self.groupName(gid).encode('utf-8', 'replace'))
+            if itemType == 'd':
+                folders.add(path)
+
+        listdir = {}
+        carried = 0
+        for path, info in previous.items():
+            if path in fileInfoDict:
+                continue
+            folder = os.path.dirname(path)
+            if folder not in folders:
+                continue
+            if folder not in listdir:
+                try:
+                    listdir[folder] = set(os.listdir(folder))
+                except OSError:
+                    listdir[folder] = set()
+            if os.path.basename(path) in listdir[folder]:
+                fileInfoDict[path] = info
+                carried += 1
+        logger.debug('Took permissions of {} items from rsync and {} from '
+                     'previous snapshot'.format(len(itemized), carried),
+                     self)
+        return fileInfoDict
+
+    def rsyncFilterDigest(self, cmd):
+        """
+        Create a digest of the rsync options which decide about the content of
+        a snapshot.
+
+        Args:
+            cmd (list): rsync prefix and suffix without --link-dest
+
+        Returns:
+            str:        hex digest
+        """
+        return hashlib.md5('\0'.join(cmd).encode('utf-8', 'replace')).hexdigest()
+
     def backupPermissionsCallback(self, line, user_data):
         """
         Rsync callback for :py:func:`Snapshots.backupPermissions`.
@@ -944,7 +1515,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
     def takeSnapshot(self, sid, now, include_folders):
         """
         This is the main backup routine. It will take a new snapshot and store
-        permissions of included files and folders into ``fileinfo.bz2``.
+        permissions of included files and folders into ``fileinfo.db``.
 
         Args:
             sid (SID):                  snapshot ID which the new snapshot
@@ -964,6 +1535,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                                         ``ret_error`` is ``True`` if there was
                                         an error during taking the snapshot
         """
+        self.resetMessageStats()
         self.setTakeSnapshotMessage(0, _('...'))
 
         new_snapshot = NewSnapshot(self.config)
@@ -981,8 +1553,6 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                     os.chmod(file, mode | stat.S_IWUSR)
                 except PermissionError:
                     pass
-            # search previous log for changes and set params
-            params[1] = new_snapshot.hasChanges
         elif new_snapshot.exists() and not new_snapshot.saveToContinue:
             logger.info("Remove leftover '%s' folder from last run" %new_snapshot.displayID)
             self.setTakeSnapshotMessage(0, _("Removing leftover '%s' folder from last run") %new_snapshot.displayID)
@@ -994,9 +1564,6 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 time.sleep(2) #max 1 backup / second
                 return [False, True]
 
-        if not new_snapshot.saveToContinue and not new_snapshot.makeDirs():
-            return [False, True]
-
         prev_sid = None
         snapshots = listSnapshots(self.config)
         if snapshots:
@@ -1007,16 +1574,102 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         if self.config.excludeBySizeEnabled():
             rsync_prefix.append('--max-size=%sM' %self.config.excludeBySize())
         rsync_suffix = self.rsyncSuffix(include_folders)
+        filterDigest = self.rsyncFilterDigest(rsync_prefix + rsync_suffix)
+
+        continued = new_snapshot.saveToContinue
+        checkpoint = None
+        loaded = False
+        if self.config.checkpoint():
+            checkpoint = Checkpoint(new_snapshot, filterDigest)
+            loaded = continued and checkpoint.load()
+            if not loaded:
+                checkpoint.done.clear()
+                checkpoint.changes = False
+        if continued:
+            if loaded:
+                params[1] = checkpoint.changes
+            else:
+                # search previous log for changes and set params
+                params[1] = new_snapshot.hasChanges
+
+        #check for changes without rsync
+        journal = None
+        if self.config.changeJournal() and not new_snapshot.saveToContinue \
+           and not self.config.copyLinks() and not self.config.copyUnsafeLinks():
+            self.setTakeSnapshotMessage(0, _('Scanning for changes'))
+            journal = changejournal.ChangeJournal(self.config)
+            digests = journal.scan(include_folders)
+            if prev_sid and not self.config.takeSnapshotRegardlessOfChanges() \
+               and journal.unchanged(prev_sid, filterDigest, digests):
+                logger.info("Nothing changed, no new snapshot necessary", self)
+                self.snapshotLog.append('[I] ' + _('Nothing changed, no new snapshot necessary'), 3)
+                prev_sid.setLastChecked()
+                if not list(self.config.anacrontabFiles()):
+                    tools.writeTimeStamp(self.config.anacronSpoolFile())
+                return [False, False]
+            journal.clear()
+
+        link_dest = self.linkDestCandidates(snapshots, include_folders)
+
+        #only check suspect files with --checksum
+        suspects = None
+        useChecksum = '--checksum' in rsync_prefix
+        if useChecksum and link_dest and self.config.checksumStore() \
+           and self.config.snapshotsMode() in ('local', 'local_encfs'):
+            self.setTakeSnapshotMessage(0, _('Comparing checksums'))
+            try:
+                suspects = checksums.ChecksumStore(self.config).suspects(include_folders, link_dest)
+            except (OSError, sqlite3.Error) as e:
+                logger.error('Failed to compare checksums. Use --checksum for '
+                             'all files: {}'.format(str(e)), self)
+            else:
+                rsync_prefix.remove('--checksum')
+                self.snapshotLog.append('[I] ' + _('%d files need to be compared by checksum')
+                                        % len(suspects), 3)
+
+        #verify one slice of all files by checksum. Not necessary if all
+        #files are compared by checksum anyway (with or without checksum store)
+        rolling = checksumSlice = None
+        if not useChecksum and self.config.checksumSlices() \
+           and self.config.snapshotsMode() != 'ssh_encfs':
+            self.setTakeSnapshotMessage(0, _('Collecting files for checksum verification'))
+            rolling = checksums.RollingChecksum(self.config)
+            checksumSlice = rolling.nextSlice()
+            suspects = rolling.files(include_folders, checksumSlice)
+            self.snapshotLog.append('[I] ' + _('Verify slice %(slice)d of %(slices)d by checksum: %(count)d files')
+                                    % {'slice': checksumSlice + 1,
+                                       'slices': rolling.slices,
+                                       'count': len(suspects)}, 3)
+
+        if not new_snapshot.saveToContinue:
+            with SnapshotCatalog(self.config).modify():
+                if not new_snapshot.makeDirs():
+                    return [False, True]
+
+            # itemized output of a continued snapshot would be incomplete.
+            # Files hardlinked from other snapshots than the previous one are
+            # not itemized and their permissions would be missing
+            if self.config.permissionsFromRsync() and len(link_dest) <= 1:
+                params.append({})
+
+        self.dedupFiles = None
+        if self.config.dedup() and self.config.snapshotsMode() == 'local':
+            self.dedupFiles = []
+        self.versionChanges = None
+        if self.config.versionIndex() and versionindex.VersionIndex(self.config).supported:
+            self.versionChanges = []
 
         # When there is no snapshots it takes the last snapshot from the other folders
         # It should delete the excluded folders then
         rsync_prefix.extend(('--delete', '--delete-excluded'))
         rsync_prefix.append('-v')
-        rsync_prefix.extend(('-i', '--out-format=BACKINTIME: %i %n%L'))
-        if prev_sid:
-            link_dest = encode.path(os.path.join(prev_sid.sid, 'backup'))
-            link_dest = os.path.join(os.pardir, os.pardir, link_dest)
-            rsync_prefix.append('--link-dest=%s' %link_dest)
+        if len(params) > 2:
+            rsync_prefix.extend(('-i', '--out-format=BACKINTIME: %i %B %U %G %n%L'))
+        else:
+            rsync_prefix.extend(('-i', '--out-format=BACKINTIME: %i %n%L'))
+        for path in encode.paths([os.path.join(i.sid, 'backup') for i in link_dest]):
+            path = os.path.join(os.pardir, os.pardir, path)
+            rsync_prefix.append('--link-dest=%s' %path)
 
         #sync changed folders
         logger.info("Call rsync to take the snapshot", self)
@@ -1027,21 +1680,37 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         self.setTakeSnapshotMessage(0, _('Taking snapshot'))
 
         #run rsync
-        proc = tools.Execute(cmd,
-                             callback = self.rsyncCallback,
-                             user_data = params,
-                             filters = (self.filterRsyncProgress,),
-                             parent = self)
-        self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
-        proc.run()
+        shards = self.splitIncludeFolders(include_folders, self.config.rsyncWorkers())
+        if checkpoint is not None:
+            checkpoint.changes = bool(params[1])
+            checkpoint.save()
+            self.checkpoint = checkpoint
+            try:
+                self.rsyncCheckpointed(new_snapshot, checkpoint, include_folders,
+                                       rsync_prefix, cmd[-1], params)
+            finally:
+                self.checkpoint = None
+        elif len(shards) > 1:
+            self.rsyncParallel(new_snapshot, shards, rsync_prefix, cmd[-1], params)
+        else:
+            proc = tools.Execute(cmd,
+                                 callback = self.rsyncCallback,
+                                 user_data = params,
+                                 filters = (self.filterRsyncProgress,),
+                                 pipeline = True,
+                                 parent = self)
+            self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+            proc.run()
+
+        if suspects:
+            self.rsyncChecksum(suspects, rsync_prefix, rsync_suffix, cmd[-1], params)
 
         #cleanup
-        try:
-            os.remove(self.config.takeSnapshotProgressFile())
-        except Exception as e:
-            logger.debug('Failed to remove snapshot progress file %s: %s'
-                         %(self.config.takeSnapshotProgressFile(), str(e)),
-                         self)
+        self.clearProgress()
+        self.flushTakeSnapshotMessage()
+        logger.debug('takeSnapshot messages: {messages} received, {sent} sent, '
+                     '{coalesced} coalesced, {seconds:.2f}s spent on sending'
+                     .format(**self.messageStats), self)
 
         #handle errors
         has_errors = False
@@ -1061,26 +1730,42 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             self.snapshotLog.append('[I] ' + _('Nothing changed, no new snapshot necessary'), 3)
             if prev_sid:
                 prev_sid.setLastChecked()
+                if journal and not has_errors:
+                    journal.save(prev_sid, filterDigest, digests)
+                if rolling and not has_errors:
+                    rolling.save(checksumSlice, prev_sid)
             if not has_errors and not list(self.config.anacrontabFiles()):
                 tools.writeTimeStamp(self.config.anacronSpoolFile())
             return [False, False]
 
+        if self.dedupFiles:
+            self.deduplicate(new_snapshot, sid, prev_sid)
+        self.dedupFiles = None
+
         self.backupConfig(new_snapshot)
-        self.backupPermissions(new_snapshot)
+        if len(params) > 2:
+            self.backupPermissions(new_snapshot, params[2], prev_sid, filterDigest)
+        else:
+            self.backupPermissions(new_snapshot)
 
         #copy snapshot log
         try:
             self.snapshotLog.flush()
             with open(self.snapshotLog.logFileName, 'rb') as logfile:
-                new_snapshot.setLog(logfile.read())
+                new_snapshot.setLog(logfile)
         except Exception as e:
             logger.debug('Failed to write takeSnapshot log %s into compressed file %s: %s'
                          %(self.config.takeSnapshotLogFile(), new_snapshot.path(SID.LOG), str(e)),
                          self)
 
         new_snapshot.saveToContinue = False
+        Checkpoint(new_snapshot, filterDigest).remove()
         #rename snapshot
-        os.rename(new_snapshot.path(), sid.path())
+        catalog = SnapshotCatalog(self.config)
+        with catalog.modify() as entries:
+            os.rename(new_snapshot.path(), sid.path())
+            if entries is not None and sid.exists():
+                entries[sid.sid] = catalog.makeEntry(sid)
 
         if not sid.exists():
             logger.error("Can't rename %s to %s" % (new_snapshot.path(), sid.path()), self)
@@ -1090,7 +1775,12 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             time.sleep(2) #max 1 backup / second
             return [False, True]
 
-        self.backupInfo(sid)
+        if rolling:
+            self.backupInfo(sid, filterDigest, (checksumSlice, rolling.slices))
+            if not has_errors:
+                rolling.save(checksumSlice, sid)
+        else:
+            self.backupInfo(sid, filterDigest)
 
         if not has_errors and not list(self.config.anacrontabFiles()):
             tools.writeTimeStamp(self.config.anacronSpoolFile())
@@ -1098,8 +1788,137 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         #create last_snapshot symlink
         self.createLastSnapshotSymlink(sid)
 
+        if self.versionChanges is not None:
+            # same as with itemized permissions: changes are only complete
+            # if the previous snapshot was the only --link-dest
+            complete = not continued and len(link_dest) <= 1
+            self.updateVersionIndex(sid, prev_sid if complete else None, snapshots)
+        self.versionChanges = None
+
+        if journal and not has_errors:
+            journal.save(sid, filterDigest, digests)
+
         return [True, has_errors]
 
+    def rsyncChecksum(self, suspects, rsync_prefix, rsync_suffix, dest, params):
+        """
+        Run a second rsync with ``--checksum`` only for ``suspects`` found by
+        :py:func:`checksums.ChecksumStore.suspects` or for the current slice
+        of :py:class:`checksums.RollingChecksum`. Files which differ
+        will replace the hardlinks created by the main rsync process.
+
+        Args:
+            suspects (list):        full paths of source files
+            rsync_prefix (list):    rsync command and options of the main
+                                    rsync process
+            rsync_suffix (list):    include and exclude options and source
+            dest (str):             destination
+            params (list):          see :py:func:`Snapshots.rsyncCallback`
+        """
+        with TemporaryDirectory() as d:
+            filesFrom = os.path.join(d, 'suspects')
+            with open(filesFrom, 'wb') as f:
+                for path in suspects:
+                    f.write(os.fsencode(path.lstrip(os.sep)) + b'\0')
+            cmd = [i for i in rsync_prefix if i not in ('--delete', '--delete-excluded')]
+            cmd.extend(('--checksum', '--from0', '--files-from=' + filesFrom))
+            cmd.extend(rsync_suffix)
+            cmd.append(dest)
+            proc = tools.Execute(cmd,
+                                 callback = self.rsyncCallback,
+                                 user_data = params,
+                                 filters = (self.filterRsyncProgress,),
+                                 pipeline = True,
+                                 parent = self)
+            self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+            proc.run()
+
+    def linkDestCandidates(self, snapshots, include_folders):
+        """
+        Choose up to :py:func:`config.Config.linkDestCount` earlier snapshots
+        for rsync's ``--link-dest``. The newest snapshot always comes first.
+        If an include folder is missing there (e.g. a removable drive which
+        wasn't plugged in last time), the newest snapshot which still
+        contains it is added next. Only the next :py:data:`LINK_DEST_SEARCH`
+        snapshots are searched so new include folders which are in no
+        snapshot don't stat every snapshot on every run. Remaining slots are
+        filled with the next newest snapshots.
+
+        Args:
+            snapshots (list):       :py:class:`SID` objects sorted newest
+                                    first
+            include_folders (list): folders to include. list of tuples
+                                    (item, int) where ``int`` is 0 if ``item``
+                                    is a folder or 1 if ``item`` is a file
+
+        Returns:
+            list:                   :py:class:`SID` objects sorted newest first
+        """
+        count = max(1, min(self.config.linkDestCount(), self.LINK_DEST_MAX))
+        if not snapshots:
+            return []
+        candidates = [snapshots[0]]
+        for folder, item_type in include_folders:
+            if len(candidates) >= count:
+                break
+            if any(os.path.lexists(sid.pathBackup(folder)) for sid in candidates):
+                continue
+            for sid in snapshots[1:self.LINK_DEST_SEARCH + 1]:
+                if os.path.lexists(sid.pathBackup(folder)):
+                    if sid not in candidates:
+                        logger.debug('Include {} was last seen in snapshot {}'.format(folder, sid), self)
+                        candidates.append(sid)
+                    break
+        for sid in snapshots[1:]:
+            if len(candidates) >= count:
+                break
+            if sid not in candidates:
+                candidates.append(sid)
+        return sorted(candidates, reverse = True)
+
+    def deduplicate(self, new_snapshot, sid, prev_sid):
+        """
+        Replace files which rsync transferred completely new with hardlinks
+        to identical files in earlier snapshots using
+        :py:class:`dedup.ContentIndex` and report the reclaimed space in the
+        snapshot log.
+
+        Args:
+            new_snapshot (NewSnapshot): snapshot which is currently taken
+            sid (SID):                  ID ``new_snapshot`` will get
+            prev_sid (SID):             previous snapshot or ``None``
+        """
+        self.setTakeSnapshotMessage(0, _('Deduplicating new files'))
+        try:
+            count, reclaimed = dedup.ContentIndex(self.config).deduplicate(
+                new_snapshot, sid, prev_sid, self.dedupFiles)
+        except (OSError, sqlite3.Error) as e:
+            logger.error('Failed to deduplicate new files: {}'.format(str(e)), self)
+            return
+        msg = 'Deduplicated {} of {} new files, reclaimed {}'.format(
+              count, len(self.dedupFiles), tools.formatBytes(reclaimed))
+        logger.info(msg, self)
+        self.snapshotLog.append('[I] ' + msg, 3)
+
+    def updateVersionIndex(self, sid, prev_sid, snapshots):
+        """
+        Add the changes rsync reported for the new snapshot ``sid`` to
+        :py:class:`versionindex.VersionIndex`.
+
+        Args:
+            sid (SID):          new snapshot
+            prev_sid (SID):     previous snapshot or ``None`` if the changes
+                                are incomplete
+            snapshots (list):   all other snapshots
+        """
+        self.setTakeSnapshotMessage(0, _('Updating version index'))
+        try:
+            versionindex.VersionIndex(self.config).add(sid, prev_sid,
+                                                       self.versionChanges,
+                                                       snapshots)
+        except (OSError, sqlite3.Error) as e:
+            logger.error('Failed to update version index: {}'.format(str(e)), self)
+
     def smartRemoveKeepAll(self,
                            snapshots,
                            min_date,
@@ -1226,78 +2045,61 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         Returns:
             list:                           snapshots that should be removed
         """
+        keep, del_snapshots = self.smartRemovePlan(now_full,
+                                                   keep_all,
+                                                   keep_one_per_day,
+                                                   keep_one_per_week,
+                                                   keep_one_per_month)
+        return del_snapshots
+
+    def smartRemovePlan(self,
+                        now_full,
+                        keep_all,
+                        keep_one_per_day,
+                        keep_one_per_week,
+                        keep_one_per_month):
+        """
+        Plan which snapshots should be kept and removed by Smart-Remove
+        using :py:class:`retention.RetentionPlanner`. Failed flags and names
+        are taken from the snapshot catalog if possible.
+
+        Args:
+            now_full (datetime.datetime):   date and time when takeSnapshot was
+                                            started
+            keep_all (int):                 keep all snapshots for the
+                                            last ``keep_all`` days
+            keep_one_per_day (int):         keep one snapshot per day for the
+                                            last ``keep_one_per_day`` days
+            keep_one_per_week (int):        keep one snapshot per week for the
+                                            last ``keep_one_per_week`` weeks
+            keep_one_per_month (int):       keep one snapshot per month for the
+                                            last ``keep_one_per_month`` months
+
+        Returns:
+            tuple:                          (keep, remove) ``keep`` is a dict
+                                            {sid: [reason, ...]} and ``remove``
+                                            a list of snapshots that should
+                                            be removed
+        """
         snapshots = listSnapshots(self.config)
         logger.debug("Considered: %s" %snapshots, self)
         if len(snapshots) <= 1:
             logger.debug("There is only one snapshots, so keep it", self)
-            return
+            return (dict((sid, ['last snapshot']) for sid in snapshots), [])
 
         if now_full is None:
             now_full = datetime.datetime.today()
 
-        now = now_full.date()
-
-        #keep the last snapshot
-        keep = set([snapshots[0]])
-
-        #keep all for the last keep_all days
-        if keep_all > 0:
-            keep |= self.smartRemoveKeepAll(snapshots,
-                                            now - datetime.timedelta(days=keep_all-1),
-                                            now + datetime.timedelta(days=1))
-
-        #keep one per day for the last keep_one_per_day days
-        if keep_one_per_day > 0:
-            d = now
-            for i in range(0, keep_one_per_day):
-                keep |= self.smartRemoveKeepFirst(snapshots,
-                                                  d,
-                                                  d + datetime.timedelta(days=1),
-                                                  keep_healthy = True)
-                d -= datetime.timedelta(days=1)
-
-        #keep one per week for the last keep_one_per_week weeks
-        if keep_one_per_week > 0:
-            d = now - datetime.timedelta(days = now.weekday() + 1)
-            for i in range(0, keep_one_per_week):
-                keep |= self.smartRemoveKeepFirst(snapshots,
-                                                  d,
-                                                  d + datetime.timedelta(days=8),
-                                                  keep_healthy = True)
-                d -= datetime.timedelta(days=7)
-
-        #keep one per month for the last keep_one_per_month months
-        if keep_one_per_month > 0:
-            d1 = datetime.date(now.year, now.month, 1)
-            d2 = self.incMonth(d1)
-            for i in range(0, keep_one_per_month):
-                keep |= self.smartRemoveKeepFirst(snapshots, d1, d2,
-                                                  keep_healthy = True)
-                d2 = d1
-                d1 = self.decMonth(d1)
-
-        #keep one per year for all years
-        first_year = int(snapshots[-1].sid[ : 4])
-        for i in range(first_year, now.year+1):
-            keep |= self.smartRemoveKeepFirst(snapshots,
-                                              datetime.date(i,1,1),
-                                              datetime.date(i+1,1,1),
-                                              keep_healthy = True)
-
-        logger.debug("Keep snapshots: %s" %keep, self)
-
-        del_snapshots = []
-        for sid in snapshots:
-            if sid in keep:
-                continue
-
-            if self.config.dontRemoveNamedSnapshots():
-                if sid.name:
-                    logger.debug("Keep snapshot: %s, it has a name" %sid, self)
-                    continue
-
-            del_snapshots.append(sid)
-        return del_snapshots
+        planner = retention.RetentionPlanner(now_full.date(),
+                                             keep_all,
+                                             keep_one_per_day,
+                                             keep_one_per_week,
+                                             keep_one_per_month,
+                                             self.config.dontRemoveNamedSnapshots())
+        meta = retention.SnapshotMeta(SnapshotCatalog(self.config).load())
+        keep, del_snapshots = planner.plan(snapshots, meta)
+        logger.debug("Keep snapshots: %s" %list(keep), self)
+        return keep, del_snapshots
 
     def smartRemove(self, del_snapshots, log = None):
         """
@@ -1374,9 +2176,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         else:
             logger.info("[smart remove] remove snapshots: %s"
                         %del_snapshots, self)
-            for i, sid in enumerate(del_snapshots, 1):
-                log(_('Smart remove') + ' %s/%s' %(i, len(del_snapshots)))
-                self.remove(sid)
+            self.removeSnapshots(del_snapshots, log, _('Smart remove'))
 
     def freeSpace(self, now):
         """
@@ -1385,7 +2185,8 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         :py:func:`smartRemove` to remove snapshots based on
         configurable intervals. Third rule is to remove the oldest snapshot
         until there is enough free space. Last rule will remove the oldest
-        snapshot until there are enough free inodes.
+        snapshot until there are enough free inodes. If snapshot usage is
+        enabled the last two rules are combined by :py:func:`freeSpacePredicted`.
 
         'last_snapshot' symlink will be fixed when done.
 
@@ -1407,6 +2208,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             oldBackupId = SID(self.config.removeOldSnapshotsDate(), self.config)
             logger.debug("Remove snapshots older than: {}".format(oldBackupId.withoutTag), self)
 
+            old_snapshots = []
             while True:
                 if len(snapshots) <= 1:
                     break
@@ -1420,8 +2222,9 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
                 msg = 'Remove snapshot {} because it is older than {}'
                 logger.debug(msg.format(snapshots[0].withoutTag, oldBackupId.withoutTag), self)
-                self.remove(snapshots[0])
+                old_snapshots.append(snapshots[0])
                 del snapshots[0]
+            self.removeSnapshots(old_snapshots)
 
         #smart remove
         enabled, keep_all, keep_one_per_day, keep_one_per_week, keep_one_per_month = self.config.smartRemove()
@@ -1434,8 +2237,16 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                                                  keep_one_per_month)
             self.smartRemove(del_snapshots)
 
+        #try to keep min free space and free inodes in one step if the
+        #space freed by each snapshot can be predicted
+        remaining = None
+        if self.config.minFreeSpaceEnabled() or self.config.minFreeInodesEnabled():
+            remaining = self.freeSpacePredicted(listSnapshots(self.config, reverse = False))
+            if remaining is not None:
+                snapshots = remaining
+
         #try to keep min free space
-        if self.config.minFreeSpaceEnabled():
+        if self.config.minFreeSpaceEnabled() and remaining is None:
             self.setTakeSnapshotMessage(0, _('Trying to keep min free space'))
 
             minFreeSpace = self.config.minFreeSpaceMib()
@@ -1471,7 +2282,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 del snapshots[0]
 
         #try to keep free inodes
-        if self.config.minFreeInodesEnabled():
+        if self.config.minFreeInodesEnabled() and remaining is None:
             minFreeInodes = self.config.minFreeInodes()
             self.setTakeSnapshotMessage(0, _('Trying to keep min %d%% free inodes') % minFreeInodes)
             logger.debug("Keep min {}%% free inodes".format(minFreeInodes), self)
@@ -1510,6 +2321,115 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         if last_snapshot is not snapshots[-1]:
             self.createLastSnapshotSymlink(snapshots[-1])
 
+    def freeSpacePredicted(self, snapshots):
+        """
+        Keep min free space and min free inodes in one step. The space and
+        inodes each snapshot would free are predicted with
+        :py:class:`usage.SnapshotUsage`. The shortest list of oldest snapshots
+        which satisfies both thresholds is removed in one batch instead of
+        checking free space again after each removed snapshot.
+
+        Args:
+            snapshots (list):   all :py:class:`SID` objects sorted oldest
+                                first
+
+        Returns:
+            list:               remaining snapshots or ``None`` if freed
+                                space can not be predicted
+        """
+        if not self.config.snapshotUsage() or len(snapshots) <= 1:
+            return None
+        db = usage.SnapshotUsage(self.config)
+        if not db.supported:
+            return None
+        path = self.config.snapshotsFullPath()
+        try:
+            info = os.statvfs(path)
+        except OSError as e:
+            logger.debug('Failed to get free space for {}: {}'.format(path, str(e)), self)
+            return None
+        needBytes = needInodes = 0
+        if self.config.minFreeSpaceEnabled():
+            minFreeSpace = self.config.minFreeSpaceMib()
+            needBytes = minFreeSpace * 1024 * 1024 - info.f_frsize * info.f_bavail
+            logger.debug("Keep min free disk space: {} MiB".format(minFreeSpace), self)
+        if self.config.minFreeInodesEnabled():
+            minFreeInodes = self.config.minFreeInodes()
+            needInodes = math.ceil(info.f_files * minFreeInodes / 100.0 - info.f_favail)
+            logger.debug("Keep min {}% free inodes".format(minFreeInodes), self)
+        if needBytes <= 0 and needInodes <= 0:
+            return snapshots
+
+        candidates = snapshots[:-1]
+        if self.config.dontRemoveNamedSnapshots():
+            candidates = [sid for sid in candidates if not sid.name]
+        self.setTakeSnapshotMessage(0, _('Trying to keep min free space'))
+        try:
+            db.update(snapshots)
+            freed = db.predictRemoval(candidates)
+        except (OSError, sqlite3.Error) as e:
+            logger.error('Failed to predict freed space: {}'.format(str(e)), self)
+            return None
+        if not freed:
+            return snapshots
+        # remove all candidates if the thresholds can't be reached
+        count = len(freed)
+        for i, (size, inodes) in enumerate(freed):
+            if size >= needBytes and inodes >= needInodes:
+                count = i + 1
+                break
+        remove = candidates[:count]
+        predictedBytes, predictedInodes = freed[count - 1]
+        for sid in remove:
+            logger.debug('Remove snapshot {} to free space'.format(sid.withoutTag), self)
+        self.removeSnapshots(remove)
+
+        try:
+            after = os.statvfs(path)
+            actualBytes = after.f_frsize * after.f_bavail - info.f_frsize * info.f_bavail
+            actualInodes = after.f_favail - info.f_favail
+        except OSError as e:
+            logger.debug('Failed to get free space for {}: {}'.format(path, str(e)), self)
+            actualBytes = actualInodes = None
+        msg = 'Removed {} snapshots to free space. Predicted {} MiB and {} inodes, ' \
+              'actually freed {} MiB and {} inodes'.format(
+              len(remove), predictedBytes // (1024 * 1024), predictedInodes,
+              '?' if actualBytes is None else actualBytes // (1024 * 1024),
+              '?' if actualInodes is None else actualInodes)
+        logger.info(msg, self)
+        self.snapshotLog.append('[I] ' + msg, 3)
+        return [sid for sid in snapshots if sid not in remove]
+
+    def updateUsage(self, callback = None):
+        """
+        Update the hardlink aware size of all snapshots in
+        :py:class:`usage.SnapshotUsage` and store the total size of each
+        snapshot in the catalog.
+
+        Args:
+            callback (method):  called with each :py:class:`SID` before it
+                                is scanned
+
+        Returns:
+            dict:               {sid: :py:class:`usage.Usage`} or ``None``
+                                if it failed or is not supported
+        """
+        db = usage.SnapshotUsage(self.config)
+        if not db.supported:
+            logger.debug('Snapshot usage is only supported in local mode', self)
+            return None
+        try:
+            sizes = db.update(listSnapshots(self.config), callback)
+        except (OSError, sqlite3.Error) as e:
+            logger.error('Failed to update snapshot usage: {}'.format(str(e)), self)
+            return None
+        with SnapshotCatalog(self.config).modify() as entries:
+            if entries is not None:
+                for sid, entry in entries.items():
+                    if sid in sizes:
+                        entry['size'] = sizes[sid].total
+        return sizes
+
     def statFreeSpaceLocal(self, path):
         """
         Get free space on filsystem containing ``path`` in MiB using
@@ -1583,8 +2503,8 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                                     Which means if a file is exactly the same in
                                     different snapshots only the first snapshot
                                     will be listed
-            flag_deep_check (bool): use md5sum to check uniqueness of files.
-                                    More acurate but slow
+            flag_deep_check (bool): compare file contents to check uniqueness
+                                    of files. More acurate but slow
             list_equal_to (str):    full path to file. If not empty only return
                                     snapshots which have exactly the same file
                                     as this file
@@ -1619,6 +2539,9 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         #directories
         if os.path.isdir(base_full_path):
+            indexed = self.filterFromIndex(base_path, snapshotsList, True)
+            if indexed is not None:
+                return indexed
             for sid in allSnapshotsList:
                 path = sid.pathBackup(base_path)
 
@@ -1628,6 +2551,11 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             return snapshotsFiltered
 
         #files
+        if not list_equal_to and not flag_deep_check:
+            indexed = self.filterFromIndex(base_path, snapshotsList, False, list_diff_only)
+            if indexed is not None:
+                return indexed
+
         if not list_diff_only and not list_equal_to:
             for sid in allSnapshotsList:
                 path = sid.pathBackup(base_path)
@@ -1638,14 +2566,78 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             return snapshotsFiltered
 
         # check for duplicates
-        uniqueness = tools.UniquenessSet(flag_deep_check, follow_symlink = False, list_equal_to = list_equal_to)
+        uniqueness = tools.UniquenessSet(flag_deep_check,
+                                         follow_symlink = False,
+                                         list_equal_to = list_equal_to,
+                                         cacheFile = self.config.digestCacheFile())
+        candidates = collections.OrderedDict()
         for sid in allSnapshotsList:
             path = sid.pathBackup(base_path)
-            if os.path.exists(path) and not os.path.islink(path) and os.path.isfile(path) and uniqueness.check(path):
-                snapshotsFiltered.append(sid)
+            if os.path.exists(path) and not os.path.islink(path) and os.path.isfile(path):
+                candidates[path] = sid
+        for path, ok in uniqueness.checkMany(candidates):
+            if ok:
+                snapshotsFiltered.append(candidates[path])
 
         return snapshotsFiltered
 
+    def filterFromIndex(self, base_path, snapshotsList, folder, list_diff_only = False):
+        """
+        Same as :py:func:`filter` for files and folders but answered from
+        :py:class:`versionindex.VersionIndex` without looking into the
+        snapshots. Only the current file on root filesystem is checked.
+
+        Args:
+            base_path (str):        path to file or folder on root filesystem
+            snapshotsList (list):   list of :py:class:`SID` objects that
+                                    should be filtered
+            folder (bool):          ``True`` if ``base_path`` is a folder
+            list_diff_only (bool):  only return the newest snapshot of each
+                                    version of the file
+
+        Returns:
+            list:                   filtered list of :py:class:`SID` objects
+                                    or ``None`` if the index can't be used
+        """
+        if not self.config.versionIndex():
+            return None
+        index = versionindex.VersionIndex(self.config)
+        if not index.supported:
+            return None
+        history = index.history(base_path, snapshotsList, listSnapshots(self.config))
+        if history is None:
+            return None
+
+        snapshotsFiltered = []
+        root = RootSnapshot(self.config)
+        rootPath = root.pathBackup(base_path)
+        fileType = 'd' if folder else 'f'
+        rootExists = not os.path.islink(rootPath) and \
+                     (os.path.isdir(rootPath) if folder else os.path.isfile(rootPath))
+        if rootExists:
+            snapshotsFiltered.append(root)
+
+        versions = set()
+        for sid, item in zip(snapshotsList, history):
+            if item is None or item[1] != fileType:
+                continue
+            version = item[0]
+            if list_diff_only:
+                if version in versions:
+                    continue
+                versions.add(version)
+                # skip the newest version if it is the current file
+                if rootExists and len(versions) == 1:
+                    try:
+                        a, b = os.stat(rootPath), os.stat(sid.pathBackup(base_path))
+                    except OSError:
+                        pass
+                    else:
+                        if (a.st_size, int(a.st_mtime)) == (b.st_size, int(b.st_mtime)):
+                            continue
+            snapshotsFiltered.append(sid)
+        return snapshotsFiltered
+
     #TODO: move this to config.Config
     def rsyncRemotePath(self, path, use_mode = ['ssh', 'ssh_encfs'], quote = '"'):
         """
@@ -1731,12 +2723,14 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             if os.path.islink(symlink):
                 if os.path.basename(os.path.realpath(symlink)) == sid.sid:
                     return True
-                os.remove(symlink)
-            if os.path.exists(symlink):
-                logger.error('Could not remove symlink %s' %symlink, self)
-                return False
-            logger.debug('Create symlink %s => %s' %(symlink, sid), self)
-            os.symlink(sid.sid, symlink)
+            with SnapshotCatalog(self.config).modify():
+                if os.path.islink(symlink):
+                    os.remove(symlink)
+                if os.path.exists(symlink):
+                    logger.error('Could not remove symlink %s' %symlink, self)
+                    return False
+                logger.debug('Create symlink %s => %s' %(symlink, sid), self)
+                os.symlink(sid.sid, symlink)
             return True
         except Exception as e:
             logger.error('Failed to create symlink %s: %s' %(symlink, str(e)), self)
@@ -1769,6 +2763,174 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             self.flock.close()
         self.flock = None
 
+    def splitIncludeFolders(self, includeFolders, workers):
+        """
+        Split ``includeFolders`` into up to ``workers`` groups which can be
+        synced by separate rsync processes. Include folders which are nested
+        in each other will always stay in the same group.
+
+        Args:
+            includeFolders (list):  folders to include. list of tuples (item, int)
+                                    Where ``int`` is ``0`` if ``item`` is a
+                                    folder or ``1`` if ``item`` is a file
+            workers (int):          maximum number of groups
+
+        Returns:
+            list:                   list of lists with include folders
+        """
+        def components(item):
+            return [i for i in os.path.normpath(item[0]).split(os.sep) if i]
+
+        #sorting by path components makes every child follow its parent
+        #directly. Plain strings would put '/foo-bar' between '/foo' and '/foo/baz'
+        trees = []
+        root = None
+        for item in sorted(includeFolders, key = components):
+            parts = components(item)
+            if trees and parts[:len(root)] == root:
+                trees[-1].append(item)
+            else:
+                trees.append([item])
+                root = parts
+
+        workers = max(1, min(workers, len(trees)))
+        shards = [[] for i in range(workers)]
+        for index, tree in enumerate(trees):
+            shards[index % workers].extend(tree)
+        return shards
+
+    def rsyncParallel(self, new_snapshot, shards, rsync_prefix, dest, params, protect = ()):
+        """
+        Take a snapshot with one rsync process for each group of include
+        folders in ``shards``. Every process protects the folders of all
+        other groups from being deleted with ``--delete``. Output of all
+        processes is handled in this thread by :py:func:`Snapshots.rsyncCallback`
+        so ``params`` will collect changes and errors of all of them.
+
+        Args:
+            new_snapshot (NewSnapshot): snapshot which is currently taken
+            shards (list):              list of lists with include folders,
+                                        see :py:func:`Snapshots.splitIncludeFolders`
+            rsync_prefix (list):        rsync command with all args but without
+                                        --include, --exclude, source and
+                                        destination
+            dest (str):                 rsync destination
+            params (list):              see :py:func:`Snapshots.rsyncCallback`
+            protect (list):             additional include folders which
+                                        are not synced but must not be
+                                        deleted
+
+        Returns:
+            list:                       returncodes of all rsync processes
+                                        in the same order as ``shards``
+        """
+        # create parent folders used by multiple groups first so rsync
+        # processes won't race about creating them
+        parents = {}
+        for index, shard in enumerate(shards):
+            for folder, item_type in shard:
+                folder = os.path.dirname(folder.rstrip(os.sep))
+                while folder and folder != os.sep:
+                    parents.setdefault(folder, set()).add(index)
+                    folder = os.path.dirname(folder)
+        for folder in sorted(parents):
+            if len(parents[folder]) > 1:
+                new_snapshot.makeDirs(folder)
+
+        self.rsyncWorkerProgress = {}
+        procs = []
+        for index, shard in enumerate(shards):
+            others = [item for n, other in enumerate(shards) if n != index for item in other]
+            others.extend(protect)
+            cmd = rsync_prefix + self.rsyncProtect(others) + self.rsyncSuffix(shard)
+            cmd.append(dest)
+            proc = tools.Execute(cmd,
+                                 callback = self.rsyncCallback,
+                                 user_data = params,
+                                 filters = (functools.partial(self.filterRsyncProgress,
+                                                              worker = index),),
+                                 parent = self)
+            self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+            procs.append(proc)
+        logger.info('Run {} rsync processes in parallel'.format(len(procs)), self)
+        return tools.ExecuteParallel(procs, parent = self).run()
+
+    def rsyncCheckpointed(self, new_snapshot, checkpoint, includeFolders, rsync_prefix, dest, params):
+        """
+        Take a snapshot with one rsync process for each include folder (or
+        group of nested include folders) and record every finished group in
+        ``checkpoint``. Groups which were finished by a previous run are
+        skipped but protected from being deleted. Up to
+        :py:func:`config.Config.rsyncWorkers` groups are synced in parallel.
+
+        Args:
+            new_snapshot (NewSnapshot): snapshot which is currently taken
+            checkpoint (Checkpoint):    progress of ``new_snapshot``
+            includeFolders (list):      folders to include. list of tuples
+                                        (item, int) Where ``int`` is ``0`` if
+                                        ``item`` is a folder or ``1`` if
+                                        ``item`` is a file
+            rsync_prefix (list):        rsync command with all args but without
+                                        --include, --exclude, source and
+                                        destination
+            dest (str):                 rsync destination
+            params (list):              see :py:func:`Snapshots.rsyncCallback`
+        """
+        shards = self.splitIncludeFolders(includeFolders, len(includeFolders))
+        todo = [shard for shard in shards if not checkpoint.isDone(shard)]
+        if len(todo) < len(shards):
+            logger.info('Skip {} of {} include folders which were finished by '
+                        'the previous run'.format(len(shards) - len(todo), len(shards)), self)
+            self.snapshotLog.append('[I] ' + _('Skip %(done)d of %(count)d include folders which were finished before')
+                                    % {'done': len(shards) - len(todo),
+                                       'count': len(shards)}, 3)
+
+        workers = max(1, self.config.rsyncWorkers())
+        for start in range(0, len(todo), workers):
+            wave = todo[start:start + workers]
+            protect = [item for shard in shards if shard not in wave for item in shard]
+            if len(wave) > 1:
+                returncodes = self.rsyncParallel(new_snapshot, wave, rsync_prefix,
+                                                 dest, params, protect)
+            else:
+                cmd = rsync_prefix + self.rsyncProtect(protect) + self.rsyncSuffix(wave[0])
+                cmd.append(dest)
+                proc = tools.Execute(cmd,
+                                     callback = self.rsyncCallback,
+                                     user_data = params,
+                                     filters = (self.filterRsyncProgress,),
+                                     pipeline = True,
+                                     parent = self)
+                self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+                returncodes = [proc.run()]
+            for shard, returncode in zip(wave, returncodes):
+                if returncode == 0:
+                    checkpoint.setDone(shard)
+
+    def rsyncProtect(self, includeFolders):
+        """
+        Format protect rules for rsync which prevent ``--delete`` from removing
+        ``includeFolders`` and their parent folders.
+
+        Args:
+            includeFolders (list):  folders to protect. list of tuples (item, int)
+                                    Where ``int`` is ``0`` if ``item`` is a
+                                    folder or ``1`` if ``item`` is a file
+
+        Returns:
+            list:                   rsync filter options
+        """
+        items = tools.OrderedSet()
+        encode = self.config.ENCODE
+        for folder, item_type in includeFolders:
+            folder = folder.rstrip(os.sep)
+            while folder and folder != os.sep:
+                protect = encode.exclude(folder)
+                if protect is not None:
+                    items.add('--filter=P ' + protect)
+                folder = os.path.dirname(folder)
+        return list(items)
+
     def rsyncSuffix(self, includeFolders = None, excludeFolders = None):
         """
         Create suffixes for rsync.
@@ -1873,27 +3035,6 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         return (items1, items2)
 
-class FileInfoDict(dict):
-    """
-    A :py:class:`dict` that maps a path (as :py:class:`bytes`) to a
-    tuple (:py:class:`int`, :py:class:`bytes`, :py:class:`bytes`).
-    """
-    def __init__(self):
-        # default permissions for /
-        # only used if fileinfo.bz2 does not contain a value for /
-        # when it was created with version <= 1.1.12
-        # bugfix for https://github.com/bit-team/backintime/issues/708
-        self[b'/'] = (16877, b'root', b'root')
-
-    def __setitem__(self, key, value):
-        assert isinstance(key, bytes), "key '{}' is not bytes instance".format(key)
-        assert isinstance(value, tuple), "value '{}' is not tuple instance".format(value)
-        assert len(value) == 3, "value '{}' does not have 3 items".format(value)
-        assert isinstance(value[0], int), "first value '{}' is not int instance".format(value[0])
-        assert isinstance(value[1], bytes), "second value '{}' is not bytes instance".format(value[1])
-        assert isinstance(value[2], bytes), "third value '{}' is not bytes instance".format(value[2])
-        super(FileInfoDict, self).__setitem__(key, value)
-
 class SID(object):
     """
     Snapshot ID object used to gather all information for a snapshot
@@ -1917,8 +3058,10 @@ class SID(object):
     INFO     = 'info'
     NAME     = 'name'
     FAILED   = 'failed'
-    FILEINFO = 'fileinfo.bz2'
+    FILEINFO = 'fileinfo.db'
+    FILEINFO_LEGACY = 'fileinfo.bz2'
     LOG      = 'takesnapshot.log.bz2'
+    LOG_INDEX = 'takesnapshot.log.idx'
 
     def __init__(self, date, cfg):
         self.config = cfg
@@ -2199,6 +3342,7 @@ class SID(object):
             logger.debug('Failed to set snapshot {} name: {}'.format(
                          self.sid, str(e)),
                          self)
+        SnapshotCatalog(self.config, self.profileID).update(self)
 
     @property
     def lastChecked(self):
@@ -2253,6 +3397,7 @@ class SID(object):
                              self)
         elif os.path.exists(failedFile):
             os.remove(failedFile)
+        SnapshotCatalog(self.config, self.profileID).update(self)
 
     @property
     def info(self):
@@ -2278,7 +3423,8 @@ class SID(object):
     @property
     def fileInfo(self):
         """
-        Load/save "fileinfo.bz2"
+        Load/save permissions from "fileinfo.db" or from the old style
+        "fileinfo.bz2" if the snapshot was taken with an older version.
 
         Args:
             d (FileInfoDict): dict of: {path: (permission, user, group)}
@@ -2286,50 +3432,72 @@ class SID(object):
         Returns:
             FileInfoDict:     dict of: {path: (permission, user, group)}
         """
-        d = FileInfoDict()
-        infoFile = self.path(self.FILEINFO)
-        if not os.path.isfile(infoFile):
-            return d
+        return self.fileInfoFor(None)
 
+    @fileInfo.setter
+    def fileInfo(self, d):
+        assert isinstance(d, FileInfoDict), 'd is not FileInfoDict type: {}'.format(d)
         try:
-            with bz2.BZ2File(infoFile, 'rb') as fileinfo:
-                for line in fileinfo:
-                    line = line.strip(b'\n')
-                    if not line:
-                        continue
-                    index = line.find(b'/')
-                    if index < 0:
-                        continue
-                    f = line[index:]
-                    if not f:
-                        continue
-                    info = line[:index].strip().split(b' ')
-                    if len(info) == 3:
-                        d[f] = (int(info[0]), info[1], info[2]) #perms, user, group
-        except (FileNotFoundError, PermissionError) as e:
+            fileinfo.FileInfoDB.write(self.path(self.FILEINFO), d)
+        except (PermissionError, sqlite3.Error) as e:
+            logger.error('Failed to write {}: {}'.format(self.FILEINFO, str(e)))
+
+    def fileInfoFor(self, paths):
+        """
+        Load permissions only for ``paths``, everything below them and their
+        parent folders. With "fileinfo.db" this will only read the requested
+        part of the database.
+
+        Args:
+            paths (list):   list of paths (:py:class:`str` or
+                            :py:class:`bytes`) as they were during backup or
+                            ``None`` to load all
+
+        Returns:
+            FileInfoDict:   dict of: {path: (permission, user, group)}
+        """
+        if paths is not None:
+            paths = [i.encode() if isinstance(i, str) else i for i in paths]
+        infoFile = self.path(self.FILEINFO)
+        legacyFile = self.path(self.FILEINFO_LEGACY)
+        try:
+            if os.path.isfile(infoFile):
+                with fileinfo.FileInfoDB(infoFile) as db:
+                    return db.load(paths)
+            if os.path.isfile(legacyFile):
+                return fileinfo.readLegacy(legacyFile, paths)
+        except (FileNotFoundError, PermissionError, sqlite3.Error) as e:
             logger.error('Failed to load {} from snapshot {}: {}'.format(
                          self.FILEINFO, self.sid, str(e)),
                          self)
-        return d
+        return FileInfoDict()
 
-    @fileInfo.setter
-    def fileInfo(self, d):
-        assert isinstance(d, FileInfoDict), 'd is not FileInfoDict type: {}'.format(d)
+    def convertFileInfo(self):
+        """
+        Convert old style "fileinfo.bz2" into "fileinfo.db" and remove the old
+        file afterwards.
+
+        Returns:
+            bool:   ``True`` if the snapshot was converted
+        """
+        legacyFile = self.path(self.FILEINFO_LEGACY)
+        if not os.path.isfile(legacyFile) or os.path.exists(self.path(self.FILEINFO)):
+            return False
+        #restore read-only snapshots afterwards
+        mode = os.stat(self.path()).st_mode
+        self.makeWritable()
         try:
-            with bz2.BZ2File(self.path(self.FILEINFO), 'wb') as f:
-                for path, info in d.items():
-                    f.write(b' '.join((str(info[0]).encode('utf-8', 'replace'),
-                                       info[1],
-                                       info[2],
-                                       path))
-                                       + b'\n')
-        except PermissionError as e:
-            logger.error('Failed to write {}: {}'.format(self.FILEINFO, str(e)))
+            fileinfo.convert(legacyFile, self.path(self.FILEINFO))
+            os.remove(legacyFile)
+        finally:
+            os.chmod(self.path(), mode)
+        return True
 
     #TODO: use @property decorator
     def log(self, mode = None, decode = None):
         """
-        Load log from "takesnapshot.log.bz2"
+        Load log from "takesnapshot.log.bz2". Only lines matching ``mode`` will
+        be read if the snapshot has a "takesnapshot.log.idx".
 
         Args:
             mode (int):                 Mode used for filtering. Take a look at
@@ -2341,33 +3509,68 @@ class SID(object):
         """
         logFile = self.path(self.LOG)
         logFilter = snapshotlog.LogFilter(mode, decode)
+
+        def filtered(lines):
+            if logFilter.header:
+                yield logFilter.header
+            for line in logFilter.filterLines(lines):
+                if not line is None:
+                    yield line
+
         try:
-            with bz2.BZ2File(logFile, 'rb') as f:
-                if logFilter.header:
-                    yield logFilter.header
-                for line in f.readlines():
-                    line = logFilter.filter(line.decode('utf-8').rstrip('\n'))
-                    if not line is None:
+            if os.path.exists(self.path(self.LOG_INDEX)):
+                with self.logReader() as reader:
+                    for line in filtered(reader.iterLines(mode)):
                         yield line
+            else:
+                for line in filtered(self.legacyLog()):
+                    yield line
         except Exception as e:
             msg = ('Failed to get snapshot log from {}:'.format(logFile), str(e))
             logger.debug(' '.join(msg), self)
             for line in msg:
                 yield line
 
+    def legacyLog(self):
+        """
+        Read "takesnapshot.log.bz2" sequentially. Used for snapshots taken
+        with older versions which have no "takesnapshot.log.idx".
+
+        Yields:
+            str:    unfiltered log lines
+        """
+        with bz2.BZ2File(self.path(self.LOG), 'rb') as f:
+            for line in f:
+                yield line.decode('utf-8').rstrip('\n')
+
+    def logReader(self):
+        """
+        Get a reader for random access on the log.
+
+        Returns:
+            snapshotlog.LogReader:  reader for "takesnapshot.log.bz2"
+
+        Raises:
+            OSError:        if the log can not be opened
+            ValueError:     if there is no valid "takesnapshot.log.idx"
+        """
+        return snapshotlog.LogReader(self.path(self.LOG),
+                                     self.path(self.LOG_INDEX),
+                                     compressed = True)
+
     def setLog(self, log):
         """
-        Write log to "takesnapshot.log.bz2"
+        Write log to "takesnapshot.log.bz2" in independently compressed chunks
+        and create "takesnapshot.log.idx".
 
         Args:
-            log: full snapshot log
+            log: full snapshot log or file object opened in binary mode
         """
         if isinstance(log, str):
             log = log.encode('utf-8', 'replace')
         logFile = self.path(self.LOG)
         try:
-            with bz2.BZ2File(logFile, 'wb') as f:
-                f.write(log)
+            snapshotlog.writeArchive(log, logFile, self.path(self.LOG_INDEX))
         except Exception as e:
             logger.error('Failed to write log into compressed file {}: {}'.format(
                          logFile, str(e)),
@@ -2482,6 +3685,95 @@ class NewSnapshot(GenericNonSnapshot):
                 return True
         return False
 
+class Checkpoint(object):
+    """
+    Progress of the snapshot in 'new_snapshot' folder. Include folders are
+    synced in groups (see :py:func:`Snapshots.splitIncludeFolders`) and every
+    group which rsync finished successfully is recorded. If the snapshot gets
+    interrupted the next run will only sync groups which are not finished yet.
+
+    The checkpoint also remembers if rsync reported any changes so a continued
+    snapshot doesn't need to search the previous log with
+    :py:func:`NewSnapshot.hasChanges`.
+
+    Args:
+        newSnapshot (NewSnapshot):  snapshot which is currently taken
+        filterDigest (str):         digest of rsync's filter rules, see
+                                    :py:func:`Snapshots.rsyncFilterDigest`.
+                                    A checkpoint with a different digest is
+                                    ignored
+    """
+    CHECKPOINT = 'checkpoint'
+
+    def __init__(self, newSnapshot, filterDigest):
+        self.fileName = newSnapshot.path(self.CHECKPOINT)
+        self.filterDigest = filterDigest
+        self.done = set()
+        self.changes = False
+
+    @staticmethod
+    def key(shard):
+        return tuple(sorted(item for item, item_type in shard))
+
+    def load(self):
+        """
+        Load the checkpoint of a previous run.
+
+        Returns:
+            bool:   ``True`` if there was a valid checkpoint for the current
+                    filter rules
+        """
+        try:
+            with open(self.fileName, 'rt') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning('Failed to load checkpoint {}: {}'.format(self.fileName, str(e)), self)
+            return False
+        if data.get('filter') != self.filterDigest:
+            logger.info('Filter rules changed since the last checkpoint. '
+                        'Sync all include folders again', self)
+            return False
+        self.done = set(tuple(i) for i in data.get('done', []))
+        self.changes = bool(data.get('changes'))
+        return True
+
+    def save(self):
+        """
+        Write the checkpoint. The file is replaced atomically so it is never
+        left half written if the snapshot gets interrupted.
+        """
+        data = {'filter': self.filterDigest,
+                'changes': self.changes,
+                'done': sorted(self.done)}
+        tmp = self.fileName + '.tmp'
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.fileName)
+        except OSError as e:
+            logger.error('Failed to save checkpoint {}: {}'.format(self.fileName, str(e)), self)
+
+    def isDone(self, shard):
+        return self.key(shard) in self.done
+
+    def setDone(self, shard):
+        self.done.add(self.key(shard))
+        self.save()
+
+    def setChanges(self):
+        self.changes = True
+        self.save()
+
+    def remove(self):
+        try:
+            os.remove(self.fileName)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error('Failed to remove checkpoint {}: {}'.format(self.fileName, str(e)), self)
+
 class RootSnapshot(GenericNonSnapshot):
     """
     Snapshot ID for the filesystem root folder ('/')
@@ -2540,6 +3832,238 @@ class RootSnapshot(GenericNonSnapshot):
         else:
             return os.path.join(os.sep, *path)
 
+class SnapshotCatalog(object):
+    """
+    Persistent catalog of all snapshots of one profile. It holds SID, name,
+    failed flag, tag and size for each snapshot and is stored in
+    '<profile_id>.catalog' next to the snapshots folder.
+
+    The catalog is only trusted as long as mtime and link count of the
+    snapshots folder didn't change since it was written. Otherwise it will be
+    rebuilt by scanning the snapshots folder once. Changes done by BIT itself
+    should be wrapped in :py:func:`modify` so the catalog stays valid.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    VERSION = 1
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.currentProfile()
+        self.profileID = profile_id
+        self.path = cfg.snapshotsFullPath(profile_id)
+        self.fileName = cfg.snapshotCatalogFile(profile_id)
+
+    @property
+    def enabled(self):
+        return self.config.snapshotCatalog(self.profileID)
+
+    def stamp(self):
+        """
+        Current state of the snapshots folder.
+
+        Returns:
+            list:   mtime (ns) and link count of the snapshots folder or
+                    ``None`` if the folder doesn't exist
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_nlink]
+
+    def read(self):
+        """
+        Read the catalog file without checking if it is still valid.
+
+        Returns:
+            dict:   raw catalog data or ``None`` if there is no usable catalog
+        """
+        try:
+            with open(self.fileName, 'rt') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read snapshot catalog {}: {}'.format(
+                         self.fileName, str(e)),
+                         self)
+            return None
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            return None
+        return data
+
+    def write(self, data):
+        """
+        Atomically replace the catalog file with ``data``.
+
+        Args:
+            data (dict):    raw catalog data
+        """
+        tmp = '{}.{}.tmp'.format(self.fileName, os.getpid())
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.fileName)
+        except OSError as e:
+            logger.debug('Failed to write snapshot catalog {}: {}'.format(
+                         self.fileName, str(e)),
+                         self)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def load(self):
+        """
+        Load catalog entries if the catalog is still valid.
+
+        Returns:
+            dict:   {sid: entry} or ``None`` if the catalog is outdated
+        """
+        data = self.read()
+        if data is None or data['stamp'] != self.stamp():
+            return None
+        # finishing a snapshot folder which had no 'backup' folder yet does
+        # not change the snapshots folders mtime
+        for item in data['incomplete']:
+            if os.path.isdir(os.path.join(self.path, item, 'backup')):
+                return None
+        return data['snapshots']
+
+    def makeEntry(self, sid, size = None):
+        """
+        Collect catalog values for ``sid``.
+
+        Args:
+            sid (SID):  snapshot
+            size (int): size of the snapshot in bytes if already known
+
+        Returns:
+            dict:       catalog entry
+        """
+        return {'name':   sid.name,
+                'failed': sid.failed,
+                'tag':    sid.tag,
+                'size':   size}
+
+    def refresh(self):
+        """
+        Rebuild the catalog by scanning the snapshots folder.
+
+        Returns:
+            dict:   {sid: entry} or ``None`` if the snapshots folder
+                    doesn't exist
+        """
+        # take the stamp before scanning so changes during the scan will
+        # invalidate the new catalog
+        stamp = self.stamp()
+        if stamp is None:
+            return None
+        old = self.read()
+        oldEntries = old['snapshots'] if old else {}
+        entries = {}
+        incomplete = []
+        for item in os.listdir(self.path):
+            if item == NewSnapshot.NEWSNAPSHOT:
+                continue
+            try:
+                sid = SID(item, self.config)
+            except Exception as e:
+                if not isinstance(e, LastSnapshotSymlink):
+                    logger.debug("'{}' is no snapshot ID: {}".format(item, str(e)))
+                continue
+            if sid.exists():
+                size = oldEntries.get(item, {}).get('size')
+                entries[item] = self.makeEntry(sid, size)
+            elif os.path.isdir(sid.path()):
+                incomplete.append(item)
+        if self.enabled:
+            self.write({'version':    self.VERSION,
+                        'stamp':      stamp,
+                        'incomplete': incomplete,
+                        'snapshots':  entries})
+        return entries
+
+    def snapshots(self):
+        """
+        List all snapshots. This will only scan the snapshots folder if the
+        catalog is outdated.
+
+        Returns:
+            list:   unsorted list of :py:class:`SID` objects
+        """
+        entries = self.load()
+        if entries is None:
+            entries = self.refresh()
+            if entries is None:
+                return []
+        return [SID(i, self.config) for i in entries]
+
+    def entry(self, sid):
+        """
+        Cached catalog values for ``sid``.
+
+        Args:
+            sid (SID):  snapshot
+
+        Returns:
+            dict:       catalog entry or ``None`` if the catalog is outdated or
+                        doesn't know ``sid``
+        """
+        entries = self.load()
+        if entries:
+            return entries.get(sid.sid)
+
+    @contextmanager
+    def modify(self):
+        """
+        Context manager which wraps changes on the snapshots folder. If the
+        catalog was valid before the change it yields its entries. Changes on
+        them will be written together with the new stamp of the snapshots
+        folder when leaving the context. If the catalog was already outdated
+        ``None`` is yielded and the catalog will be rebuilt on next use.
+
+        Yields:
+            dict:   {sid: entry} or ``None``
+        """
+        if not self.enabled:
+            yield None
+            return
+        lock = None
+        try:
+            lock = os.open(self.path, os.O_RDONLY)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        except OSError as e:
+            logger.debug('Failed to lock snapshots folder {}: {}'.format(
+                         self.path, str(e)),
+                         self)
+        try:
+            data = self.read()
+            if data is None or data['stamp'] != self.stamp():
+                yield None
+                return
+            yield data['snapshots']
+            data['stamp'] = self.stamp()
+            if data['stamp'] is not None:
+                self.write(data)
+        finally:
+            if lock is not None:
+                os.close(lock)
+
+    def update(self, sid):
+        """
+        Refresh the catalog entry for ``sid`` after its name or failed flag
+        changed.
+
+        Args:
+            sid (SID):  snapshot
+        """
+        with self.modify() as entries:
+            if entries is not None and sid.sid in entries:
+                entries[sid.sid] = self.makeEntry(sid, entries[sid.sid].get('size'))
+
 def iterSnapshots(cfg, includeNewSnapshot = False):
     """
     Iterate over snapshots in current snapshot path. Use this in a 'for' loop
@@ -2583,7 +4107,14 @@ def listSnapshots(cfg, includeNewSnapshot = False, reverse = True):
     Returns:
         list:                       list of :py:class:`SID` objects
     """
-    ret = list(iterSnapshots(cfg, includeNewSnapshot))
+    if cfg.snapshotCatalog():
+        ret = SnapshotCatalog(cfg).snapshots()
+        if includeNewSnapshot:
+            newSid = NewSnapshot(cfg)
+            if newSid.exists():
+                ret.append(newSid)
+    else:
+        ret = list(iterSnapshots(cfg, includeNewSnapshot))
     ret.sort(reverse = reverse)
     return ret
 
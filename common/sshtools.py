@@ -580,6 +580,8 @@ class SSH(MountControl):
                                             '%(err)s\nLook at \'man backintime\' for further instructions')
                                             % {'host' : self.host, 'command' : cmd, 'err' : err})
 
+        self.checkRemoteRsyncCaps()
+
         #check cp chmod find and rm
         head  = 'tmp1="%s"; tmp2="%s"; ' %(remote_tmp_dir_1, remote_tmp_dir_2)
         #first define a function to clean up and exit
@@ -699,6 +701,41 @@ class SSH(MountControl):
         if len(inodes) == 2 and inodes[0] != inodes[1]:
             raise MountException(_('Remote host %s doesn\'t support hardlinks') % self.host)
 
+    def checkRemoteRsyncCaps(self):
+        """
+        Probe capabilities of rsync on the remote host and cache them for
+        :py:func:`tools.rsyncPrefix`. The remote host will only be asked
+        again after :py:data:`tools.REMOTE_RSYNC_CAPS_TTL` seconds.
+
+        Returns:
+            list:   List of str with remote rsyncs capabilities or ``None``
+                    if they could not be determined
+        """
+        cacheFile = self.config.rsyncCapsCacheFile()
+        userHost = '{}@{}:{}'.format(self.user, self.host, self.port)
+        caps = tools.remoteRsyncCaps(cacheFile, userHost)
+        if caps is not None:
+            return caps
+        cmd = self.config.sshCommand(cmd = ['rsync', '--version'],
+                                     custom_args = ['-p', str(self.port), self.user_host],
+                                     port = False,
+                                     user_host = False,
+                                     nice = False,
+                                     ionice = False,
+                                     profile_id = self.profile_id)
+        logger.debug('Check remote rsync capabilities: %s' %' '.join(cmd), self)
+        proc = subprocess.Popen(cmd,
+                                stdout = subprocess.PIPE,
+                                stderr = subprocess.PIPE,
+                                universal_newlines = True)
+        out, err = proc.communicate()
+        if proc.returncode or not out:
+            logger.debug('Failed to get remote rsync capabilities: %s' %err, self)
+            return None
+        caps = tools.rsyncCaps(data = out)
+        tools.setRemoteRsyncCaps(cacheFile, userHost, caps)
+        return caps
+
     def randomId(self, size=6, chars=string.ascii_uppercase + string.digits):
         """
         Create a random string.
@@ -0,0 +1,89 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Replay recorded or generated rsync output through tools.Execute and
+Snapshots.filterRsyncProgress in line mode and in pipeline mode.
+
+Usage:
+    python3 test/benchmark_execute.py [LINES | RSYNC_OUTPUT_FILE]
+
+Not part of the unittests.
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+from tempfile import TemporaryDirectory
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import logger
+import config
+import snapshots
+import tools
+
+PROGRESS = '        {}.00K  {}%   14.46MB/s    0:00:53'
+ITEM = 'BACKINTIME: >f+++++++++ home/user/folder{}/file{}'
+
+def generate(fileName, count):
+    with open(fileName, 'wt') as f:
+        for i in range(count):
+            f.write(ITEM.format(i // 100, i) + '\n')
+            if i % 4 == 0:
+                f.write(PROGRESS.format(i % 1000, i % 100) + '\n')
+
+def lineFilter(sn):
+    # filterRsyncProgress as it was before it became a batch filter
+    regex = re.compile(sn.reRsyncProgress.pattern.decode())
+    def f(line):
+        return None if regex.match(line) else line
+    return f
+
+def replay(fileName, filters, pipeline):
+    count = [0]
+    def callback(line, userData):
+        count[0] += 1
+    start = time.perf_counter()
+    tools.Execute(['cat', fileName], callback = callback,
+                  filters = filters, pipeline = pipeline).run()
+    return time.perf_counter() - start, count[0]
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else '1000000'
+    logger.DEBUG = False
+    with TemporaryDirectory() as tmp:
+        cfgFile = os.path.join(tmp, 'config')
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'config'), cfgFile)
+        cfg = config.Config(cfgFile, tmp)
+        sn = snapshots.Snapshots(cfg)
+        if os.path.isfile(arg):
+            fileName = arg
+        else:
+            fileName = os.path.join(tmp, 'rsync.out')
+            generate(fileName, int(arg))
+        for name, filters, pipeline in (
+                ('line mode, str filter', (lineFilter(sn),), False),
+                ('line mode, batch filter', (sn.filterRsyncProgress,), False),
+                ('pipeline, str filter', (lineFilter(sn),), True),
+                ('pipeline, batch filter', (sn.filterRsyncProgress,), True)):
+            seconds, lines = replay(fileName, filters, pipeline)
+            print('{:<26} {:>8.2f}s {:>10} lines'.format(name, seconds, lines))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import changejournal
+import snapshots
+
+
+class TestExcludeMatcher(generic.TestCase):
+    def test_match(self):
+        m = changejournal.ExcludeMatcher(['/foo/bar', '*.tmp', '.cache/',
+                                          '/foo/*', 'foo/bar', '**.bak'])
+        self.assertTrue(m.match('/foo/bar', 'bar', True))
+        self.assertFalse(m.match('/foo/baz', 'baz', True))
+        self.assertTrue(m.match('/home/asdf.tmp', 'asdf.tmp', False))
+        self.assertTrue(m.match('/home/.cache', '.cache', True))
+        self.assertFalse(m.match('/home/.cache', '.cache', False))
+        self.assertTrue(m.match('/home/asdf.bak', 'asdf.bak', False))
+        # unsupported patterns will never match
+        self.assertFalse(m.match('/home/foo/bar', 'bar', False))
+
+class TestChangeJournal(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestChangeJournal, self).setUp()
+        self.include = TemporaryDirectory()
+        generic.create_test_files(self.include.name)
+        self.includeFolders = [(self.include.name, 0)]
+        self.journal = changejournal.ChangeJournal(self.cfg)
+        self.journal.RACY_SECONDS = 0
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+
+    def tearDown(self):
+        super(TestChangeJournal, self).tearDown()
+        self.include.cleanup()
+
+    def test_scan(self):
+        d1 = self.journal.scan(self.includeFolders)
+        self.assertEqual(len(d1), 1)
+        self.assertIsNotNone(d1[self.include.name])
+        self.assertDictEqual(self.journal.scan(self.includeFolders), d1)
+
+        with open(os.path.join(self.include.name, 'foo', 'bar', 'baz'), 'at') as f:
+            f.write('foo')
+        self.assertNotEqual(self.journal.scan(self.includeFolders), d1)
+
+    def test_scan_exclude(self):
+        self.cfg.setExclude(['*.tmp'])
+        d1 = self.journal.scan(self.includeFolders)
+        with open(os.path.join(self.include.name, 'foo.tmp'), 'wt') as f:
+            f.write('foo')
+        # mtime of the include folder changed
+        self.assertNotEqual(self.journal.scan(self.includeFolders), d1)
+        d2 = self.journal.scan(self.includeFolders)
+        with open(os.path.join(self.include.name, 'foo.tmp'), 'at') as f:
+            f.write('bar')
+        self.assertDictEqual(self.journal.scan(self.includeFolders), d2)
+
+    def test_scan_racy(self):
+        self.journal.RACY_SECONDS = 3600
+        d = self.journal.scan(self.includeFolders)
+        self.assertIsNone(d[self.include.name])
+
+    def test_unchanged(self):
+        digests = self.journal.scan(self.includeFolders)
+        self.assertFalse(self.journal.unchanged(self.sid, 'foo', digests))
+
+        self.journal.save(self.sid, 'foo', digests)
+        self.assertIsFile(self.cfg.changeJournalFile())
+        self.assertTrue(self.journal.unchanged(self.sid, 'foo', digests))
+        self.assertFalse(self.journal.unchanged(self.sid, 'bar', digests))
+        other = snapshots.SID('20151219-020324-123', self.cfg)
+        self.assertFalse(self.journal.unchanged(other, 'foo', digests))
+
+        with open(os.path.join(self.include.name, 'test'), 'at') as f:
+            f.write('foo')
+        self.assertFalse(self.journal.unchanged(self.sid, 'foo',
+                                                self.journal.scan(self.includeFolders)))
+
+        self.journal.clear()
+        self.assertNotExists(self.cfg.changeJournalFile())
+        self.assertFalse(self.journal.unchanged(self.sid, 'foo', digests))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import shutil
+import unittest
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import checksums
+import snapshots
+
+
+class TestChecksumStore(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestChecksumStore, self).setUp()
+        self.include = TemporaryDirectory()
+        self.includeFolders = [(self.include.name, 0)]
+        self.store = checksums.ChecksumStore(self.cfg)
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+        self.sid.makeDirs()
+        for name in ('equal', 'corrupt', 'newer'):
+            self.write(name, b'foo')
+        os.makedirs(self.sid.pathBackup(self.include.name))
+        for name in ('equal', 'corrupt', 'newer'):
+            shutil.copy2(self.path(name), self.sid.pathBackup(self.path(name)))
+
+        # same size and mtime but different content in the snapshot
+        backup = self.sid.pathBackup(self.path('corrupt'))
+        st = os.stat(backup)
+        with open(backup, 'wb') as f:
+            f.write(b'bar')
+        os.utime(backup, ns = (st.st_atime_ns, st.st_mtime_ns))
+        # rsync's quick check will find this anyway
+        os.utime(self.sid.pathBackup(self.path('newer')), (0, 0))
+
+    def tearDown(self):
+        super(TestChecksumStore, self).tearDown()
+        self.include.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.include.name, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'wb') as f:
+            f.write(content)
+
+    def test_suspects(self):
+        self.assertListEqual(self.store.suspects(self.includeFolders, [self.sid]),
+                             [self.path('corrupt')])
+        # both sides of 'equal' and 'corrupt'
+        self.assertEqual(self.store.hashed, 4)
+
+    def test_suspects_cached(self):
+        self.store.suspects(self.includeFolders, [self.sid])
+        self.assertListEqual(self.store.suspects(self.includeFolders, [self.sid]),
+                             [self.path('corrupt')])
+        self.assertEqual(self.store.hashed, 0)
+
+    def test_suspects_changed_without_mtime(self):
+        self.store.suspects(self.includeFolders, [self.sid])
+        st = os.stat(self.path('equal'))
+        self.write('equal', b'baz')
+        os.utime(self.path('equal'), ns = (st.st_atime_ns, st.st_mtime_ns))
+        self.assertCountEqual(self.store.suspects(self.includeFolders, [self.sid]),
+                              [self.path('corrupt'), self.path('equal')])
+        self.assertEqual(self.store.hashed, 1)
+
+    def test_suspects_no_link_dest(self):
+        self.assertListEqual(self.store.suspects(self.includeFolders, []), [])
+
+    def test_suspects_exclude(self):
+        self.cfg.setExclude(['corrupt'])
+        self.assertListEqual(self.store.suspects(self.includeFolders, [self.sid]), [])
+
+class TestRollingChecksum(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestRollingChecksum, self).setUp()
+        self.include = TemporaryDirectory()
+        self.includeFolders = [(self.include.name, 0)]
+        for i in range(20):
+            with open(os.path.join(self.include.name, str(i)), 'wb') as f:
+                f.write(b'foo')
+        self.cfg.setChecksumSlices(3)
+        self.rolling = checksums.RollingChecksum(self.cfg)
+
+    def tearDown(self):
+        super(TestRollingChecksum, self).tearDown()
+        self.include.cleanup()
+
+    def test_files(self):
+        slices = [self.rolling.files(self.includeFolders, i) for i in range(3)]
+        self.assertEqual(sum(len(i) for i in slices), 20)
+        self.assertCountEqual([os.path.basename(path) for i in slices for path in i],
+                              [str(i) for i in range(20)])
+        for i, paths in enumerate(slices):
+            for path in paths:
+                self.assertEqual(self.rolling.bucket(path, 3), i)
+
+    def test_save(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        self.assertEqual(self.rolling.nextSlice(), 0)
+        self.rolling.save(0, sid)
+        self.assertEqual(self.rolling.nextSlice(), 1)
+        self.rolling.save(2, sid)
+        self.assertEqual(self.rolling.nextSlice(), 0)
+        self.assertDictEqual(self.rolling.load()['verified'],
+                             {'0': str(sid), '2': str(sid)})
+
+    def test_slices_changed(self):
+        self.rolling.save(1, snapshots.SID('20151219-010324-123', self.cfg))
+        self.cfg.setChecksumSlices(14)
+        rolling = checksums.RollingChecksum(self.cfg)
+        self.assertEqual(rolling.nextSlice(), 0)
+        self.assertDictEqual(rolling.load()['verified'], {})
+
+if __name__ == '__main__':
+    unittest.main()
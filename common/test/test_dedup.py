@@ -0,0 +1,113 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import shutil
+import unittest
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import dedup
+import snapshots
+
+
+class TestContentIndex(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestContentIndex, self).setUp()
+        self.cfg.setDedupMinSize(0)
+        self.index = dedup.ContentIndex(self.cfg)
+        self.sid1 = snapshots.SID('20151219-010324-123', self.cfg)
+        self.sid2 = snapshots.SID('20151219-020324-123', self.cfg)
+
+        # first snapshot gets indexed
+        new = self.newSnapshot()
+        self.write(new.pathBackup('a', 'foo'), b'foo' * 1000)
+        self.assertTupleEqual(self.index.deduplicate(new, self.sid1, None, ['a/foo']),
+                              (0, 0))
+        os.rename(new.path(), self.sid1.path())
+
+    def newSnapshot(self):
+        new = snapshots.NewSnapshot(self.cfg)
+        new.makeDirs()
+        return new
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_moved_file(self):
+        new = self.newSnapshot()
+        os.makedirs(new.pathBackup('b'))
+        shutil.copy2(self.sid1.pathBackup('a', 'foo'), new.pathBackup('b', 'foo'))
+        count, reclaimed = self.index.deduplicate(new, self.sid2, self.sid1, ['b/foo'])
+        self.assertEqual(count, 1)
+        self.assertGreater(reclaimed, 0)
+        self.assertTrue(os.path.samefile(self.sid1.pathBackup('a', 'foo'),
+                                         new.pathBackup('b', 'foo')))
+
+    def test_different_mtime(self):
+        new = self.newSnapshot()
+        self.write(new.pathBackup('b', 'foo'), b'foo' * 1000)
+        os.utime(new.pathBackup('b', 'foo'), (0, 0))
+        self.assertTupleEqual(self.index.deduplicate(new, self.sid2, self.sid1, ['b/foo']),
+                              (0, 0))
+        self.assertFalse(os.path.samefile(self.sid1.pathBackup('a', 'foo'),
+                                          new.pathBackup('b', 'foo')))
+
+    def test_different_content(self):
+        new = self.newSnapshot()
+        self.write(new.pathBackup('b', 'foo'), b'bar' * 1000)
+        self.assertTupleEqual(self.index.deduplicate(new, self.sid2, self.sid1, ['b/foo']),
+                              (0, 0))
+
+    def test_duplicates_in_new_snapshot(self):
+        new = self.newSnapshot()
+        self.write(new.pathBackup('c', 'x'), b'baz' * 1000)
+        shutil.copy2(new.pathBackup('c', 'x'), new.pathBackup('c', 'y'))
+        count, reclaimed = self.index.deduplicate(new, self.sid2, self.sid1, ['c/x', 'c/y'])
+        self.assertEqual(count, 1)
+        self.assertTrue(os.path.samefile(new.pathBackup('c', 'x'),
+                                         new.pathBackup('c', 'y')))
+
+    def test_stale_entry(self):
+        # indexed file was removed together with its snapshot but is still
+        # available in the previous snapshot through --link-dest
+        prev = snapshots.SID('20151219-015324-123', self.cfg)
+        os.makedirs(prev.pathBackup('a'))
+        os.link(self.sid1.pathBackup('a', 'foo'), prev.pathBackup('a', 'foo'))
+        shutil.rmtree(self.sid1.path())
+
+        new = self.newSnapshot()
+        os.makedirs(new.pathBackup('b'))
+        shutil.copy2(prev.pathBackup('a', 'foo'), new.pathBackup('b', 'foo'))
+        self.assertEqual(self.index.deduplicate(new, self.sid2, prev, ['b/foo'])[0], 1)
+        self.assertTrue(os.path.samefile(prev.pathBackup('a', 'foo'),
+                                         new.pathBackup('b', 'foo')))
+
+    def test_min_size(self):
+        self.cfg.setDedupMinSize(1024)
+        index = dedup.ContentIndex(self.cfg)
+        new = self.newSnapshot()
+        os.makedirs(new.pathBackup('b'))
+        shutil.copy2(self.sid1.pathBackup('a', 'foo'), new.pathBackup('b', 'foo'))
+        self.assertTupleEqual(index.deduplicate(new, self.sid2, self.sid1, ['b/foo']),
+                              (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,8 +17,12 @@
 
 import os
 import sys
+import subprocess
+from unittest.mock import patch
 from test import generic
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import encfstools
 
 class TestEncFS_mount(generic.TestCase):
 
@@ -35,3 +39,128 @@ class TestEncFS_mount(generic.TestCase):
 
     def test_dummy(self):
         self.assertTrue(True)
+
+class TestPathCache(generic.TestCase):
+    def test_parents(self):
+        cache = encfstools.PathCache()
+        cache.set('foo/bar/baz', 'ABC/DEF/GHI')
+        self.assertEqual(cache.get('foo/bar/baz'), 'ABC/DEF/GHI')
+        self.assertEqual(cache.get('foo/bar'), 'ABC/DEF')
+        self.assertEqual(cache.get('foo'), 'ABC')
+        self.assertIsNone(cache.get('foo/baz'))
+
+        cache.set('/asdf/qwer', '/YXX/ZZZ')
+        self.assertEqual(cache.get('/asdf'), '/YXX')
+        self.assertIsNone(cache.get(''))
+
+    def test_lru(self):
+        cache = encfstools.PathCache(maxSize = 3)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.set('c', 'C')
+        cache.get('a')
+        cache.set('d', 'D')
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+
+    def test_save_load(self):
+        fileName = os.path.join(self.sharePath, 'cache.json')
+        cache = encfstools.PathCache(binary = True)
+        cache.set(b'foo/b\xe4r', b'ABC/DEF')
+        cache.save(fileName, 'decode', 'digest1')
+
+        cache = encfstools.PathCache(binary = True)
+        cache.load(fileName, 'decode', 'digest1')
+        self.assertEqual(cache.get(b'foo/b\xe4r'), b'ABC/DEF')
+        self.assertEqual(cache.get(b'foo'), b'ABC')
+
+        cache = encfstools.PathCache(binary = True)
+        cache.load(fileName, 'encode', 'digest1')
+        self.assertEqual(len(cache), 0)
+
+        cache = encfstools.PathCache(binary = True)
+        cache.load(fileName, 'decode', 'digest2')
+        self.assertEqual(len(cache), 0)
+
+class CatCodec(encfstools.EncfsctlCodec):
+    """
+    Use 'cat' instead of 'encfsctl' which will return the same path.
+    """
+    CACHE_SECTION = 'encode'
+    MAX_IN_FLIGHT = 64
+
+    def __init__(self):
+        self.newline = '\n'
+        self.cache = encfstools.PathCache()
+        self.started = 0
+
+    def startProcess(self):
+        self.started += 1
+        self.p = subprocess.Popen(['cat'], bufsize = 0,
+                                  stdin = subprocess.PIPE,
+                                  stdout = subprocess.PIPE,
+                                  universal_newlines = True)
+
+    def close(self):
+        self.p.communicate()
+
+class TestEncfsctlCodec(generic.TestCase):
+    def test_paths(self):
+        codec = CatCodec()
+        paths = ['foo/bar{}'.format(i) for i in range(100)]
+        self.assertListEqual(codec.paths(paths + paths[:10]), paths + paths[:10])
+        self.assertEqual(codec.path('foo/bar5'), 'foo/bar5')
+        self.assertEqual(codec.cache.get('foo'), 'foo')
+        self.assertEqual(codec.started, 1)
+        codec.close()
+
+class CatDecode(encfstools.Decode):
+    """
+    Decode with 'cat' instead of 'encfsctl'.
+    """
+    def __init__(self, cfg):
+        with patch.object(config.Config, 'password', return_value = 'password'):
+            super(CatDecode, self).__init__(cfg)
+        self.started = 0
+
+    def startProcess(self):
+        self.started += 1
+        self.p = subprocess.Popen(['cat'], bufsize = 0,
+                                  stdin = subprocess.PIPE,
+                                  stdout = subprocess.PIPE,
+                                  universal_newlines = True)
+
+    def saveCache(self):
+        pass
+
+class TestDecode(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestDecode, self).setUp()
+        self.cfg.setSnapshotsMode('local_encfs')
+        self.decode = CatDecode(self.cfg)
+
+    def tearDown(self):
+        self.decode.close()
+        super(TestDecode, self).tearDown()
+
+    def test_logPaths(self):
+        self.assertListEqual(self.decode.logPaths('[C] >f+++++++++ ABC/DEF'), ['ABC/DEF'])
+        self.assertListEqual(self.decode.logPaths('[C] cL+++++++++ ABC -> DEF'), ['ABC', 'DEF'])
+        self.assertListEqual(self.decode.logPaths('[I] rsync --include="/ABC/" --exclude="/DEF/*/GHI"'),
+                             ['/ABC/', '/DEF/', '/GHI'])
+        self.assertListEqual(self.decode.logPaths('[I] Take snapshot (rsync: deleting ABC/DEF)'),
+                             ['ABC/DEF'])
+        self.assertListEqual(self.decode.logPaths('[I] Take snapshot (rsync: sending incremental file list)'),
+                             [])
+
+    def test_prefetchLog(self):
+        lines = ['[C] >f+++++++++ ABC/DEF',
+                 '[I] Take snapshot (rsync: deleting GHI)']
+        self.decode.prefetchLog(lines)
+        self.assertEqual(self.decode.started, 1)
+        self.assertEqual(self.decode.cache.get('ABC/DEF'), 'ABC/DEF')
+        self.assertEqual(self.decode.cache.get('GHI'), 'GHI')
+        # prefetch doesn't change how lines are decoded
+        self.assertListEqual([self.decode.log(line) for line in lines], lines)
+        self.assertEqual(self.decode.path('ABC'), 'ABC')
@@ -0,0 +1,56 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import unittest
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import fileinfo
+
+
+class TestFileInfo(generic.TestCase):
+    def test_subtreeFilter(self):
+        match = fileinfo.subtreeFilter([b'/foo/bar'])
+        self.assertTrue(match(b'/'))
+        self.assertTrue(match(b'/foo'))
+        self.assertTrue(match(b'/foo/bar'))
+        self.assertTrue(match(b'/foo/bar/baz'))
+        self.assertFalse(match(b'/foo/barbaz'))
+        self.assertFalse(match(b'/foo/baz'))
+
+        match = fileinfo.subtreeFilter(None)
+        self.assertTrue(match(b'/foo/baz'))
+
+    def test_modeFromRsync(self):
+        self.assertEqual(fileinfo.modeFromRsync('f', 'rw-r--r--'),
+                         stat.S_IFREG | 0o644)
+        self.assertEqual(fileinfo.modeFromRsync('d', 'rwxr-xr-x'),
+                         stat.S_IFDIR | 0o755)
+        self.assertEqual(fileinfo.modeFromRsync('d', 'rwxrwxrwt'),
+                         stat.S_IFDIR | 0o1777)
+        self.assertEqual(fileinfo.modeFromRsync('f', 'rwsr-Sr-x'),
+                         stat.S_IFREG | 0o6745)
+
+    def test_modeFromRsync_unsupported(self):
+        self.assertIsNone(fileinfo.modeFromRsync('L', 'rwxrwxrwx'))
+        self.assertIsNone(fileinfo.modeFromRsync('f', ''))
+
+if __name__ == '__main__':
+    unittest.main()
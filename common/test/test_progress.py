@@ -0,0 +1,102 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import struct
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import progress
+import snapshots
+
+
+class TestProgressChannel(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestProgressChannel, self).setUp()
+        self.filename = os.path.join(self.sharePath, 'worker.progress')
+        self.channel = progress.ProgressChannel(self.cfg, self.filename)
+
+    def tearDown(self):
+        self.channel.close()
+        super(TestProgressChannel, self).tearDown()
+
+    def test_publish(self):
+        self.assertIsNone(self.channel.read())
+        self.channel.publish(progress.ProgressFile.RSYNC, 42, '1.50M', '3.50MB/s')
+        values = progress.ProgressChannel(self.cfg, self.filename).read()
+        self.assertEqual(values['status'], progress.ProgressFile.RSYNC)
+        self.assertEqual(values['percent'], 42)
+        self.assertEqual(values['sent'], '1.50M')
+        self.assertEqual(values['speed'], '3.50MB/s')
+        self.assertEqual(values['pid'], os.getpid())
+
+    def test_publish_rate(self):
+        self.channel.publish(progress.ProgressFile.RSYNC, 1)
+        self.channel.publish(progress.ProgressFile.RSYNC, 2)
+        self.assertEqual(self.channel.read()['percent'], 1)
+        self.channel.publish(progress.ProgressFile.RSYNC, 3, force = True)
+        self.assertEqual(self.channel.read()['percent'], 3)
+        # a new status is never dropped
+        self.channel.publish(progress.ProgressFile.REMOVE, 4)
+        self.assertEqual(self.channel.read()['percent'], 4)
+
+    def test_read_while_writing(self):
+        self.channel.publish(progress.ProgressFile.RSYNC, 1)
+        struct.pack_into('<I', self.channel.mmap, 6, self.channel.seq + 1)
+        self.assertIsNone(self.channel.read())
+
+    @patch('os.kill', side_effect = ProcessLookupError)
+    def test_read_stale(self, kill):
+        self.channel.publish(progress.ProgressFile.RSYNC, 1)
+        self.assertIsNone(self.channel.read())
+
+    def test_close(self):
+        self.channel.publish(progress.ProgressFile.RSYNC, 1)
+        self.channel.close()
+        self.assertNotExists(self.filename)
+        self.assertIsNone(self.channel.read())
+
+class TestCurrent(generic.SnapshotsTestCase):
+    def tearDown(self):
+        self.sn.clearProgress()
+        super(TestCurrent, self).tearDown()
+
+    def test_channel(self):
+        self.assertIsNone(progress.current(self.cfg))
+        self.sn.publishProgress(progress.ProgressFile.RSYNC, 10, '1.00M', '2.00MB/s')
+        self.assertNotExists(self.cfg.takeSnapshotProgressFile())
+        pg = progress.current(self.cfg)
+        self.assertEqual(pg.intValue('percent'), 10)
+        self.assertEqual(pg.strValue('speed'), '2.00MB/s')
+        self.sn.clearProgress()
+        self.assertIsNone(progress.current(self.cfg))
+
+    @patch('progress.ProgressChannel.open', side_effect = PermissionError)
+    def test_fallback(self, open_):
+        self.sn.publishProgress(progress.ProgressFile.REMOVE, 20)
+        self.assertExists(self.cfg.takeSnapshotProgressFile())
+        pg = progress.current(self.cfg)
+        self.assertEqual(pg.intValue('status'), progress.ProgressFile.REMOVE)
+        self.assertEqual(pg.intValue('percent'), 20)
+        self.sn.clearProgress()
+        self.assertNotExists(self.cfg.takeSnapshotProgressFile())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,6 +21,7 @@ import unittest
 import pwd
 import grp
 import stat
+from unittest.mock import patch
 from tempfile import TemporaryDirectory
 from test import generic
 
@@ -152,6 +153,53 @@ class TestRestore(RestoreTestCase):
         with open(restoreFile, 'rt') as f:
             self.assertEqual(f.read(), 'fooooooooooooooooooo')
 
+class TestRestoreGroups(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestRestoreGroups, self).setUp()
+        self.filesFrom = []
+
+    def execute(self, cmd, *args, **kwargs):
+        filesFrom = [i for i in cmd if i.startswith('--files-from=')][0][13:]
+        with open(filesFrom, 'rb') as f:
+            self.filesFrom.append((cmd[-2], f.read().split(b'\0')[:-1]))
+        return unittest.mock.DEFAULT
+
+    @patch('tools.ExecuteParallel')
+    @patch('tools.Execute')
+    def test_single_rsync(self, execute, parallel):
+        execute.side_effect = self.execute
+        groups = {'/snapshot/backup/': ['foo/bar', 'foo/baz', 'x y']}
+        self.sn.restoreGroups(groups, ['rsync', '-R'], '')
+        self.assertEqual(execute.call_count, 1)
+        parallel.assert_not_called()
+        self.assertListEqual(self.filesFrom,
+                             [('/snapshot/backup/', [b'foo/bar', b'foo/baz', b'x y'])])
+        self.assertEqual(execute.call_args[0][0][-1], '/')
+
+    @patch('tools.ExecuteParallel')
+    @patch('tools.Execute')
+    def test_parallel(self, execute, parallel):
+        execute.side_effect = self.execute
+        self.cfg.setRestoreWorkers(2)
+        groups = {'/snapshot/backup/foo/': ['bar'],
+                  '/snapshot/backup/baz/': ['qux'],
+                  '/snapshot/backup/': ['quux']}
+        self.sn.restoreGroups(groups, ['rsync', '-R'], '/tmp/dest')
+        self.assertEqual(execute.call_count, 3)
+        self.assertEqual(parallel.call_count, 2)
+        self.assertEqual(len(parallel.call_args_list[0][0][0]), 2)
+        self.assertEqual(execute.call_args[0][0][-1], '/tmp/dest/')
+
+    @patch('tools.ExecuteParallel')
+    @patch('tools.Execute')
+    def test_parallel_same_name(self, execute, parallel):
+        self.cfg.setRestoreWorkers(2)
+        groups = {'/snapshot/backup/foo/': ['bar'],
+                  '/snapshot/backup/baz/': ['bar']}
+        self.sn.restoreGroups(groups, ['rsync', '-R'], '/tmp/dest')
+        self.assertEqual(execute.call_count, 2)
+        parallel.assert_not_called()
+
 class TestRestoreLocal(RestoreTestCase):
     """
     Tests which should run on local and ssh profile
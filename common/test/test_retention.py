@@ -0,0 +1,148 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import random
+import unittest
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import retention
+import snapshots
+
+
+class TestRetentionPlanner(generic.SnapshotsTestCase):
+    def sids(self, *ids):
+        return [snapshots.SID(i, self.cfg) for i in ids]
+
+    def test_plan(self):
+        sids = self.sids('20160424-215134-123', '20160424-100000-123',
+                         '20160423-100000-123', '20160417-100000-123',
+                         '20160410-100000-123', '20160301-100000-123',
+                         '20150601-100000-123', '20150101-100000-123')
+        planner = retention.RetentionPlanner(date(2016, 4, 24), 1, 2, 2, 2)
+        keep, remove = planner.plan(sids)
+        self.assertListEqual(list(keep), [sids[0], sids[1], sids[2], sids[3],
+                                          sids[5], sids[6]])
+        self.assertListEqual(remove, [sids[4], sids[7]])
+        self.assertIn('last snapshot', keep[sids[0]])
+        self.assertIn('keep all for 1 days', keep[sids[1]])
+        self.assertIn('one per day (2016-04-23)', keep[sids[2]])
+        # week windows span 8 days from Sunday to Sunday
+        self.assertIn('one per week (2016-04-17 - 2016-04-24)', keep[sids[0]])
+        self.assertIn('one per week (2016-04-10 - 2016-04-17)', keep[sids[3]])
+        self.assertIn('one per month (2016-03)', keep[sids[5]])
+        self.assertIn('one per year (2016)', keep[sids[0]])
+        self.assertIn('one per year (2015)', keep[sids[6]])
+        self.assertNotIn('one per year (2015)', keep.get(sids[7], []))
+
+    def test_failed(self):
+        sids = self.sids('20160424-215134-123', '20160423-100000-123',
+                         '20160423-090000-123', '20160423-080000-123')
+        meta = retention.SnapshotMeta({sids[1].sid: {'failed': True, 'name': ''},
+                                       sids[2].sid: {'failed': True, 'name': ''}})
+        planner = retention.RetentionPlanner(date(2016, 4, 24), 0, 2, 0, 0)
+        keep, remove = planner.plan(sids, meta)
+        self.assertListEqual(remove, [sids[1], sids[2]])
+
+        # all failed, keep the newest
+        meta.entries[sids[3].sid] = {'failed': True, 'name': ''}
+        keep, remove = planner.plan(sids, meta)
+        self.assertListEqual(remove, [sids[2], sids[3]])
+
+    def test_named(self):
+        sids = self.sids('20160424-215134-123', '20160423-100000-123')
+        meta = retention.SnapshotMeta({sids[1].sid: {'failed': False, 'name': 'foo'}})
+        planner = retention.RetentionPlanner(date(2016, 4, 24), 0, 0, 0, 0, keepNamed = True)
+        keep, remove = planner.plan(sids, meta)
+        self.assertListEqual(remove, [])
+        self.assertListEqual(keep[sids[1]], ['has a name'])
+
+        planner.keepNamed = False
+        keep, remove = planner.plan(sids, meta)
+        self.assertListEqual(remove, [sids[1]])
+
+    def test_meta_cache(self):
+        sid = snapshots.SID('20160424-215134-123', self.cfg)
+        meta = retention.SnapshotMeta()
+        with patch.object(snapshots.SID, 'failed', new_callable = unittest.mock.PropertyMock) as failed:
+            failed.return_value = True
+            self.assertTrue(meta.failed(sid))
+            self.assertTrue(meta.failed(sid))
+            self.assertEqual(failed.call_count, 1)
+
+    def test_legacy(self):
+        """
+        Compare with the old implementation based on smartRemoveKeepFirst.
+        """
+        rnd = random.Random(42)
+        now = datetime(2016, 4, 24, 21, 51, 34)
+        start = datetime(2013, 1, 1)
+        stamps = set()
+        while len(stamps) < 300:
+            stamps.add(start + timedelta(seconds = rnd.randrange(int((now - start).total_seconds()))))
+        sids = sorted((snapshots.SID(i, self.cfg) for i in stamps), reverse = True)
+        failed = set(rnd.sample(sids, 60))
+        meta = retention.SnapshotMeta(dict((sid.sid, {'failed': sid in failed, 'name': ''})
+                                           for sid in sids))
+
+        for keep_all, per_day, per_week, per_month in ((2, 7, 4, 24), (0, 14, 52, 0), (30, 0, 0, 6)):
+            with patch.object(snapshots.SID, 'failed', new_callable = unittest.mock.PropertyMock) as mock:
+                mock.side_effect = lambda: False
+                legacy = self.legacyKeep(sids, failed, now.date(), keep_all, per_day, per_week, per_month)
+            planner = retention.RetentionPlanner(now.date(), keep_all, per_day, per_week, per_month)
+            keep, remove = planner.plan(sids, meta)
+            self.assertSetEqual(set(keep), legacy)
+            self.assertListEqual(remove, [sid for sid in sids if sid not in legacy])
+
+    def legacyKeep(self, sids, failed, now, keep_all, per_day, per_week, per_month):
+        def keepFirst(d1, d2):
+            healthy = [sid for sid in sids if sid not in failed]
+            ret = self.sn.smartRemoveKeepFirst(healthy, d1, d2)
+            return ret or self.sn.smartRemoveKeepFirst(sids, d1, d2)
+
+        keep = set([sids[0]])
+        if keep_all > 0:
+            keep |= self.sn.smartRemoveKeepAll(sids,
+                                               now - timedelta(days = keep_all - 1),
+                                               now + timedelta(days = 1))
+        d = now
+        for i in range(per_day):
+            keep |= keepFirst(d, d + timedelta(days = 1))
+            d -= timedelta(days = 1)
+        d = now - timedelta(days = now.weekday() + 1)
+        for i in range(per_week):
+            keep |= keepFirst(d, d + timedelta(days = 8))
+            d -= timedelta(days = 7)
+        d1 = date(now.year, now.month, 1)
+        d2 = self.sn.incMonth(d1)
+        for i in range(per_month):
+            keep |= keepFirst(d1, d2)
+            d2 = d1
+            d1 = self.sn.decMonth(d1)
+        for year in range(sids[-1].date.year, now.year + 1):
+            keep |= keepFirst(date(year, 1, 1), date(year + 1, 1, 1))
+        return keep
+
+    def test_explain(self):
+        sids = self.sids('20160424-215134-123', '20160423-100000-123')
+        lines = list(retention.explain(sids, {sids[0]: ['last snapshot', 'foo']}))
+        self.assertListEqual(lines, ['20160424-215134-123  keep    last snapshot, foo',
+                                     '20160423-100000-123  remove'])
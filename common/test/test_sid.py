@@ -16,9 +16,11 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import bz2
 import sys
 import unittest
 import stat
+import shutil
 import re
 from datetime import date, datetime
 from test import generic
@@ -291,7 +293,7 @@ class TestSID(generic.SnapshotsTestCase):
         os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
         infoFile = os.path.join(self.snapshotPath,
                                 '20151219-010324-123',
-                                'fileinfo.bz2')
+                                'fileinfo.db')
 
         d = snapshots.FileInfoDict()
         d[b'/tmp']     = (123, b'foo', b'bar')
@@ -304,6 +306,57 @@ class TestSID(generic.SnapshotsTestCase):
         sid2 = snapshots.SID('20151219-010324-123', self.cfg)
         self.assertDictEqual(sid2.fileInfo, d)
 
+    def test_fileInfoLegacy(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        legacyFile = sid.path(sid.FILEINFO_LEGACY)
+        with bz2.BZ2File(legacyFile, 'wb') as f:
+            f.write(b'123 foo bar /tmp\n')
+            f.write(b'456 asdf qwer /tmp/foo\n')
+            f.write(b'789 root root /var\n')
+
+        d = snapshots.FileInfoDict()
+        d[b'/tmp']     = (123, b'foo', b'bar')
+        d[b'/tmp/foo'] = (456, b'asdf', b'qwer')
+        self.assertDictEqual(sid.fileInfoFor([b'/tmp']), d)
+
+        self.assertTrue(sid.convertFileInfo())
+        self.assertNotExists(legacyFile)
+        self.assertIsFile(sid.path(sid.FILEINFO))
+        d[b'/var'] = (789, b'root', b'root')
+        self.assertDictEqual(sid.fileInfo, d)
+        self.assertFalse(sid.convertFileInfo())
+
+    def test_convertFileInfo_readonly(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(sid.path())
+        with bz2.BZ2File(sid.path(sid.FILEINFO_LEGACY), 'wb') as f:
+            f.write(b'123 foo bar /tmp\n')
+        os.chmod(sid.path(), 0o555)
+        try:
+            self.assertTrue(sid.convertFileInfo())
+            self.assertIsFile(sid.path(sid.FILEINFO))
+            self.assertEqual(stat.S_IMODE(os.stat(sid.path()).st_mode), 0o555)
+        finally:
+            os.chmod(sid.path(), 0o755)
+
+    def test_fileInfoSubtree(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        d = snapshots.FileInfoDict()
+        d[b'/tmp']         = (1, b'foo', b'bar')
+        d[b'/tmp/foo']     = (2, b'foo', b'bar')
+        d[b'/tmp/foo/bar'] = (3, b'foo', b'bar')
+        d[b'/tmp/foo.bak'] = (4, b'foo', b'bar')
+        d[b'/tmp/foo0']    = (5, b'foo', b'bar')
+        d[b'/var']         = (6, b'foo', b'bar')
+        sid.fileInfo = d
+
+        sub = sid.fileInfoFor([b'/tmp/foo'])
+        self.assertEqual(set(sub.keys()),
+                         set((b'/', b'/tmp', b'/tmp/foo', b'/tmp/foo/bar')))
+        self.assertEqual(sub[b'/tmp/foo/bar'], (3, b'foo', b'bar'))
+
     @patch('logger.error')
     def test_fileInfoErrorRead(self, mock_logger):
         sid = snapshots.SID('20151219-010324-123', self.cfg)
@@ -345,9 +398,30 @@ class TestSID(generic.SnapshotsTestCase):
 
         sid.setLog('foo bar\nbaz')
         self.assertIsFile(logFile)
+        self.assertIsFile(sid.path(sid.LOG_INDEX))
 
         self.assertEqual('\n'.join(sid.log()), 'foo bar\nbaz')
 
+    def test_log_closes_reader(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        sid.setLog('foo bar\nbaz')
+        readers = []
+        def logReader():
+            readers.append(snapshots.SID.logReader(sid))
+            return readers[-1]
+        with patch.object(sid, 'logReader', side_effect = logReader):
+            self.assertEqual('\n'.join(sid.log()), 'foo bar\nbaz')
+            self.assertIsNone(readers[-1].log)
+
+            # stop reading early
+            lines = sid.log()
+            self.assertEqual(next(lines), 'foo bar')
+            self.assertIsNotNone(readers[-1].log)
+            lines.close()
+            self.assertIsNone(readers[-1].log)
+            self.assertIsNone(readers[-1].index)
+
     def test_log_filter(self):
         sid = snapshots.SID('20151219-010324-123', self.cfg)
         os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
@@ -544,6 +618,78 @@ class TestIterSnapshots(generic.SnapshotsTestCase):
         self.assertEqual(snapshots.lastSnapshot(self.cfg),
                          '20151219-040324-123')
 
+class TestSnapshotCatalog(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestSnapshotCatalog, self).setUp()
+
+        for i in ('20151219-010324-123',
+                  '20151219-020324-123'):
+            os.makedirs(os.path.join(self.snapshotPath, i, 'backup'))
+        self.catalog = snapshots.SnapshotCatalog(self.cfg)
+
+    def test_file_next_to_snapshots_path(self):
+        self.assertEqual(os.path.dirname(self.catalog.fileName),
+                         os.path.dirname(self.snapshotPath))
+
+    def test_refresh(self):
+        self.assertIsNone(self.catalog.load())
+        snapshots.listSnapshots(self.cfg)
+        self.assertIsFile(self.catalog.fileName)
+        entries = self.catalog.load()
+        self.assertCountEqual(entries.keys(), ['20151219-010324-123',
+                                               '20151219-020324-123'])
+        self.assertDictEqual(entries['20151219-010324-123'],
+                             {'name': '', 'failed': False, 'tag': '123', 'size': None})
+
+    def test_use_catalog(self):
+        snapshots.listSnapshots(self.cfg)
+        with patch('os.listdir', side_effect = OSError('must not scan')):
+            self.assertListEqual(snapshots.listSnapshots(self.cfg),
+                                 ['20151219-020324-123',
+                                  '20151219-010324-123'])
+
+    def test_outdated(self):
+        snapshots.listSnapshots(self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-030324-123', 'backup'))
+        self.assertIsNone(self.catalog.load())
+        self.assertListEqual(snapshots.listSnapshots(self.cfg),
+                             ['20151219-030324-123',
+                              '20151219-020324-123',
+                              '20151219-010324-123'])
+
+    def test_incomplete_snapshot(self):
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-030324-123'))
+        self.assertEqual(len(snapshots.listSnapshots(self.cfg)), 2)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-030324-123', 'backup'))
+        self.assertEqual(len(snapshots.listSnapshots(self.cfg)), 3)
+
+    def test_modify(self):
+        snapshots.listSnapshots(self.cfg)
+        with self.catalog.modify() as entries:
+            shutil.rmtree(os.path.join(self.snapshotPath, '20151219-010324-123'))
+            del entries['20151219-010324-123']
+        self.assertCountEqual(self.catalog.load().keys(), ['20151219-020324-123'])
+
+    def test_modify_outdated(self):
+        snapshots.listSnapshots(self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-030324-123', 'backup'))
+        with self.catalog.modify() as entries:
+            self.assertIsNone(entries)
+        self.assertIsNone(self.catalog.load())
+
+    def test_update_name(self):
+        snapshots.listSnapshots(self.cfg)
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        sid.name = 'foo'
+        self.assertEqual(self.catalog.entry(sid)['name'], 'foo')
+        sid.failed = True
+        self.assertTrue(self.catalog.entry(sid)['failed'])
+
+    def test_disabled(self):
+        self.cfg.setSnapshotCatalog(False)
+        snapshots.listSnapshots(self.cfg)
+        self.assertNotExists(self.catalog.fileName)
+
 class TestIterSnapshotsNonexistingSnapshotPath(generic.TestCaseSnapshotPath):
     def test_iterSnapshots(self):
         for item in snapshots.iterSnapshots(self.cfg):
@@ -17,11 +17,15 @@
 
 import os
 import sys
+import bz2
 import unittest
 import re
+from unittest import mock
 from test import generic
 from tempfile import TemporaryDirectory
 from datetime import datetime
+from threading import Thread
+from time import sleep
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import snapshotlog
@@ -136,6 +140,32 @@ Last snapshot didn't finish but can be continued.
         with open(self.logFile, 'rt') as f:
             self.assertEqual(f.read(), 'bar\n')
 
+    def test_append_threads(self):
+        log = snapshotlog.SnapshotLog(self.cfg)
+        threads = [Thread(target = lambda n: [log.append('{} {}'.format(n, i), 1) for i in range(100)],
+                          args = (n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        log.close()
+        with open(self.logFile, 'rt') as f:
+            lines = f.read().split('\n')[:-1]
+        self.assertCountEqual(lines, ['{} {}'.format(n, i) for n in range(4) for i in range(100)])
+        self.assertEqual(len(list(log.get())), 400)
+
+    def test_append_flush_interval(self):
+        log = snapshotlog.SnapshotLog(self.cfg)
+        with mock.patch.object(snapshotlog.LogWriter, 'FLUSH_INTERVAL', 0.05):
+            log.append('foo', 1)
+            for i in range(100):
+                if os.path.exists(self.logFile) and os.path.getsize(self.logFile):
+                    break
+                sleep(0.05)
+        with open(self.logFile, 'rt') as f:
+            self.assertEqual(f.read(), 'foo\n')
+        log.close()
+
     def test_get(self):
         log = snapshotlog.SnapshotLog(self.cfg)
 
@@ -190,3 +220,124 @@ Last snapshot didn't finish but can be continued.
 
         self.assertEqual('\n'.join(log.get(mode = snapshotlog.LogFilter.CHANGES, skipLines = 2)),
                          '[C] 456\n[C] 789\n[C] asd')
+
+    def test_index(self):
+        log = snapshotlog.SnapshotLog(self.cfg)
+        log.append('foo bar', 1)
+        log.append('[I] 123', 1)
+        log.append('[C] baz\n[E] bla', 1)
+        log.flush()
+        self.assertExists(self.logFile + '.idx')
+
+        with snapshotlog.LogReader(self.logFile, self.logFile + '.idx') as reader:
+            self.assertEqual(reader.indexed, 4)
+            self.assertEqual(reader.extra, b'')
+            self.assertEqual(reader.count(), 4)
+            self.assertEqual(reader.count(snapshotlog.LogFilter.ERROR_AND_CHANGES), 3)
+            self.assertListEqual(list(reader.iterLines(snapshotlog.LogFilter.ERROR)),
+                                 ['foo bar', '[E] bla'])
+
+    def test_index_rebuild(self):
+        with open(self.logFile, 'wt') as f:
+            f.write('foo\n[C] bar\n')
+        log = snapshotlog.SnapshotLog(self.cfg)
+        log.append('[C] baz', 1)
+        log.flush()
+
+        with snapshotlog.LogReader(self.logFile, self.logFile + '.idx') as reader:
+            self.assertEqual(reader.indexed, 3)
+            self.assertListEqual(list(reader.iterLines(snapshotlog.LogFilter.CHANGES)),
+                                 ['foo', '[C] bar', '[C] baz'])
+
+    def test_tail(self):
+        log = snapshotlog.SnapshotLog(self.cfg)
+        log.append('foo', 1)
+        log.append('[I] bar', 1)
+        log.flush()
+        self.assertEqual('\n'.join(log.get(mode = snapshotlog.LogFilter.CHANGES)), 'foo')
+        reader = log.logReader
+
+        log.append('[C] baz', 1)
+        log.append('[I] 123', 1)
+        log.flush()
+        self.assertListEqual(list(reader.tail(snapshotlog.LogFilter.CHANGES)), ['[C] baz'])
+        self.assertFalse(reader.truncated)
+        self.assertListEqual(list(reader.tail(snapshotlog.LogFilter.CHANGES)), [])
+
+        log.new(datetime.today())
+        log.append('[C] new', 1)
+        log.flush()
+        lines = list(reader.tail(snapshotlog.LogFilter.CHANGES))
+        self.assertTrue(reader.truncated)
+        self.assertEqual(lines[-1], '[C] new')
+
+class TestLogReader(generic.TestCase):
+    def setUp(self):
+        super(TestLogReader, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.logFile = os.path.join(self.tmpDir.name, 'log')
+        self.indexFile = os.path.join(self.tmpDir.name, 'log.idx')
+
+    def tearDown(self):
+        super(TestLogReader, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def test_tag(self):
+        self.assertEqual(snapshotlog.LogIndex.tag(b'[E] foo'), b'E')
+        self.assertEqual(snapshotlog.LogIndex.tag(b'[C] foo'), b'C')
+        self.assertEqual(snapshotlog.LogIndex.tag(b'[I] foo'), b'I')
+        self.assertEqual(snapshotlog.LogIndex.tag(b'[X] foo'), b'[')
+        self.assertEqual(snapshotlog.LogIndex.tag(b'foo'), b' ')
+        self.assertEqual(snapshotlog.LogIndex.tag(b'\n'), b' ')
+
+    def test_records(self):
+        records, end = snapshotlog.LogIndex.records(b'foo\n[E] bar\nbaz', 10)
+        self.assertEqual(end, 22)
+        self.assertEqual(records, snapshotlog.LogIndex.RECORD.pack(14, b' ')
+                                  + snapshotlog.LogIndex.RECORD.pack(22, b'E'))
+
+    def test_no_index(self):
+        with open(self.logFile, 'wt') as f:
+            f.write('foo\n\n[E] bar\n[I] baz\n')
+        with snapshotlog.LogReader(self.logFile, self.indexFile) as reader:
+            self.assertEqual(reader.indexed, 0)
+            self.assertEqual(len(reader), 4)
+            self.assertListEqual(list(reader.iterLines(snapshotlog.LogFilter.ERROR)),
+                                 ['foo', '', '[E] bar'])
+            self.assertEqual(reader.position, 4)
+
+    def test_page(self):
+        with open(self.logFile, 'wt') as f:
+            for i in range(100):
+                f.write('[{}] {}\n'.format('CE'[i % 2], i))
+        with snapshotlog.LogReader(self.logFile, self.indexFile) as reader:
+            reader.BLOCK = 7
+            self.assertEqual(reader.count(snapshotlog.LogFilter.CHANGES), 50)
+            self.assertListEqual(reader.page(snapshotlog.LogFilter.CHANGES, 10, 3),
+                                 ['[C] 20', '[C] 22', '[C] 24'])
+            self.assertListEqual(reader.page(snapshotlog.LogFilter.CHANGES, 49, 3),
+                                 ['[C] 98'])
+            self.assertListEqual(reader.page(snapshotlog.LogFilter.CHANGES, 50, 3), [])
+            self.assertEqual(reader.skip(None, 95), 95)
+
+    def test_archive(self):
+        log = ''.join('[{}] line {}\n'.format('CEI'[i % 3], i) for i in range(1000))
+        with mock.patch.object(snapshotlog.LogIndex, 'CHUNK_SIZE', 100):
+            snapshotlog.writeArchive(log.encode(), self.logFile, self.indexFile)
+
+        # still readable as one normal bz2 file
+        with bz2.BZ2File(self.logFile, 'rb') as f:
+            self.assertEqual(f.read().decode(), log)
+
+        with snapshotlog.LogReader(self.logFile, self.indexFile, compressed = True) as reader:
+            self.assertGreater(len(reader.chunks), 100)
+            self.assertEqual(len(reader), 1000)
+            self.assertListEqual(reader.page(snapshotlog.LogFilter.ERROR, 300, 2),
+                                 ['[E] line 901', '[E] line 904'])
+            self.assertListEqual(list(reader.iterLines()), log.splitlines())
+
+    def test_archive_no_index(self):
+        with open(self.logFile, 'wb') as f:
+            f.write(bz2.compress(b'foo\n'))
+        with self.assertRaises(ValueError):
+            snapshotlog.LogReader(self.logFile, self.indexFile, compressed = True)
@@ -33,6 +33,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import config
 import snapshots
 import tools
+import progress
+import encfstools
 
 CURRENTUID = os.geteuid()
 CURRENTUSER = pwd.getpwuid(CURRENTUID).pw_name
@@ -86,6 +88,34 @@ class TestSnapshots(generic.SnapshotsTestCase):
         # test snapshot log
         self.assertEqual('\n'.join(self.sn.snapshotLog.get()), '[E] second message')
 
+    def test_setTakeSnapshotMessage_coalesce(self):
+        for i in range(5):
+            self.sn.setTakeSnapshotMessage(0, 'line {}'.format(i), coalesce = True)
+        # only the first one was sent, the latest one is pending
+        self.assertEqual(self.mockNotifyPlugin.call_count, 1)
+        with open(self.sn.config.takeSnapshotMessageFile(), 'rt') as f:
+            self.assertEqual(f.read(), '0\nline 0')
+
+        # errors are sent immediately
+        self.sn.setTakeSnapshotMessage(1, 'error', coalesce = True)
+        self.assertEqual(self.mockNotifyPlugin.call_count, 2)
+        self.sn.setTakeSnapshotMessage(0, 'line 5', coalesce = True)
+        self.sn.flushTakeSnapshotMessage()
+        with open(self.sn.config.takeSnapshotMessageFile(), 'rt') as f:
+            self.assertEqual(f.read(), '0\nline 5')
+        self.assertDictEqual({k: v for k, v in self.sn.messageStats.items() if k != 'seconds'},
+                             {'messages': 7, 'sent': 3, 'coalesced': 4})
+
+        # every message is still in the log
+        self.sn.snapshotLog.flush()
+        self.assertEqual(len(list(self.sn.snapshotLog.get())), 7)
+
+    def test_setTakeSnapshotMessage_no_coalesce(self):
+        self.cfg.setMessageRate(0)
+        for i in range(3):
+            self.sn.setTakeSnapshotMessage(0, 'line {}'.format(i), coalesce = True)
+        self.assertEqual(self.mockNotifyPlugin.call_count, 3)
+
     ############################################################################
     ###                              uid                                     ###
     ############################################################################
@@ -234,6 +264,71 @@ class TestSnapshots(generic.SnapshotsTestCase):
             path = os.path.join(d, 'foo', 'bar')
             self.assertTrue(self.sn.makeDirs(path))
 
+    def test_linkDestCandidates(self):
+        sids = []
+        for i in range(4):
+            sid = snapshots.SID('2015121{}-010324-123'.format(i), self.cfg)
+            sid.makeDirs()
+            sids.insert(0, sid)
+        os.makedirs(sids[3].pathBackup('media', 'usb'))
+        include = [('/home', 0), ('/media/usb', 0), ('/opt', 0)]
+
+        self.assertListEqual(self.sn.linkDestCandidates([], include), [])
+        self.cfg.setLinkDestCount(1)
+        self.assertListEqual(self.sn.linkDestCandidates(sids, include), sids[:1])
+        # oldest snapshot is the last one with /media/usb
+        self.cfg.setLinkDestCount(2)
+        self.assertListEqual(self.sn.linkDestCandidates(sids, include),
+                             [sids[0], sids[3]])
+        self.cfg.setLinkDestCount(3)
+        self.assertListEqual(self.sn.linkDestCandidates(sids, include),
+                             [sids[0], sids[1], sids[3]])
+        self.cfg.setLinkDestCount(50)
+        self.assertListEqual(self.sn.linkDestCandidates(sids, include), sids)
+
+    def test_linkDestCandidates_missing_include(self):
+        sids = []
+        for i in range(6):
+            sid = snapshots.SID('2015121{}-010324-123'.format(i), self.cfg)
+            sid.makeDirs()
+            sids.insert(0, sid)
+        os.makedirs(sids[5].pathBackup('media', 'usb'))
+        self.cfg.setLinkDestCount(2)
+
+        # include is in no snapshot. Only search a limited number of snapshots
+        with patch.object(snapshots.Snapshots, 'LINK_DEST_SEARCH', 3), \
+             patch('os.path.lexists', wraps = os.path.lexists) as lexists:
+            self.assertListEqual(self.sn.linkDestCandidates(sids, [('/new', 0)]), sids[:2])
+            self.assertEqual(lexists.call_count, 4)
+
+            # last seen in a snapshot older than the search limit
+            self.assertListEqual(self.sn.linkDestCandidates(sids, [('/media/usb', 0)]), sids[:2])
+        self.assertListEqual(self.sn.linkDestCandidates(sids, [('/media/usb', 0)]),
+                             [sids[0], sids[5]])
+
+    def test_filter_deep_check(self):
+        path = '/foo/bar'
+        sids = []
+        for i, content in enumerate(('bar', None, 'baz', 'bar')):
+            sid = snapshots.SID('2015121{}-010324-123'.format(i), self.cfg)
+            sid.makeDirs('foo')
+            if content is None:
+                os.link(sids[0].pathBackup(path), sid.pathBackup(path))
+            else:
+                with open(sid.pathBackup(path), 'wt') as f:
+                    f.write(content)
+            sids.append(sid)
+        os.utime(sids[3].pathBackup(path), times = (0, 0))
+
+        self.assertListEqual(self.sn.filter(sids[0], path, sids,
+                                            list_diff_only = True,
+                                            flag_deep_check = True),
+                             [sids[0], sids[2]])
+        self.assertListEqual(self.sn.filter(sids[0], path, sids,
+                                            flag_deep_check = True,
+                                            list_equal_to = sids[0].pathBackup(path)),
+                             [sids[0], sids[1], sids[3]])
+
     ############################################################################
     ###                   rsync Ex-/Include and suffix                       ###
     ############################################################################
@@ -318,9 +413,122 @@ class TestSnapshots(generic.SnapshotsTestCase):
         self.assertTrue(self.run)
         self.assertTrue(self.sn.restorePermissionFailed)
 
-    @unittest.skip('Not yet implemented')
     def test_filterRsyncProgress(self):
-        pass
+        lines = [b'foo',
+                 b'        517.38K  26%   14.46MB/s    0:00:53',
+                 b'        1.00M  40%   2.00MB/s    0:00:10 (xfr#53, to-chk=169/452)',
+                 b'bar']
+        with patch.object(self.sn, 'publishProgress') as publish:
+            self.assertListEqual(self.sn.filterRsyncProgress(lines), [b'foo', b'bar'])
+            publish.assert_called_once_with(progress.ProgressFile.RSYNC, 40, '1.00M', '2.00MB/s')
+
+            publish.reset_mock()
+            self.assertListEqual(self.sn.filterRsyncProgress([b'foo']), [b'foo'])
+            publish.assert_not_called()
+
+    def test_mergeRsyncProgress(self):
+        self.assertTupleEqual(self.sn.mergeRsyncProgress([('1.00M', 20, '2.00MB/s'),
+                                                          ('512.00K', 40, '1.50MB/s')]),
+                              ('1.50M', 30, '3.50MB/s'))
+        self.assertTupleEqual(self.sn.mergeRsyncProgress([('1,00G', 100, '0.00kB/s')]),
+                              ('1.00G', 100, '0.00B/s'))
+
+    def test_splitIncludeFolders(self):
+        include = [('/foo', 0), ('/bar', 0), ('/foo/baz', 0), ('/foobar', 1), ('/qwe', 0)]
+        self.assertListEqual(self.sn.splitIncludeFolders(include, 1),
+                             [[('/bar', 0), ('/foo', 0), ('/foo/baz', 0), ('/foobar', 1), ('/qwe', 0)]])
+        self.assertListEqual(self.sn.splitIncludeFolders(include, 2),
+                             [[('/bar', 0), ('/foobar', 1)],
+                              [('/foo', 0), ('/foo/baz', 0), ('/qwe', 0)]])
+        self.assertEqual(len(self.sn.splitIncludeFolders(include, 10)), 4)
+        self.assertEqual(len(self.sn.splitIncludeFolders([('/', 0), ('/foo', 0)], 2)), 1)
+
+    def test_splitIncludeFolders_sibling_prefix(self):
+        # '/foo-bar' sorts between '/foo' and '/foo/baz' as plain string
+        include = [('/foo', 0), ('/foo-bar', 0), ('/foo/baz', 0)]
+        self.assertListEqual(self.sn.splitIncludeFolders(include, 3),
+                             [[('/foo', 0), ('/foo/baz', 0)], [('/foo-bar', 0)]])
+
+    def test_rsyncProtect(self):
+        self.assertListEqual(self.sn.rsyncProtect([('/foo/bar', 0), ('/foo/baz', 1), ('/qwe', 0)]),
+                             ['--filter=P /foo/bar',
+                              '--filter=P /foo',
+                              '--filter=P /foo/baz',
+                              '--filter=P /qwe'])
+
+    @patch('tools.Execute')
+    def test_rsyncCheckpointed(self, execute):
+        include = [('/foo', 0), ('/bar', 0), ('/qwe', 0)]
+        new = snapshots.NewSnapshot(self.cfg)
+        new.makeDirs()
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        checkpoint.setDone([('/bar', 0)])
+        # /foo fails, /qwe succeeds
+        execute.return_value.run.side_effect = [23, 0]
+        execute.return_value.printable_cmd = 'rsync'
+        self.sn.rsyncCheckpointed(new, checkpoint, include, ['rsync'], '/dest', [False, False])
+        self.assertEqual(execute.call_count, 2)
+        cmd = execute.call_args_list[0][0][0]
+        self.assertIn('--filter=P /bar', cmd)
+        self.assertIn('--filter=P /qwe', cmd)
+        self.assertIn('--include=/foo/', cmd)
+
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        self.assertTrue(checkpoint.load())
+        self.assertFalse(checkpoint.isDone([('/foo', 0)]))
+        self.assertTrue(checkpoint.isDone([('/bar', 0)]))
+        self.assertTrue(checkpoint.isDone([('/qwe', 0)]))
+
+    @patch('tools.Execute')
+    def test_rsyncCheckpointed_nested(self, execute):
+        # '/foo-bar' must not split '/foo' and '/foo/baz' into different waves
+        include = [('/foo', 0), ('/foo-bar', 0), ('/foo/baz', 0), ('/qwe', 0)]
+        self.cfg.setRsyncWorkers(2)
+        new = snapshots.NewSnapshot(self.cfg)
+        new.makeDirs()
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        execute.return_value.run.return_value = 0
+        execute.return_value.printable_cmd = 'rsync'
+        with patch.object(self.sn, 'rsyncParallel', return_value = [0, 0]) as parallel:
+            self.sn.rsyncCheckpointed(new, checkpoint, include, ['rsync'], '/dest', [False, False])
+        self.assertEqual(parallel.call_count, 1)
+        wave, protect = parallel.call_args[0][1], parallel.call_args[0][5]
+        self.assertListEqual(wave, [[('/foo', 0), ('/foo/baz', 0)], [('/foo-bar', 0)]])
+        self.assertListEqual(protect, [('/qwe', 0)])
+        self.assertEqual(execute.call_count, 1)
+        cmd = execute.call_args[0][0]
+        self.assertIn('--include=/qwe/', cmd)
+        self.assertIn('--filter=P /foo/baz', cmd)
+
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        self.assertTrue(checkpoint.load())
+        self.assertTrue(checkpoint.isDone([('/foo', 0), ('/foo/baz', 0)]))
+        self.assertTrue(checkpoint.isDone([('/foo-bar', 0)]))
+        self.assertTrue(checkpoint.isDone([('/qwe', 0)]))
+        self.assertEqual(len(checkpoint.done), 3)
+
+    def test_checkpoint(self):
+        new = snapshots.NewSnapshot(self.cfg)
+        new.makeDirs()
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        self.assertFalse(checkpoint.load())
+        checkpoint.setChanges()
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        self.assertTrue(checkpoint.load())
+        self.assertTrue(checkpoint.changes)
+        # filter rules changed
+        self.assertFalse(snapshots.Checkpoint(new, 'other').load())
+        checkpoint.remove()
+        self.assertNotExists(new.path(snapshots.Checkpoint.CHECKPOINT))
+
+    def test_rsyncCallback_checkpoint(self):
+        new = snapshots.NewSnapshot(self.cfg)
+        new.makeDirs()
+        self.sn.checkpoint = snapshots.Checkpoint(new, 'digest')
+        self.sn.rsyncCallback('BACKINTIME: >f+++++++++ foo', [False, False])
+        checkpoint = snapshots.Checkpoint(new, 'digest')
+        self.assertTrue(checkpoint.load())
+        self.assertTrue(checkpoint.changes)
 
     def test_rsyncCallback(self):
         params = [False, False]
@@ -361,6 +569,55 @@ class TestSnapshots(generic.SnapshotsTestCase):
         with open(self.cfg.takeSnapshotLogFile(), 'rt') as f:
             self.assertEqual('[I] Take snapshot (rsync: BACKINTIME: cd..t...... /foo/bar)\n', f.read())
 
+    def test_rsyncCallback_itemized(self):
+        params = [False, False, {}]
+
+        self.sn.rsyncCallback('BACKINTIME: >f+++++++++ rw-r--r-- 1000 100 foo/bar baz', params)
+        self.sn.rsyncCallback('BACKINTIME: cL+++++++++ rwxrwxrwx 1000 100 foo/link -> bar baz', params)
+        self.assertListEqual([False, True,
+                              {b'foo/bar baz': ('f', 'rw-r--r--', 1000, 100),
+                               b'foo/link': ('L', 'rwxrwxrwx', 1000, 100)}],
+                             params)
+        self.sn.snapshotLog.flush()
+        with open(self.cfg.takeSnapshotLogFile(), 'rt') as f:
+            self.assertIn('[C] >f+++++++++ foo/bar baz\n'
+                          '[I] Take snapshot (rsync: BACKINTIME: cL+++++++++ foo/link -> bar baz)\n'
+                          '[C] cL+++++++++ foo/link -> bar baz\n', f.read())
+
+    def test_collectItemizedPermission_arrows(self):
+        itemized = {}
+        for line in ('BACKINTIME: >f+++++++++ rw-r--r-- 1000 100 a -> b',
+                     'BACKINTIME: >f+++++++++ rw-r--r-- 1000 100 c => d',
+                     'BACKINTIME: hf+++++++++ rw-r--r-- 1000 100 e => f',
+                     'BACKINTIME: cL+++++++++ rwxrwxrwx 1000 100 g -> h => i'):
+            self.assertEqual(self.sn.collectItemizedPermission(itemized, line),
+                             line.replace(' rw-r--r-- 1000 100', '').replace(' rwxrwxrwx 1000 100', ''))
+        self.assertDictEqual(itemized,
+                             {b'a -> b': ('f', 'rw-r--r--', 1000, 100),
+                              b'c => d': ('f', 'rw-r--r--', 1000, 100),
+                              b'e':      ('f', 'rw-r--r--', 1000, 100),
+                              b'g':      ('L', 'rwxrwxrwx', 1000, 100)})
+
+    def test_rsyncCallback_dedupFiles(self):
+        params = [False, False, {}]
+        self.sn.dedupFiles = []
+
+        self.sn.rsyncCallback('BACKINTIME: >f+++++++++ rw-r--r-- 1000 100 foo/bar baz', params)
+        self.sn.rsyncCallback('BACKINTIME: >f.st...... rw-r--r-- 1000 100 foo/changed', params)
+        self.sn.rsyncCallback('BACKINTIME: cL+++++++++ rwxrwxrwx 1000 100 foo/link -> bar baz', params)
+        self.assertListEqual(self.sn.dedupFiles, ['foo/bar baz'])
+
+    def test_rsyncCallback_versionChanges(self):
+        params = [False, False]
+        self.sn.versionChanges = []
+
+        self.sn.rsyncCallback('BACKINTIME: >f+++++++++ foo/bar baz', params)
+        self.sn.rsyncCallback('BACKINTIME: >f.st...... foo/changed', params)
+        self.sn.rsyncCallback('BACKINTIME: .f...p..... foo/perms', params)
+        self.sn.rsyncCallback('BACKINTIME: cd+++++++++ foo/', params)
+        self.sn.rsyncCallback('BACKINTIME: cL+++++++++ foo/link -> bar baz', params)
+        self.assertListEqual(self.sn.versionChanges, ['foo/bar baz', 'foo/changed', 'foo/link'])
+
     def test_rsyncCallback_error(self):
         params = [False, False]
 
@@ -543,7 +800,7 @@ user.size=.+''', re.MULTILINE))
         #TODO: add test for save permissions over SSH (and one SSH-test for path with spaces)
         infoFilePath = os.path.join(self.snapshotPath,
                                     '20151219-010324-123',
-                                    'fileinfo.bz2')
+                                    'fileinfo.db')
 
         include = self.cfg.include()[0][0]
         with TemporaryDirectory(dir = include) as tmp:
@@ -565,6 +822,31 @@ user.size=.+''', re.MULTILINE))
             self.assertIn(tmp.encode(), fileInfo)
             self.assertIn(file_path.encode(), fileInfo)
 
+    def test_mergePermissions(self):
+        include = self.cfg.include()[0][0]
+        with TemporaryDirectory(dir = include) as tmp:
+            for name in ('new', 'unchanged'):
+                with open(os.path.join(tmp, name), 'wt') as f:
+                    f.write('foo')
+            tmp_b = tmp.encode()
+            itemized = {tmp_b.lstrip(b'/') + b'/': ('d', 'rwxr-x---', os.getuid(), os.getgid()),
+                        tmp_b.lstrip(b'/') + b'/new': ('f', 'rw-------', os.getuid(), os.getgid())}
+            previous = snapshots.FileInfoDict()
+            previous[tmp_b]                  = (1, b'foo', b'bar')
+            previous[tmp_b + b'/unchanged']  = (2, b'foo', b'bar')
+            previous[tmp_b + b'/deleted']    = (3, b'foo', b'bar')
+            previous[b'/not/included']       = (4, b'foo', b'bar')
+
+            d = self.sn.mergePermissions(itemized, previous, encfstools.Bounce())
+
+            user = self.sn.userName(os.getuid()).encode()
+            group = self.sn.groupName(os.getgid()).encode()
+            self.assertSetEqual(set(d.keys()),
+                                set((b'/', tmp_b, tmp_b + b'/new', tmp_b + b'/unchanged')))
+            self.assertTupleEqual(d[tmp_b], (stat.S_IFDIR | 0o750, user, group))
+            self.assertTupleEqual(d[tmp_b + b'/new'], (stat.S_IFREG | 0o600, user, group))
+            self.assertTupleEqual(d[tmp_b + b'/unchanged'], (2, b'foo', b'bar'))
+
     def test_collectPermission(self):
         # force permissions because different distributions will have different umask
         os.chmod(self.testDirFullPath, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH | stat.S_IXOTH)
@@ -709,6 +991,27 @@ class TestRestorePathInfo(generic.SnapshotsTestCase):
         self.assertEqual(s.st_uid, CURRENTUID)
         self.assertEqual(s.st_gid, CURRENTGID)
 
+    def test_restorePermissions(self):
+        user, group = CURRENTUSER.encode('utf-8','replace'), CURRENTGROUP.encode('utf-8','replace')
+        with TemporaryDirectory() as restore_to:
+            os.makedirs(os.path.join(restore_to, 'dir', 'sub'))
+            for name in ('a', os.path.join('sub', 'b'), 'unknown'):
+                with open(os.path.join(restore_to, 'dir', name), 'wt') as f:
+                    pass
+            os.chmod(os.path.join(restore_to, 'dir', 'unknown'), 0o604)
+            d = snapshots.FileInfoDict()
+            d[b'/orig/dir']       = (0o40750,  user, group)
+            d[b'/orig/dir/a']     = (0o100600, user, group)
+            d[b'/orig/dir/sub']   = (0o40700,  user, group)
+            d[b'/orig/dir/sub/b'] = (0o100640, user, group)
+            self.sn.restorePermissions([('/orig/dir', len('/orig'))], restore_to, d)
+            self.assertFalse(self.sn.restorePermissionFailed)
+            for name, mode in (('', 0o40750), ('a', 0o100600), ('sub', 0o40700),
+                               (os.path.join('sub', 'b'), 0o100640)):
+                self.assertEqual(os.stat(os.path.join(restore_to, 'dir', name)).st_mode, mode)
+            # not in the snapshot
+            self.assertEqual(os.stat(os.path.join(restore_to, 'dir', 'unknown')).st_mode, 0o100604)
+
 class TestDeletePath(generic.SnapshotsWithSidTestCase):
     def test_delete_file(self):
         self.assertExists(self.testFileFullPath)
@@ -753,6 +1056,64 @@ class TestRemoveSnapshot(generic.SnapshotsWithSidTestCase):
         self.sn.remove(self.sid)
         self.assertFalse(self.sid.exists())
 
+    def test_removeSnapshots(self):
+        sids = [self.sid]
+        for i in range(4):
+            sid = snapshots.SID('2015121{}-010324-123'.format(i), self.cfg)
+            os.makedirs(sid.pathBackup('foo'))
+            os.chmod(sid.pathBackup(), stat.S_IRUSR | stat.S_IXUSR)
+            sids.append(sid)
+        msg = []
+
+        self.cfg.setRemoveWorkers(3)
+        removed = self.sn.removeSnapshots(sids, log = msg.append)
+        self.assertCountEqual(removed, sids)
+        for sid in sids:
+            self.assertFalse(sid.exists())
+        self.assertEqual(msg[-1], 'Removing snapshots 5/5')
+        self.assertNotExists(self.cfg.takeSnapshotProgressFile())
+
+    def test_removeSnapshots_serial(self):
+        msg = []
+        self.cfg.setRemoveWorkers(1)
+        self.assertListEqual(self.sn.removeSnapshots([self.sid], log = msg.append, title = 'foo'),
+                             [self.sid])
+        self.assertFalse(self.sid.exists())
+        self.assertListEqual(msg, ['foo 1/1'])
+
+    def test_freeSpacePredicted(self):
+        self.cfg.setSnapshotUsage(True)
+        self.cfg.setMinFreeSpace(True, 100, config.Config.DISK_UNIT_MB)
+        self.cfg.setMinFreeInodes(False, 2)
+        sids = []
+        for i in range(3):
+            sid = snapshots.SID('2015121{}-010324-123'.format(i), self.cfg)
+            sid.makeDirs()
+            with open(sid.pathBackup('foo'), 'wb') as f:
+                f.write(b'x' * 1024 * 1024)
+            sids.append(sid)
+        sids.append(self.sid)
+
+        # 1.5 MiB missing
+        info = unittest.mock.Mock(f_frsize = 1024, f_bavail = 100 * 1024 - 1536,
+                                  f_files = 1000, f_favail = 1000)
+        with patch('os.statvfs', return_value = info):
+            remaining = self.sn.freeSpacePredicted(sids)
+        self.assertListEqual(remaining, sids[2:])
+        self.assertFalse(sids[0].exists())
+        self.assertFalse(sids[1].exists())
+        self.assertTrue(sids[2].exists())
+
+        # enough free space
+        info.f_bavail = 200 * 1024
+        with patch('os.statvfs', return_value = info):
+            self.assertListEqual(self.sn.freeSpacePredicted(sids[2:]), sids[2:])
+        self.assertTrue(sids[2].exists())
+
+    def test_freeSpacePredicted_disabled(self):
+        self.cfg.setSnapshotUsage(False)
+        self.assertIsNone(self.sn.freeSpacePredicted([self.sid, self.sid]))
+
 @unittest.skipIf(not generic.LOCAL_SSH, 'Skip as this test requires a local ssh server, public and private keys installed')
 class TestSshSnapshots(generic.SSHTestCase):
     def setUp(self):
@@ -57,7 +57,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'file with spaces')))
         self.assertExists(self.cfg.anacronSpoolFile())
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.db',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -102,6 +102,56 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid4.canOpenPath(os.path.join(self.include.name, 'foo', 'bar', 'baz')))
         self.assertTrue(sid4.canOpenPath(os.path.join(self.include.name, 'test')))
 
+    @patch('time.sleep') # speed up unittest
+    def test_takeSnapshot_checksum_slices(self, sleep):
+        self.cfg.setChecksumSlices(1)
+        now = datetime.today() - timedelta(minutes = 2)
+        sid1 = snapshots.SID(now, self.cfg)
+        self.assertListEqual([True, False], self.sn.takeSnapshot(sid1, now, [(self.include.name, 0),]))
+        self.assertEqual(sid1.info.intValue('checksum_slice', -1), 0)
+        self.assertEqual(sid1.info.intValue('checksum_slices'), 1)
+
+        # same size and mtime but different content is only found by checksum
+        test = os.path.join(self.include.name, 'test')
+        st = os.stat(test)
+        with open(test, 'wt') as f:
+            f.write('BAR')
+        os.utime(test, ns = (st.st_atime_ns, st.st_mtime_ns))
+
+        now = datetime.today()
+        sid2 = snapshots.SID(now, self.cfg)
+        self.assertListEqual([True, False], self.sn.takeSnapshot(sid2, now, [(self.include.name, 0),]))
+        with open(sid2.pathBackup(test), 'rt') as f:
+            self.assertEqual(f.read(), 'BAR')
+        self.assertNotEqual(self.getInode(sid1), self.getInode(sid2))
+
+    @patch('time.sleep') # speed up unittest
+    def test_takeSnapshot_checksum_store_and_slices(self, sleep):
+        # slices are ignored with 'Use checksum'. All suspects of the
+        # checksum store must be compared, not only those in the current slice
+        self.cfg.setUseChecksum(True)
+        self.cfg.setChecksumStore(True)
+        self.cfg.setChecksumSlices(3)
+        now = datetime.today() - timedelta(minutes = 2)
+        sid1 = snapshots.SID(now, self.cfg)
+        self.assertListEqual([True, False], self.sn.takeSnapshot(sid1, now, [(self.include.name, 0),]))
+
+        changed = [os.path.join(self.include.name, 'test'),
+                   os.path.join(self.include.name, 'file with spaces')]
+        for path in changed:
+            st = os.stat(path)
+            with open(path, 'wt') as f:
+                f.write('BAR')
+            os.utime(path, ns = (st.st_atime_ns, st.st_mtime_ns))
+
+        now = datetime.today()
+        sid2 = snapshots.SID(now, self.cfg)
+        self.assertListEqual([True, False], self.sn.takeSnapshot(sid2, now, [(self.include.name, 0),]))
+        for path in changed:
+            with open(sid2.pathBackup(path), 'rt') as f:
+                self.assertEqual(f.read(), 'BAR')
+        self.assertEqual(sid2.info.intValue('checksum_slice', -1), -1)
+
     @patch('time.sleep') # speed up unittest
     def test_takeSnapshot_with_spaces_in_include(self, sleep):
         now = datetime.today()
@@ -114,7 +164,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid1.canOpenPath(os.path.join(include, 'foo', 'bar', 'baz')))
         self.assertTrue(sid1.canOpenPath(os.path.join(include, 'test')))
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.db',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -135,7 +185,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertFalse(sid1.canOpenPath(os.path.join(self.include.name, 'foo', 'bar', 'baz')))
         self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'test')))
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.db',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -158,7 +208,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'test')))
         self.assertFalse(sid1.canOpenPath(exclude))
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.db',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -178,7 +228,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
             self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'foo', 'bar', 'baz')))
             self.assertFalse(sid1.canOpenPath(os.path.join(self.include.name, 'test')))
             for f in ('config',
-                      'fileinfo.bz2',
+                      'fileinfo.db',
                       'info',
                       'takesnapshot.log.bz2',
                       'failed'):
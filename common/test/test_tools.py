@@ -23,12 +23,14 @@ import gzip
 import stat
 import signal
 import unittest
+import functools
 from unittest.mock import patch
 from copy import deepcopy
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from datetime import datetime
 from test import generic
 from time import sleep
+from threading import Thread
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import tools
@@ -372,6 +374,62 @@ class TestTools(generic.TestCase):
                               'symtimes',
                               'prealloc'])
 
+    def test_rsyncCaps_cache(self):
+        with TemporaryDirectory() as d:
+            binary = os.path.join(d, 'rsync')
+            cacheFile = os.path.join(d, 'rsync_caps.json')
+            with open(binary, 'wt') as f:
+                f.write('foo')
+            with patch('tools.which', return_value = binary), \
+                 patch('subprocess.Popen') as mock_popen:
+                mock_popen.return_value.communicate.return_value = (RSYNC_310_VERSION, None)
+                caps = tools.rsyncCaps(cacheFile = cacheFile)
+                self.assertIn('progress2', caps)
+                self.assertEqual(mock_popen.call_count, 1)
+                self.assertIsFile(cacheFile)
+
+                # in memory
+                self.assertListEqual(tools.rsyncCaps(cacheFile = cacheFile), caps)
+                self.assertEqual(mock_popen.call_count, 1)
+
+                # from cache file
+                tools._RSYNC_CAPS.clear()
+                self.assertListEqual(tools.rsyncCaps(cacheFile = cacheFile), caps)
+                self.assertEqual(mock_popen.call_count, 1)
+
+                # binary changed
+                os.utime(binary, (0, 0))
+                mock_popen.return_value.communicate.return_value = (RSYNC_307_VERSION, None)
+                self.assertNotIn('progress2', tools.rsyncCaps(cacheFile = cacheFile))
+                self.assertEqual(mock_popen.call_count, 2)
+        tools._RSYNC_CAPS.clear()
+
+    def test_writeRsyncCapsCache_concurrent(self):
+        with TemporaryDirectory() as d:
+            cacheFile = os.path.join(d, 'rsync_caps.json')
+            caches = [{'local': {str(i): ['x' * 1000] * 100}, 'remote': {}} for i in range(8)]
+            threads = [Thread(target = tools.writeRsyncCapsCache, args = (cacheFile, cache))
+                       for cache in caches]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertIn(tools.readRsyncCapsCache(cacheFile), caches)
+            self.assertListEqual(os.listdir(d), ['rsync_caps.json'])
+
+    def test_remoteRsyncCaps(self):
+        with TemporaryDirectory() as d:
+            cacheFile = os.path.join(d, 'rsync_caps.json')
+            self.assertIsNone(tools.remoteRsyncCaps(cacheFile, 'foo@bar:22'))
+
+            tools.setRemoteRsyncCaps(cacheFile, 'foo@bar:22', ['ACLs', 'xattrs'])
+            tools._RSYNC_CAPS.clear()
+            self.assertListEqual(tools.remoteRsyncCaps(cacheFile, 'foo@bar:22'),
+                                 ['ACLs', 'xattrs'])
+            self.assertIsNone(tools.remoteRsyncCaps(cacheFile, 'foo@baz:22'))
+            self.assertIsNone(tools.remoteRsyncCaps(cacheFile, 'foo@bar:22', ttl = -1))
+        tools._RSYNC_CAPS.clear()
+
     @unittest.skip('Not yet implemented')
     def test_rsyncPrefix(self):
         pass
@@ -478,6 +536,13 @@ class TestTools(generic.TestCase):
     def test_wrapLine(self):
         pass
 
+    def test_formatBytes(self):
+        self.assertEqual(tools.formatBytes(0), '0 B')
+        self.assertEqual(tools.formatBytes(1023), '1023 B')
+        self.assertEqual(tools.formatBytes(1536), '1.5 KiB')
+        self.assertEqual(tools.formatBytes(3 * 1024**3), '3.0 GiB')
+        self.assertEqual(tools.formatBytes(2048 * 1024**4), '2048.0 TiB')
+
     def test_syncfs(self):
         self.assertTrue(tools.syncfs())
 
@@ -609,6 +674,37 @@ class TestTools(generic.TestCase):
         self.assertEqual(tools.camelCase('foo_bar'), 'FooBar')
         self.assertEqual(tools.camelCase('foo_Bar'), 'FooBar')
 
+    def test_removeTree(self):
+        with TemporaryDirectory() as d:
+            outside = os.path.join(d, 'outside')
+            os.makedirs(outside)
+            with open(os.path.join(outside, 'keep'), 'wt') as f:
+                f.write('foo')
+            root = os.path.join(d, 'root')
+            sub = os.path.join(root, 'a', 'b')
+            os.makedirs(sub)
+            for i in range(5):
+                with open(os.path.join(sub, str(i)), 'wt') as f:
+                    f.write('bar')
+            os.symlink(outside, os.path.join(root, 'a', 'link'))
+            for path in (sub, os.path.dirname(sub), root):
+                os.chmod(path, stat.S_IRUSR | stat.S_IXUSR)
+
+            counted = []
+            self.assertEqual(tools.removeTree(root, counted.append, interval = 2), 9)
+            self.assertEqual(sum(counted), 9)
+            self.assertGreater(len(counted), 1)
+            self.assertNotExists(root)
+            self.assertExists(os.path.join(outside, 'keep'))
+
+            with open(root, 'wt') as f:
+                f.write('foo')
+            self.assertEqual(tools.removeTree(root), 1)
+            self.assertNotExists(root)
+
+            with self.assertRaises(FileNotFoundError):
+                tools.removeTree(root)
+
 class TestToolsEnviron(generic.TestCase):
     def __init__(self, *args, **kwargs):
         super(TestToolsEnviron, self).__init__(*args, **kwargs)
@@ -794,6 +890,57 @@ class TestToolsUniquenessSet(generic.TestCase):
             self.assertTrue(uniqueness.check(t2))
             self.assertFalse(uniqueness.check(t3))
 
+    def test_checkMany(self):
+        with TemporaryDirectory() as d:
+            paths = [os.path.join(d, str(i)) for i in range(6)]
+            for i, content in enumerate(('bar', 'baz', 'bar', 'foobar', None, '42')):
+                if content is None:
+                    os.link(paths[1], paths[i])
+                    continue
+                with open(paths[i], 'wt') as f:
+                    f.write(content)
+            os.utime(paths[2], times = (0, 0))
+
+            uniqueness = tools.UniquenessSet(dc = True,
+                                             follow_symlink = False,
+                                             list_equal_to = '')
+            self.assertListEqual(list(uniqueness.checkMany(paths)),
+                                 [(paths[0], True),
+                                  (paths[1], True),
+                                  (paths[2], False),
+                                  (paths[3], True),
+                                  (paths[4], False),
+                                  (paths[5], True)])
+
+            uniqueness = tools.UniquenessSet(dc = True,
+                                             follow_symlink = False,
+                                             list_equal_to = paths[1])
+            self.assertListEqual([ok for path, ok in uniqueness.checkMany(paths)],
+                                 [False, True, False, False, True, False])
+
+    @patch('tools.fileDigest', side_effect = tools.fileDigest)
+    def test_checkMany_cache(self, fileDigest):
+        with TemporaryDirectory() as d:
+            cacheFile = os.path.join(d, 'digests.db')
+            paths = [os.path.join(d, str(i)) for i in range(3)]
+            for path in paths:
+                with open(path, 'wt') as f:
+                    f.write('bar')
+            os.link(paths[0], os.path.join(d, 'link'))
+            paths.append(os.path.join(d, 'link'))
+
+            uniqueness = tools.UniquenessSet(dc = True, cacheFile = cacheFile)
+            self.assertListEqual([ok for path, ok in uniqueness.checkMany(paths)],
+                                 [True, False, False, False])
+            # hardlink is not hashed again
+            self.assertEqual(fileDigest.call_count, 3)
+
+            fileDigest.reset_mock()
+            uniqueness = tools.UniquenessSet(dc = True, cacheFile = cacheFile)
+            self.assertListEqual([ok for path, ok in uniqueness.checkMany(paths)],
+                                 [True, False, False, False])
+            fileDigest.assert_not_called()
+
 class TestToolsExecuteSubprocess(generic.TestCase):
     # new method with subprocess
     def test_returncode(self):
@@ -823,6 +970,69 @@ class TestToolsExecuteSubprocess(generic.TestCase):
         proc = tools.Execute(['true'])
         self.assertTrue(proc.pausable)
 
+class TestToolsExecutePipeline(generic.TestCase):
+    def setUp(self):
+        super(TestToolsExecutePipeline, self).setUp()
+        self.cmd = ['seq', '1', '100000']
+        self.expected = [str(i) for i in range(1, 100001)]
+
+    def test_callback(self):
+        lines = []
+        c = lambda x, y: lines.append((x, y))
+        self.assertEqual(tools.Execute(['printf', 'foo\\n\\nbar'], callback = c,
+                                       user_data = 1, pipeline = True).run(), 0)
+        self.assertListEqual(lines, [('foo', 1), ('bar', 1)])
+
+    def test_order(self):
+        lines = []
+        tools.Execute(self.cmd, callback = lambda x, y: lines.append(x),
+                      pipeline = True).run()
+        self.assertListEqual(lines, self.expected)
+
+    def test_filters(self):
+        @tools.batchFilter
+        def batch(lines):
+            self.assertIsInstance(lines[0], bytes)
+            return [line for line in lines if not line.endswith(b'0')]
+        odd = lambda line: line if int(line) % 2 else None
+        expected = [i for i in self.expected if not i.endswith('0') and int(i) % 2]
+        for pipeline in (True, False):
+            lines = []
+            tools.Execute(self.cmd, callback = lambda x, y: lines.append(x),
+                          filters = (batch, odd), pipeline = pipeline).run()
+            self.assertListEqual(lines, expected)
+
+    def test_filters_partial(self):
+        @tools.batchFilter
+        def batch(lines, suffix):
+            return [line for line in lines if not line.endswith(suffix)]
+        lines = []
+        tools.Execute(self.cmd, callback = lambda x, y: lines.append(x),
+                      filters = (functools.partial(batch, suffix = b'0'),),
+                      pipeline = True).run()
+        self.assertListEqual(lines, [i for i in self.expected if not i.endswith('0')])
+
+    def test_bytes(self):
+        lines = []
+        tools.Execute(['echo', 'foo'], callback = lambda x, y: lines.append(x),
+                      conv_str = False, pipeline = True).run()
+        self.assertListEqual(lines, [b'foo'])
+
+class TestToolsExecuteParallel(generic.TestCase):
+    def test_returncode(self):
+        procs = [tools.Execute(['true']), tools.Execute(['false'])]
+        self.assertListEqual(tools.ExecuteParallel(procs).run(), [0, 1])
+
+    def test_callback(self):
+        lines = []
+        c = lambda x, y: lines.append((x, y))
+        procs = [tools.Execute(['printf', 'foo\\nbar\\n'], callback = c, user_data = 1),
+                 tools.Execute(['echo', 'baz'], callback = c, user_data = 2),
+                 tools.Execute(['true'], callback = c, user_data = 3)]
+        tools.ExecuteParallel(procs).run()
+        self.assertCountEqual(lines, [('foo', 1), ('bar', 1), ('baz', 2)])
+        self.assertLess(lines.index(('foo', 1)), lines.index(('bar', 1)))
+
 class TestToolsExecuteOsSystem(generic.TestCase):
     # old method with os.system
     def test_returncode(self):
@@ -0,0 +1,103 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import usage
+
+
+class TestSnapshotUsage(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestSnapshotUsage, self).setUp()
+        self.db = usage.SnapshotUsage(self.cfg)
+        self.sid1 = self.makeSnapshot('20151219-010324-123')
+        with open(self.sid1.pathBackup('shared'), 'wb') as f:
+            f.write(b'x' * 100000)
+        with open(self.sid1.pathBackup('only1'), 'wb') as f:
+            f.write(b'x' * 100000)
+        self.sid2 = self.makeSnapshot('20151219-020324-123')
+        os.link(self.sid1.pathBackup('shared'), self.sid2.pathBackup('shared'))
+        with open(self.sid2.pathBackup('only2'), 'wb') as f:
+            f.write(b'x' * 100000)
+        self.size = os.lstat(self.sid1.pathBackup('shared')).st_blocks * 512
+
+    def makeSnapshot(self, name):
+        sid = snapshots.SID(name, self.cfg)
+        sid.makeDirs()
+        return sid
+
+    def test_update(self):
+        sizes = self.db.update([self.sid1, self.sid2])
+        u1, u2 = sizes[str(self.sid1)], sizes[str(self.sid2)]
+        self.assertEqual(u1.shared, self.size)
+        self.assertEqual(u2.shared, self.size)
+        self.assertGreaterEqual(u1.exclusive, self.size)
+        self.assertEqual(u1.total, u1.exclusive + u1.shared)
+        # snapshot folder, backup folder and two files
+        self.assertEqual(u1.inodes, 4)
+        self.assertDictEqual(self.db.sizes(), sizes)
+
+    def test_update_incremental(self):
+        sizes = self.db.update([self.sid1])
+        self.assertEqual(sizes[str(self.sid1)].shared, 0)
+
+        scanned = []
+        sizes = self.db.update([self.sid1, self.sid2], scanned.append)
+        self.assertListEqual(scanned, [self.sid2])
+        self.assertEqual(sizes[str(self.sid1)].shared, self.size)
+
+        # nothing new to scan
+        scanned = []
+        self.db.update([self.sid1, self.sid2], scanned.append)
+        self.assertListEqual(scanned, [])
+
+        # shared inodes become exclusive after the other snapshot was removed
+        sizes = self.db.update([self.sid2], scanned.append)
+        self.assertListEqual(scanned, [])
+        self.assertNotIn(str(self.sid1), sizes)
+        self.assertEqual(sizes[str(self.sid2)].shared, 0)
+        self.assertGreaterEqual(sizes[str(self.sid2)].exclusive, 2 * self.size)
+
+    def test_predictRemoval(self):
+        sizes = self.db.update([self.sid1, self.sid2])
+        freed = self.db.predictRemoval([self.sid1, self.sid2])
+        # shared file is only freed together with the second snapshot
+        self.assertEqual(freed[0], (sizes[str(self.sid1)].exclusive, 3))
+        self.assertEqual(freed[1], (sizes[str(self.sid1)].total +
+                                    sizes[str(self.sid2)].exclusive, 7))
+
+        # nothing is shared with kept snapshots
+        freed = self.db.predictRemoval([self.sid2])
+        self.assertEqual(freed, [(sizes[str(self.sid2)].exclusive, 3)])
+
+    def test_sizes_no_database(self):
+        self.assertDictEqual(self.db.sizes(), {})
+
+    def test_reset_on_new_path(self):
+        self.db.update([self.sid1])
+        self.db.path = os.path.join(self.db.path, 'backintime')
+        os.makedirs(self.db.path)
+        sizes = self.db.update([])
+        self.assertDictEqual(sizes, {})
+
+if __name__ == '__main__':
+    unittest.main()
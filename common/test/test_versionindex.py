@@ -0,0 +1,108 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import shutil
+import unittest
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import versionindex
+from fileinfo import FileInfoDict
+
+FOLDER = (0o40755, b'root', b'root')
+FILE = (0o100644, b'root', b'root')
+
+class TestVersionIndex(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestVersionIndex, self).setUp()
+        self.cfg.setVersionIndex(True)
+        self.index = versionindex.VersionIndex(self.cfg)
+        self.sids = []
+        # bar is changed in sid2, removed in sid3 and back in sid4
+        self.addSnapshot(None, {b'/foo': FOLDER, b'/foo/bar': FILE})
+        self.addSnapshot(['foo/bar'], {b'/foo': FOLDER, b'/foo/bar': FILE})
+        self.addSnapshot([], {b'/foo': FOLDER})
+        self.addSnapshot([], {b'/foo': FOLDER, b'/foo/bar': FILE})
+
+    def addSnapshot(self, changed, paths):
+        sid = snapshots.SID('2015121{}-010324-123'.format(len(self.sids) + 1), self.cfg)
+        sid.makeDirs()
+        d = FileInfoDict()
+        d.update(paths)
+        sid.fileInfo = d
+        prev = self.sids[0] if self.sids and changed is not None else None
+        self.index.add(sid, prev, changed or [], self.sids)
+        self.sids.insert(0, sid)
+        return sid
+
+    def history(self, path, sids = None):
+        if sids is None:
+            sids = self.sids
+        return self.index.history(path, sids, snapshots.listSnapshots(self.cfg))
+
+    def test_history(self):
+        self.assertListEqual(self.history('/foo/bar'),
+                             [(3, 'f'), None, (1, 'f'), (0, 'f')])
+        self.assertListEqual(self.history('/foo'),
+                             [(0, 'd')] * 4)
+        self.assertListEqual(self.history('/baz'), [None] * 4)
+
+    def test_history_base(self):
+        # not compared with the newest snapshot
+        self.addSnapshot(None, {b'/foo': FOLDER, b'/foo/bar': FILE})
+        self.assertListEqual(self.history('/foo/bar')[:2], [(4, 'f'), (3, 'f')])
+
+    def test_history_not_indexed(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        sid.makeDirs()
+        self.assertIsNone(self.history('/foo/bar', [sid] + self.sids))
+
+    def test_history_removed(self):
+        sid4, sid3, sid2, sid1 = self.sids
+        shutil.rmtree(sid3.path())
+        # deletion of bar is moved into sid4 which has its own change
+        self.assertListEqual(self.history('/foo/bar', [sid4, sid2, sid1]),
+                             [(2, 'f'), (1, 'f'), (0, 'f')])
+        shutil.rmtree(sid1.path())
+        # sid2 is the new base and still contains foo
+        self.assertListEqual(self.history('/foo', [sid4, sid2]), [(0, 'd')] * 2)
+        self.assertListEqual(self.history('/foo/bar', [sid4, sid2]),
+                             [(1, 'f'), (0, 'f')])
+
+    def test_filter(self):
+        for sid in self.sids:
+            if b'/foo/bar' in sid.fileInfo:
+                os.makedirs(sid.pathBackup('foo'))
+                with open(sid.pathBackup('foo', 'bar'), 'wt') as f:
+                    f.write(sid.sid)
+        sid4, sid3, sid2, sid1 = self.sids
+        sn = snapshots.Snapshots(self.cfg)
+        self.assertListEqual(sn.filter(sid4, '/foo/bar', self.sids),
+                             [sid4, sid2, sid1])
+        self.assertListEqual(sn.filter(sid4, '/foo/bar', self.sids, list_diff_only = True),
+                             [sid4, sid2, sid1])
+        self.assertListEqual(sn.filter(sid4, '/foo', self.sids), self.sids)
+
+        # ignore the index if it is disabled
+        self.cfg.setVersionIndex(False)
+        self.assertListEqual(sn.filter(sid4, '/foo', self.sids), [sid4, sid2, sid1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,17 +18,23 @@
 
 import os
 import sys
+import stat
 import subprocess
 import shlex
 import signal
 import re
+import json
 import errno
 import gzip
 import tempfile
 import collections
 import hashlib
+import sqlite3
+import concurrent.futures
 import ipaddress
 import atexit
+import queue
+import threading
 from datetime import datetime
 from distutils.version import StrictVersion
 from time import sleep
@@ -511,22 +517,171 @@ def onBattery():
             pass
     return False
 
-def rsyncCaps(data = None):
+# rsync capabilities cached in memory. Keys are created by rsyncCapsKey
+_RSYNC_CAPS = {}
+
+# time in seconds after which cached capabilities of remote rsync expire
+REMOTE_RSYNC_CAPS_TTL = 24 * 60 * 60
+
+def rsyncCaps(data = None, cacheFile = None):
     """
     Get capabilities of the installed rsync binary. This can be different from
     version to version and also on build arguments used when building rsync.
 
+    Results are cached in memory and in ``cacheFile`` for every rsync binary.
+    The cache will be refreshed if inode or mtime of the binary change.
+
     Args:
-        data (str): 'rsync --version' output. This is just for unittests.
+        data (str):         'rsync --version' output which should be parsed
+                            instead of running the local rsync binary
+        cacheFile (str):    full path to the persistent cache file or ``None``
+                            to only cache in memory
 
     Returns:
         list:       List of str with rsyncs capabilities
     """
-    if not data:
+    if data:
+        return parseRsyncCaps(data)
+
+    key = rsyncCapsKey()
+    if key and key in _RSYNC_CAPS:
+        return list(_RSYNC_CAPS[key])
+
+    cache = readRsyncCapsCache(cacheFile)
+    if key and key in cache['local']:
+        caps = cache['local'][key]
+    else:
         proc = subprocess.Popen(['rsync', '--version'],
                                 stdout = subprocess.PIPE,
                                 universal_newlines = True)
-        data = proc.communicate()[0]
+        caps = parseRsyncCaps(proc.communicate()[0])
+        if key:
+            # drop old entries for the same binary
+            binary = key.rsplit(':', 2)[0]
+            cache['local'] = {k: v for k, v in cache['local'].items()
+                              if k.rsplit(':', 2)[0] != binary}
+            cache['local'][key] = caps
+            writeRsyncCapsCache(cacheFile, cache)
+    if key:
+        _RSYNC_CAPS[key] = caps
+    return list(caps)
+
+def rsyncCapsKey(binary = None):
+    """
+    Identify the rsync binary by its full path, inode and mtime.
+
+    Args:
+        binary (str):   full path to rsync. Search in 'PATH' environ if ``None``
+
+    Returns:
+        str:            cache key or ``None`` if rsync was not found
+    """
+    if binary is None:
+        binary = which('rsync')
+    if not binary:
+        return None
+    try:
+        st = os.stat(binary)
+    except OSError:
+        return None
+    return '{}:{}:{}'.format(binary, st.st_ino, st.st_mtime_ns)
+
+def remoteRsyncCaps(cacheFile, userHost, ttl = REMOTE_RSYNC_CAPS_TTL):
+    """
+    Get cached capabilities of rsync on a remote host. They are stored by
+    :py:func:`sshtools.SSH.checkRemoteRsyncCaps`.
+
+    Args:
+        cacheFile (str):    full path to the persistent cache file
+        userHost (str):     'user@host:port' of the remote host
+        ttl (int):          maximum age of the cached value in seconds
+
+    Returns:
+        list:               List of str with remote rsyncs capabilities or
+                            ``None`` if they are unknown or expired
+    """
+    key = 'remote:' + userHost
+    if key in _RSYNC_CAPS:
+        timestamp, caps = _RSYNC_CAPS[key]
+    else:
+        entry = readRsyncCapsCache(cacheFile)['remote'].get(userHost)
+        if not entry:
+            return None
+        timestamp, caps = entry
+        _RSYNC_CAPS[key] = (timestamp, caps)
+    if datetime.now().timestamp() - timestamp > ttl:
+        return None
+    return list(caps)
+
+def setRemoteRsyncCaps(cacheFile, userHost, caps):
+    """
+    Store capabilities of rsync on a remote host.
+
+    Args:
+        cacheFile (str):    full path to the persistent cache file
+        userHost (str):     'user@host:port' of the remote host
+        caps (list):        List of str with remote rsyncs capabilities
+    """
+    entry = (datetime.now().timestamp(), list(caps))
+    _RSYNC_CAPS['remote:' + userHost] = entry
+    cache = readRsyncCapsCache(cacheFile)
+    cache['remote'][userHost] = entry
+    writeRsyncCapsCache(cacheFile, cache)
+
+def readRsyncCapsCache(cacheFile):
+    """
+    Read the persistent rsync capabilities cache.
+
+    Args:
+        cacheFile (str):    full path to the cache file or ``None``
+
+    Returns:
+        dict:               ``{'local': {key: caps}, 'remote': {userHost: [timestamp, caps]}}``
+    """
+    cache = {'local': {}, 'remote': {}}
+    if cacheFile and os.path.exists(cacheFile):
+        try:
+            with open(cacheFile, 'rt') as f:
+                data = json.load(f)
+            cache['local'].update(data.get('local', {}))
+            cache['remote'].update(data.get('remote', {}))
+        except (OSError, ValueError, AttributeError) as e:
+            logger.debug('Failed to read rsync capabilities cache {}: {}'.format(cacheFile, str(e)))
+    return cache
+
+def writeRsyncCapsCache(cacheFile, cache):
+    """
+    Write the persistent rsync capabilities cache.
+
+    Args:
+        cacheFile (str):    full path to the cache file or ``None``
+        cache (dict):       cache as returned by :py:func:`readRsyncCapsCache`
+    """
+    if not cacheFile:
+        return
+    tmp = None
+    try:
+        # unique temp file, other processes might write the cache at the same time
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(cacheFile),
+                                   prefix = os.path.basename(cacheFile) + '.')
+        with os.fdopen(fd, 'wt') as f:
+            json.dump(cache, f)
+        os.replace(tmp, cacheFile)
+    except OSError as e:
+        logger.debug('Failed to write rsync capabilities cache {}: {}'.format(cacheFile, str(e)))
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+def parseRsyncCaps(data):
+    """
+    Parse capabilities from 'rsync --version' output.
+
+    Args:
+        data (str): 'rsync --version' output
+
+    Returns:
+        list:       List of str with rsyncs capabilities
+    """
     caps = []
     #rsync >= 3.1 does provide --info=progress2
     matchers = [r'rsync\s*version\s*(\d\.\d)', r'rsync\s*version\s*v(\d\.\d.\d)']
@@ -569,7 +724,16 @@ def rsyncPrefix(config,
         list:                   rsync command with all args but without
                                 --include, --exclude, source and destination
     """
-    caps = rsyncCaps()
+    caps = rsyncCaps(cacheFile = config.rsyncCapsCacheFile())
+    mode = config.snapshotsMode()
+    if mode in ['ssh', 'ssh_encfs'] and mode in use_mode:
+        # only use features which are supported on both sides
+        remoteCaps = remoteRsyncCaps(config.rsyncCapsCacheFile(),
+                                     '{}@{}:{}'.format(config.sshUser(),
+                                                       config.sshHost(),
+                                                       config.sshPort()))
+        if remoteCaps is not None:
+            caps = [i for i in caps if i in remoteCaps or i == 'progress2']
     cmd = []
     if config.nocacheOnLocal():
         cmd.append('nocache')
@@ -672,6 +836,74 @@ def rsyncRemove(config, run_local = True):
         cmd.extend(rsyncSshArgs(config))
     return cmd
 
+def removeTree(path, callback = None, interval = 1000):
+    """
+    Remove ``path`` and everything inside. Like :py:func:`shutil.rmtree` this
+    walks through the tree on file descriptors (``openat``, ``unlinkat``)
+    but it also makes read-only folders writable first, like
+    ``rsync --delete`` does for snapshots. Every entry is unlinked right
+    away and only checked with ``stat`` if that failed, so files don't need
+    an extra syscall.
+
+    Args:
+        path (str):         full path which should be removed
+        callback (method):  called with the number of entries removed since
+                            the last call every ``interval`` entries. This
+                            will be called in the current thread
+        interval (int):     number of entries between calls of ``callback``
+
+    Returns:
+        int:                number of removed entries
+
+    Raises:
+        OSError:            if something could not be removed
+    """
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        os.unlink(path)
+        return 1
+    flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+    if st.st_mode & stat.S_IRWXU != stat.S_IRWXU:
+        os.chmod(path, st.st_mode | stat.S_IRWXU)
+    fd = os.open(path, flags)
+    # list of tuples (folder fd, iterator over names, name in parent folder)
+    stack = [(fd, iter(os.listdir(fd)), None)]
+    count = reported = 0
+    try:
+        while stack:
+            fd, names = stack[-1][:2]
+            for name in names:
+                try:
+                    os.unlink(name, dir_fd = fd)
+                except (IsADirectoryError, PermissionError):
+                    # Linux returns EISDIR for folders, POSIX allows EPERM
+                    st = os.stat(name, dir_fd = fd, follow_symlinks = False)
+                    if not stat.S_ISDIR(st.st_mode):
+                        raise
+                    if st.st_mode & stat.S_IRWXU != stat.S_IRWXU:
+                        os.chmod(name, st.st_mode | stat.S_IRWXU, dir_fd = fd)
+                    sub = os.open(name, flags, dir_fd = fd)
+                    stack.append((sub, iter(os.listdir(sub)), name))
+                    break
+                count += 1
+                if callback and count - reported >= interval:
+                    callback(count - reported)
+                    reported = count
+            else:
+                fd, names, name = stack.pop()
+                os.close(fd)
+                if stack:
+                    os.rmdir(name, dir_fd = stack[-1][0])
+                    count += 1
+    finally:
+        for fd, names, name in stack:
+            os.close(fd)
+    os.rmdir(path)
+    count += 1
+    if callback:
+        callback(count - reported)
+    return count
+
 #TODO: check if we really need this
 def tempFailureRetry(func, *args, **kwargs):
     while True:
@@ -702,6 +934,27 @@ def md5sum(path):
             md5.update(data)
     return md5.hexdigest()
 
+def fileDigest(path, bufsize = 1024 * 1024):
+    """
+    Calculate a SHA-256 digest for file in ``path``. Unlike
+    :py:func:`md5sum` this returns the raw digest, which is smaller to store.
+
+    Args:
+        path (str):     full path to file
+        bufsize (int):  read the file in chunks of this size
+
+    Returns:
+        bytes:          digest of file
+
+    Raises:
+        OSError:        if ``path`` can not be read
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(bufsize), b''):
+            h.update(chunk)
+    return h.digest()
+
 def checkCronPattern(s):
     """
     Check if ``s`` is a valid cron pattern.
@@ -1027,6 +1280,24 @@ def wrapLine(msg, size=950, delimiters='\t ', new_line_indicator = 'CONTINUE: ')
                 line, msg = msg[:size], new_line_indicator + msg[size:]
             yield(line)
 
+def formatBytes(size):
+    """
+    Human readable representation of ``size`` with binary prefixes.
+
+    Args:
+        size (int): size in bytes
+
+    Returns:
+        str:        size like ``'1.5 MiB'``
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if abs(size) < 1024 or unit == 'TiB':
+            break
+        size /= 1024.0
+    if unit == 'B':
+        return '{} {}'.format(size, unit)
+    return '{:.1f} {}'.format(size, unit)
+
 def syncfs():
     """
     Sync any data buffered in memory to disk.
@@ -1358,13 +1629,93 @@ def fdDup(old, new_fd, mode = 'w'):
     except OSError as e:
         logger.debug('Failed to redirect {}: {}'.format(old, str(e)))
 
+class DigestCache(object):
+    """
+    Persistent cache of file digests created with :py:func:`fileDigest`.
+    Entries are keyed by device and inode and are only valid as long as size
+    and mtime didn't change. Files inside snapshots never change so their
+    digests only need to be calculated once.
+
+    Errors on the cache file are logged and the cache is disabled. It never
+    stops the caller from comparing files.
+
+    Args:
+        fileName (str): full path to the SQLite database
+    """
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS digests (dev INTEGER, ino INTEGER, '
+              'size INTEGER, mtime INTEGER, digest BLOB, '
+              'PRIMARY KEY (dev, ino)) WITHOUT ROWID')
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.conn = None
+        try:
+            self.conn = sqlite3.connect(fileName)
+            with self.conn:
+                self.conn.execute(self.SCHEMA)
+        except sqlite3.Error as e:
+            self.disable(e)
+
+    def disable(self, e):
+        logger.debug('Digest cache {} disabled: {}'.format(self.fileName, str(e)), self)
+        if self.conn:
+            self.conn.close()
+        self.conn = None
+
+    def get(self, st):
+        """
+        Cached digest of the file described by ``st``.
+
+        Args:
+            st (os.stat_result):    result of :py:func:`os.stat`
+
+        Returns:
+            bytes:                  digest or ``None`` if not cached
+        """
+        if not self.conn:
+            return None
+        try:
+            row = self.conn.execute('SELECT size, mtime, digest FROM digests '
+                                    'WHERE dev = ? AND ino = ?',
+                                    (st.st_dev, st.st_ino)).fetchone()
+        except sqlite3.Error as e:
+            self.disable(e)
+            return None
+        if row and row[:2] == (st.st_size, st.st_mtime_ns):
+            return row[2]
+        return None
+
+    def update(self, items):
+        """
+        Store digests.
+
+        Args:
+            items (list):   list of tuples (os.stat_result, bytes)
+        """
+        if not self.conn or not items:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)',
+                                      [(st.st_dev, st.st_ino, st.st_size,
+                                        st.st_mtime_ns, digest)
+                                       for st, digest in items])
+        except sqlite3.Error as e:
+            self.disable(e)
+
 class UniquenessSet:
     """
     Check for uniqueness or equality of files.
 
+    Deep check only compares file contents if the size is equal. Files with
+    the same device and inode are hardlinks and equal without reading them.
+    Digests are cached in memory per inode and in ``cacheFile`` across
+    sessions. Use :py:func:`checkMany` to hash multiple files on a thread
+    pool.
+
     Args:
         dc (bool):              if ``True`` use deep check which will compare
-                                files md5sums if they are of same size but no
+                                files digests if they are of same size but no
                                 hardlinks (don't have the same inode).
                                 If ``False`` use files size and mtime
         follow_symlink (bool):  if ``True`` check symlinks target instead of the
@@ -1372,20 +1723,80 @@ class UniquenessSet:
         list_equal_to (str):    full path to file. If not empty only return
                                 equal files to the given path instead of
                                 unique files.
+        cacheFile (str):        full path to the persistent digest cache or
+                                ``None`` to only cache in memory
+        workers (int):          number of threads used by
+                                :py:func:`checkMany` to hash files
     """
-    def __init__(self, dc = False, follow_symlink = False, list_equal_to = ''):
+    def __init__(self,
+                 dc = False,
+                 follow_symlink = False,
+                 list_equal_to = '',
+                 cacheFile = None,
+                 workers = 4):
         self.deep_check = dc
         self.follow_sym = follow_symlink
-        self._uniq_dict = {}      # if not self._uniq_dict[size] -> size already checked with md5sum
-        self._size_inode = set()  # if (size,inode) in self._size_inode -> path is a hlink
+        self.workers = workers
+        self._uniq_dict = {}      # if not self._uniq_dict[size] -> size already checked with digest
+        self._size_inode = set()  # if (size,dev,inode) in self._size_inode -> path is a hlink
+        self._digests = {}        # (dev,inode) -> digest
+        self._cache = DigestCache(cacheFile) if cacheFile and dc else None
+        self._unsaved = []        # new digests which are not in self._cache yet
         self.list_equal_to = list_equal_to
         if list_equal_to:
             st = os.stat(list_equal_to)
             if self.deep_check:
-                self.reference = (st.st_size, md5sum(list_equal_to))
+                self.reference = (st.st_size, self.digest(list_equal_to, st))
+                self.referenceInode = (st.st_dev, st.st_ino)
+                self.flush()
             else:
                 self.reference = (st.st_size, int(st.st_mtime))
 
+    def _path(self, input_path):
+        # follow symlinks ?
+        if self.follow_sym and os.path.islink(input_path):
+            return os.readlink(input_path)
+        return input_path
+
+    def digest(self, path, st, pending = None):
+        """
+        Digest of ``path``. Only read the file if neither the in-memory nor the
+        persistent cache know this inode.
+
+        Args:
+            path (str):             full path to file
+            st (os.stat_result):    result of :py:func:`os.stat` for ``path``
+            pending (dict):         ``(dev, inode)`` -> future of digests
+                                    which are currently calculated on a
+                                    thread pool
+
+        Returns:
+            bytes:                  digest of file
+        """
+        key = (st.st_dev, st.st_ino)
+        if key in self._digests:
+            return self._digests[key]
+        if pending and key in pending:
+            digest = pending.pop(key).result()
+        else:
+            digest = self._cache.get(st) if self._cache else None
+            if digest is None:
+                digest = fileDigest(path)
+            else:
+                st = None
+        if st and self._cache:
+            self._unsaved.append((st, digest))
+        self._digests[key] = digest
+        return digest
+
+    def flush(self):
+        """
+        Write new digests into the persistent cache.
+        """
+        if self._cache:
+            self._cache.update(self._unsaved)
+        self._unsaved = []
+
     def check(self, input_path):
         """
         Check file ``input_path`` for either uniqueness or equality
@@ -1400,15 +1811,74 @@ class UniquenessSet:
                                 Or ``True`` if file is equal to file in
                                 ``list_equal_to``
         """
-        # follow symlinks ?
-        path = input_path
-        if self.follow_sym and os.path.islink(input_path):
-            path = os.readlink(input_path)
+        path = self._path(input_path)
+        try:
+            if self.list_equal_to:
+                return self.checkEqual(path)
+            else:
+                return self.checkUnique(path)
+        finally:
+            self.flush()
+
+    def checkMany(self, input_paths):
+        """
+        Same as calling :py:func:`check` for every path in ``input_paths`` but
+        in deep check mode all files which need to be compared by content are
+        hashed in parallel. Results are yielded in the same order as
+        ``input_paths`` as soon as they are available.
+
+        Args:
+            input_paths (iterable): full paths to files
+
+        Yields:
+            tuple:                  (input_path, bool) with the result of
+                                    :py:func:`check`
+        """
+        if not self.deep_check:
+            for input_path in input_paths:
+                yield input_path, self.check(input_path)
+            return
 
+        items = []
+        for input_path in input_paths:
+            path = self._path(input_path)
+            items.append((input_path, path, os.stat(path)))
+
+        # only files which share their size with a different inode need to
+        # be hashed
         if self.list_equal_to:
-            return self.checkEqual(path)
+            needDigest = lambda st: st.st_size == self.reference[0] and \
+                                    (st.st_dev, st.st_ino) != self.referenceInode
         else:
-            return self.checkUnique(path)
+            inodes = collections.defaultdict(set)
+            for size, inode in self._size_inode:
+                inodes[size].add(inode)
+            for input_path, path, st in items:
+                inodes[st.st_size].add((st.st_dev, st.st_ino))
+            needDigest = lambda st: len(inodes[st.st_size]) > 1
+        todo = {}
+        for input_path, path, st in items:
+            key = (st.st_dev, st.st_ino)
+            if key in todo or key in self._digests or not needDigest(st):
+                continue
+            digest = self._cache.get(st) if self._cache else None
+            if digest is None:
+                todo[key] = path
+            else:
+                self._digests[key] = digest
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as pool:
+            pending = {key: pool.submit(fileDigest, path) for key, path in todo.items()}
+            try:
+                for input_path, path, st in items:
+                    if self.list_equal_to:
+                        yield input_path, self._checkEqual(path, st, pending)
+                    else:
+                        yield input_path, self._checkUnique(path, st, pending, needDigest(st))
+            finally:
+                for future in pending.values():
+                    future.cancel()
+                self.flush()
 
     def checkUnique(self, path):
         """
@@ -1420,33 +1890,33 @@ class UniquenessSet:
         Returns:
             bool:       ``True`` if file is unique
         """
-        # check
+        st = os.stat(path)
         if self.deep_check:
-            dum = os.stat(path)
-            size,inode  = dum.st_size, dum.st_ino
-            # is it a hlink ?
-            if (size, inode) in self._size_inode:
-                logger.debug("[deep test] : skip, it's a duplicate (size, inode)", self)
-                return False
-            self._size_inode.add((size,inode))
-            if size not in self._uniq_dict:
-                # first item of that size
-                unique_key = size
-                logger.debug("[deep test] : store current size ?", self)
-            else:
-                prev = self._uniq_dict[size]
-                if prev:
-                    # store md5sum instead of previously stored size
-                    md5sum_prev = md5sum(prev)
-                    self._uniq_dict[size] = None
-                    self._uniq_dict[md5sum_prev] = prev
-                    logger.debug("[deep test] : size duplicate, remove the size, store prev md5sum", self)
-                unique_key = md5sum(path)
-                logger.debug("[deep test] : store current md5sum ?", self)
-        else:
-            # store a tuple of (size, modification time)
-            obj  = os.stat(path)
-            unique_key = (obj.st_size, int(obj.st_mtime))
+            return self._checkUnique(path, st, None, st.st_size in self._uniq_dict)
+        # store a tuple of (size, modification time)
+        return self._store((st.st_size, int(st.st_mtime)), path)
+
+    def _checkUnique(self, path, st, pending, sizeExists):
+        size, inode = st.st_size, (st.st_dev, st.st_ino)
+        # is it a hlink ?
+        if (size, inode) in self._size_inode:
+            logger.debug("[deep test] : skip, it's a duplicate (size, inode)", self)
+            return False
+        self._size_inode.add((size, inode))
+        if not sizeExists:
+            # first item of that size
+            logger.debug("[deep test] : store current size ?", self)
+            return self._store(size, path)
+        prev = self._uniq_dict.get(size)
+        if prev:
+            # store digest instead of previously stored size
+            self._uniq_dict[size] = None
+            self._uniq_dict[(size, self.digest(prev, os.stat(prev), pending))] = prev
+            logger.debug("[deep test] : size duplicate, remove the size, store prev digest", self)
+        logger.debug("[deep test] : store current digest ?", self)
+        return self._store((size, self.digest(path, st, pending)), path)
+
+    def _store(self, unique_key, path):
         # store if not already present, then return True
         if unique_key not in self._uniq_dict:
             logger.debug(" >> ok, store !", self)
@@ -1466,10 +1936,14 @@ class UniquenessSet:
         Returns:
             bool:       ``True`` if file is equal
         """
-        st = os.stat(path)
+        return self._checkEqual(path, os.stat(path), None)
+
+    def _checkEqual(self, path, st, pending):
         if self.deep_check:
             if self.reference[0] == st.st_size:
-                return self.reference[1] == md5sum(path)
+                if (st.st_dev, st.st_ino) == self.referenceInode:
+                    return True
+                return self.reference[1] == self.digest(path, st, pending)
             return False
         else:
             return self.reference == (st.st_size, int(st.st_mtime))
@@ -1863,6 +2337,22 @@ class OrderedSet(collections.MutableSet):
             return len(self) == len(other) and list(self) == list(other)
         return set(self) == set(other)
 
+def batchFilter(func):
+    """
+    Mark ``func`` as filter for :py:class:`Execute` which takes a
+    :py:class:`list` of lines and returns the filtered list instead of
+    working on a single line. Batch filters in front of all other filters
+    get raw :py:class:`bytes` lines.
+
+    Args:
+        func (method):  filter function
+
+    Returns:
+        method:         ``func``
+    """
+    func.batch = True
+    return func
+
 class Execute(object):
     """
     Execute external commands and handle its output.
@@ -1886,11 +2376,18 @@ class Execute(object):
         conv_str (bool):    convert output to :py:class:`str` if True or keep it
                             as :py:class:`bytes` if False
         join_stderr (bool): join stderr to stdout
+        pipeline (bool):    read output in a background thread in large
+                            chunks and handle it in batches of lines, see
+                            :py:func:`runPipeline`. Only for
+                            :py:class:`list` commands
 
     Note:
         Signals SIGTSTP and SIGCONT send to Python main process will be
         forwarded to the command. SIGHUP will kill the process.
     """
+    PIPELINE_CHUNK_SIZE = 1024 * 1024
+    PIPELINE_CHUNKS = 64
+
     def __init__(self,
                  cmd,
                  callback = None,
@@ -1898,7 +2395,8 @@ class Execute(object):
                  filters = (),
                  parent = None,
                  conv_str = True,
-                 join_stderr = True):
+                 join_stderr = True,
+                 pipeline = False):
         self.cmd = cmd
         self.callback = callback
         self.user_data = user_data
@@ -1906,6 +2404,7 @@ class Execute(object):
         self.currentProc = None
         self.conv_str = conv_str
         self.join_stderr = join_stderr
+        self.pipeline = pipeline
         #we need to forward parent to have the correct class name in debug log
         if parent:
             self.parent = parent
@@ -1965,24 +2464,12 @@ class Execute(object):
                 #signal only work in qt main thread
                 pass
 
-            if self.join_stderr:
-                stderr = subprocess.STDOUT
-            else:
-                stderr = subprocess.DEVNULL
-            self.currentProc = subprocess.Popen(self.cmd,
-                                                stdout = subprocess.PIPE,
-                                                stderr = stderr)
-            if self.callback:
+            self.start()
+            if self.callback and self.pipeline:
+                self.runPipeline()
+            elif self.callback:
                 for line in self.currentProc.stdout:
-                    if self.conv_str:
-                        line = line.decode().rstrip('\n')
-                    else:
-                        line = line.rstrip(b'\n')
-                    for f in self.filters:
-                        line = f(line)
-                    if not line:
-                        continue
-                    self.callback(line, self.user_data)
+                    self.handleLine(line)
 
             out = self.currentProc.communicate()[0]
             ret_val = self.currentProc.returncode
@@ -1996,18 +2483,138 @@ class Execute(object):
                 #signal only work in qt main thread
                 pass
 
+        self.logReturncode(ret_val, out)
+        return ret_val
+
+    def start(self):
+        """
+        Start the command with :py:class:`subprocess.Popen` without waiting
+        for it to finish.
+        """
+        if self.join_stderr:
+            stderr = subprocess.STDOUT
+        else:
+            stderr = subprocess.DEVNULL
+        self.currentProc = subprocess.Popen(self.cmd,
+                                            stdout = subprocess.PIPE,
+                                            stderr = stderr)
+
+    def handleLine(self, line):
+        """
+        Filter one line of the commands output and send it to ``callback``.
+
+        Args:
+            line (bytes):   raw output line including the trailing newline
+        """
+        self.handleLines([line.rstrip(b'\n')])
+
+    def runPipeline(self):
+        """
+        Handle output of the started command in pipeline mode. A background
+        thread reads stdout with large :py:func:`os.read` calls into a queue
+        of up to :py:attr:`PIPELINE_CHUNKS` chunks, so the command doesn't
+        have to wait for slow callbacks. Chunks are split into lists of lines
+        and passed through :py:func:`handleLines` in this thread.
+        """
+        chunks = queue.Queue(maxsize = self.PIPELINE_CHUNKS)
+        fd = self.currentProc.stdout.fileno()
+
+        def reader():
+            try:
+                while True:
+                    chunk = os.read(fd, self.PIPELINE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    chunks.put(chunk)
+            finally:
+                chunks.put(None)
+
+        def batches():
+            rest = b''
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                lines = (rest + chunk).split(b'\n')
+                rest = lines.pop()
+                if lines:
+                    yield lines
+            if rest:
+                yield [rest]
+
+        thread = threading.Thread(target = reader, daemon = True)
+        thread.start()
+        for lines in batches():
+            self.handleLines(lines)
+        thread.join()
+
+    def filterLines(self, lines):
+        """
+        Run ``filters`` on a batch of lines. Filters marked with
+        :py:func:`batchFilter` get the whole list, all others one line at a
+        time. Lines are kept as :py:class:`bytes` until the first filter
+        which works on single lines, so batch filters in front of those can
+        drop lines which never need to be decoded.
+
+        Args:
+            lines (list):   raw output lines without trailing newline
+
+        Returns:
+            list:           filtered lines
+        """
+        decoded = not self.conv_str
+        for f in self.filters:
+            # functools.partial doesn't forward attributes of its function
+            if getattr(f, 'batch', False) or getattr(getattr(f, 'func', None), 'batch', False):
+                lines = f(lines)
+                continue
+            if not decoded:
+                lines = [line.decode() for line in lines]
+                decoded = True
+            lines = [f(line) for line in lines]
+            lines = [line for line in lines if line]
+        if not decoded:
+            lines = [line.decode() for line in lines]
+        return lines
+
+    def callLines(self, lines):
+        """
+        Send filtered lines to ``callback``.
+
+        Args:
+            lines (list):   lines returned by :py:func:`filterLines`
+        """
+        for line in lines:
+            if line:
+                self.callback(line, self.user_data)
+
+    def handleLines(self, lines):
+        """
+        Filter a batch of output lines and send them to ``callback``.
+
+        Args:
+            lines (list):   raw output lines without trailing newline
+        """
+        self.callLines(self.filterLines(lines))
+
+    def logReturncode(self, ret_val, out):
+        """
+        Log the returncode of the finished command.
+
+        Args:
+            ret_val (int):  returncode
+            out (bytes):    remaining output of the command
+        """
         if ret_val != 0:
             msg = 'Command "%s" returns %s%s%s' %(self.printable_cmd, bcolors.WARNING, ret_val, bcolors.ENDC)
             if out:
                 msg += ' | %s' %out.decode().strip('\n')
-            logger.warning(msg, self.parent, 2)
+            logger.warning(msg, self.parent, 3)
         else:
             msg = 'Command "%s..." returns %s' %(self.printable_cmd[:min(16, len(self.printable_cmd))], ret_val)
             if out:
                 msg += ': %s' %out.decode().strip('\n')
-            logger.debug(msg, self.parent, 2)
-
-        return ret_val
+            logger.debug(msg, self.parent, 3)
 
     def pause(self, signum, frame):
         """
@@ -2035,6 +2642,109 @@ class Execute(object):
             logger.info('Kill process "%s"' %self.printable_cmd, self.parent, 2)
             return self.currentProc.kill()
 
+class ExecuteParallel(object):
+    """
+    Run multiple :py:class:`Execute` commands at the same time. Output of all
+    commands is read in background threads but filters and callbacks are
+    called one line at a time in the thread which called :py:func:`run`.
+    So callbacks don't need to be thread-safe.
+
+    Args:
+        procs (list):       list of :py:class:`Execute` instances with
+                            :py:class:`list` commands
+        parent (instance):  instance of the calling method used only to proper
+                            format log messages
+
+    Note:
+        Signals SIGTSTP and SIGCONT send to Python main process will be
+        forwarded to all commands. SIGHUP will kill all processes.
+    """
+    def __init__(self, procs, parent = None):
+        assert all(isinstance(i.cmd, (list, tuple)) for i in procs), \
+            'ExecuteParallel only supports list commands'
+        self.procs = procs
+        self.parent = parent if parent else self
+
+    def run(self):
+        """
+        Start all commands and wait until all of them finished.
+
+        Returns:
+            list:   returncodes from all commands in the same order as ``procs``
+        """
+        try:
+            #register signals for pause, resume and kill
+            signal.signal(signal.SIGTSTP, self.pause)
+            signal.signal(signal.SIGCONT, self.resume)
+            signal.signal(signal.SIGHUP, self.kill)
+        except ValueError:
+            #signal only work in qt main thread
+            pass
+
+        lines = queue.Queue()
+        def reader(index, proc):
+            try:
+                if proc.callback:
+                    for line in proc.currentProc.stdout:
+                        lines.put((index, line))
+            finally:
+                lines.put((index, None))
+
+        threads = []
+        for index, proc in enumerate(self.procs):
+            proc.start()
+            t = threading.Thread(target = reader, args = (index, proc), daemon = True)
+            t.start()
+            threads.append(t)
+
+        running = len(self.procs)
+        while running:
+            index, line = lines.get()
+            if line is None:
+                running -= 1
+                continue
+            self.procs[index].handleLine(line)
+
+        ret = []
+        for t, proc in zip(threads, self.procs):
+            t.join()
+            out = proc.currentProc.communicate()[0]
+            ret.append(proc.currentProc.returncode)
+            proc.logReturncode(proc.currentProc.returncode, out)
+
+        try:
+            #reset signals to their default
+            signal.signal(signal.SIGTSTP, signal.SIG_DFL)
+            signal.signal(signal.SIGCONT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        except ValueError:
+            #signal only work in qt main thread
+            pass
+        return ret
+
+    def pause(self, signum, frame):
+        """
+        Slot which will send ``SIGSTOP`` to all commands. Is connected to
+        signal ``SIGTSTP``.
+        """
+        for proc in self.procs:
+            proc.pause(signum, frame)
+
+    def resume(self, signum, frame):
+        """
+        Slot which will send ``SIGCONT`` to all commands. Is connected to
+        signal ``SIGCONT``.
+        """
+        for proc in self.procs:
+            proc.resume(signum, frame)
+
+    def kill(self, signum, frame):
+        """
+        Slot which will kill all commands. Is connected to signal ``SIGHUP``.
+        """
+        for proc in self.procs:
+            proc.kill(signum, frame)
+
 class Daemon:
     """
     A generic daemon class.
@@ -0,0 +1,342 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import sqlite3
+import urllib.parse
+from collections import namedtuple
+
+import logger
+
+
+Usage = namedtuple('Usage', ('total', 'exclusive', 'shared', 'inodes'))
+Usage.__doc__ = """
+Disk usage of one snapshot in bytes. ``exclusive`` is the space which would
+be freed by removing the snapshot, ``shared`` is used by hardlinks in other
+snapshots, too. ``inodes`` is the number of files and folders.
+"""
+
+class SnapshotUsage(object):
+    """
+    Hardlink aware disk usage of all snapshots in one profile.
+
+    Unchanged files are hardlinked between snapshots, so the apparent size of
+    a snapshot doesn't tell how much space removing it would free. Every
+    inode found in a snapshot is stored once together with a reference from
+    each snapshot containing it. Inodes which are referenced by only one
+    snapshot count as exclusive for this snapshot, all others as shared.
+
+    Snapshots never change after they were taken. So every snapshot is
+    scanned only once and the results are cached in a SQLite database in the
+    local data folder. :py:func:`update` only scans new snapshots and drops
+    references of removed ones. Only inodes which are not yet in the database
+    need a ``stat`` call. Sizes are allocated blocks like ``du`` reports them.
+
+    Inode numbers are only meaningful on the same filesystem, so this works
+    in local mode only. The database is reset if the snapshots path or its
+    device changed.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    VERSION = 1
+    SCHEMA = ('CREATE TABLE meta (key TEXT PRIMARY KEY, value)',
+              'CREATE TABLE snapshots (id INTEGER PRIMARY KEY, sid TEXT UNIQUE, '
+              'total INTEGER, exclusive INTEGER, shared INTEGER, inodes INTEGER)',
+              'CREATE TABLE inodes (ino INTEGER PRIMARY KEY, size INTEGER, '
+              'refs INTEGER)',
+              'CREATE TABLE refs (snapshot INTEGER, ino INTEGER, '
+              'PRIMARY KEY (snapshot, ino)) WITHOUT ROWID')
+    #: max number of inodes per ``IN (...)`` query
+    BATCH = 500
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.currentProfile()
+        self.profileID = profile_id
+        self.path = cfg.snapshotsFullPath(profile_id)
+        self.fileName = cfg.snapshotUsageFile(profile_id)
+
+    @property
+    def supported(self):
+        return self.config.snapshotsMode(self.profileID) == 'local'
+
+    def connect(self):
+        """
+        Open the database and create or reset it if necessary.
+
+        Returns:
+            sqlite3.Connection: open database connection
+        """
+        conn = sqlite3.connect(self.fileName)
+        try:
+            meta = self.meta(conn)
+            current = {'version': self.VERSION,
+                       'path':    self.path,
+                       'device':  os.stat(self.path).st_dev}
+            if meta != current:
+                if meta:
+                    logger.debug('Reset snapshot usage database {}'.format(self.fileName), self)
+                conn.close()
+                os.remove(self.fileName)
+                conn = sqlite3.connect(self.fileName)
+                with conn:
+                    for sql in self.SCHEMA:
+                        conn.execute(sql)
+                    conn.executemany('INSERT INTO meta VALUES (?, ?)', current.items())
+        except:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def meta(conn):
+        try:
+            return dict(conn.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            return {}
+
+    def update(self, sids, callback = None):
+        """
+        Bring the database in sync with ``sids``. New snapshots will be
+        scanned, removed ones dropped and all totals recalculated.
+
+        Args:
+            sids (list):        all current :py:class:`snapshots.SID` objects
+            callback (method):  called with each :py:class:`snapshots.SID`
+                                before it is scanned
+
+        Returns:
+            dict:               {sid: :py:class:`Usage`}
+
+        Raises:
+            OSError:            if the snapshots path is not accessible
+            sqlite3.Error:      if the database can not be written
+        """
+        conn = self.connect()
+        try:
+            known = dict(conn.execute('SELECT sid, id FROM snapshots'))
+            current = set(str(sid) for sid in sids)
+            changed = False
+            for sid, snapshotId in known.items():
+                if sid not in current:
+                    self.dropSnapshot(conn, snapshotId)
+                    changed = True
+            for sid in sids:
+                if str(sid) in known:
+                    continue
+                if callback:
+                    callback(sid)
+                self.addSnapshot(conn, sid)
+                changed = True
+            if changed:
+                self.updateTotals(conn)
+            return self.read(conn)
+        finally:
+            conn.close()
+
+    def addSnapshot(self, conn, sid):
+        """
+        Scan ``sid`` and add references for all inodes inside.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            sid (snapshots.SID):        snapshot to scan
+        """
+        with conn:
+            snapshotId = conn.execute('INSERT INTO snapshots (sid) VALUES (?)',
+                                      (str(sid),)).lastrowid
+            for batch in self.scan(sid.path()):
+                for i in range(0, len(batch), self.BATCH):
+                    self.addInodes(conn, snapshotId, batch[i:i + self.BATCH])
+            conn.execute('UPDATE inodes SET refs = refs + 1 WHERE ino IN '
+                         '(SELECT ino FROM refs WHERE snapshot = ?)', (snapshotId,))
+
+    def addInodes(self, conn, snapshotId, batch):
+        """
+        Add references from ``snapshotId`` to all inodes in ``batch`` and
+        ``stat`` only those which are not in the database yet.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            snapshotId (int):           row id of the snapshot
+            batch (list):               list of (inode, path) tuples
+        """
+        sql = 'SELECT ino FROM inodes WHERE ino IN ({})'.format(','.join('?' * len(batch)))
+        known = set(row[0] for row in conn.execute(sql, [ino for ino, path in batch]))
+        new = []
+        for ino, path in batch:
+            if ino in known:
+                continue
+            try:
+                size = os.lstat(path).st_blocks * 512
+            except OSError as e:
+                logger.debug('Failed to stat {}: {}'.format(path, str(e)), self)
+                continue
+            known.add(ino)
+            new.append((ino, size))
+        conn.executemany('INSERT INTO inodes VALUES (?, ?, 0)', new)
+        conn.executemany('INSERT OR IGNORE INTO refs VALUES (?, ?)',
+                         ((snapshotId, ino) for ino, path in batch if ino in known))
+
+    def dropSnapshot(self, conn, snapshotId):
+        """
+        Remove all references of a snapshot which doesn't exist anymore and
+        delete inodes which are not used by any other snapshot.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            snapshotId (int):           row id of the snapshot
+        """
+        with conn:
+            conn.execute('UPDATE inodes SET refs = refs - 1 WHERE ino IN '
+                         '(SELECT ino FROM refs WHERE snapshot = ?)', (snapshotId,))
+            conn.execute('DELETE FROM inodes WHERE refs <= 0')
+            conn.execute('DELETE FROM refs WHERE snapshot = ?', (snapshotId,))
+            conn.execute('DELETE FROM snapshots WHERE id = ?', (snapshotId,))
+
+    def updateTotals(self, conn):
+        """
+        Recalculate total, exclusive and shared size for all snapshots in
+        one pass over all references.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+        """
+        rows = conn.execute('SELECT r.snapshot, COALESCE(SUM(i.size), 0), '
+                            'COALESCE(SUM(CASE WHEN i.refs = 1 THEN i.size ELSE 0 END), 0), '
+                            'COUNT(*) FROM refs r JOIN inodes i ON i.ino = r.ino '
+                            'GROUP BY r.snapshot').fetchall()
+        with conn:
+            conn.execute('UPDATE snapshots SET total = 0, exclusive = 0, shared = 0, inodes = 0')
+            conn.executemany('UPDATE snapshots SET total = ?, exclusive = ?, '
+                             'shared = ?, inodes = ? WHERE id = ?',
+                             ((total, exclusive, total - exclusive, inodes, snapshotId)
+                              for snapshotId, total, exclusive, inodes in rows))
+
+    def predictRemoval(self, sids):
+        """
+        Predict how much space and how many inodes removing ``sids`` one
+        after the other would free. An inode is only freed together with the
+        last snapshot referencing it. All snapshots which are not in ``sids``
+        are kept. Call :py:func:`update` first.
+
+        Args:
+            sids (list):    :py:class:`snapshots.SID` objects in the order
+                            they would be removed
+
+        Returns:
+            list:           (bytes, inodes) tuples. Item ``i`` is what
+                            removing ``sids[:i + 1]`` would free
+
+        Raises:
+            OSError:        if the snapshots path is not accessible
+            sqlite3.Error:  if the database can not be read
+        """
+        conn = self.connect()
+        try:
+            ids = dict(conn.execute('SELECT sid, id FROM snapshots'))
+            conn.execute('CREATE TEMP TABLE removal (snapshot INTEGER PRIMARY KEY, pos INTEGER)')
+            conn.executemany('INSERT INTO removal VALUES (?, ?)',
+                             ((ids[str(sid)], pos) for pos, sid in enumerate(sids)
+                              if str(sid) in ids))
+            freed = [[0, 0] for sid in sids]
+            # inodes without references from kept snapshots grouped by the
+            # position of the last snapshot which references them
+            for pos, size, inodes in conn.execute(
+                    'SELECT p.pos, SUM(i.size), COUNT(*) FROM '
+                    '(SELECT r.ino AS ino, MAX(o.pos) AS pos FROM refs r '
+                    'LEFT JOIN removal o ON o.snapshot = r.snapshot '
+                    'GROUP BY r.ino HAVING COUNT(o.pos) = COUNT(*)) p '
+                    'JOIN inodes i ON i.ino = p.ino GROUP BY p.pos'):
+                freed[pos] = [size, inodes]
+        finally:
+            conn.close()
+        total = [0, 0]
+        result = []
+        for size, inodes in freed:
+            total = [total[0] + size, total[1] + inodes]
+            result.append(tuple(total))
+        return result
+
+    def scan(self, path):
+        """
+        Walk through ``path`` without following symlinks.
+
+        Args:
+            path (str): full path to a snapshot
+
+        Yields:
+            list:       (inode, path) tuples of one folder's content. The
+                        first list only holds ``path`` itself
+        """
+        try:
+            yield [(os.lstat(path).st_ino, path)]
+        except OSError as e:
+            logger.debug('Failed to stat {}: {}'.format(path, str(e)), self)
+            return
+        folders = [path]
+        while folders:
+            folder = folders.pop()
+            batch = []
+            try:
+                names = os.listdir(folder)
+            except OSError as e:
+                logger.debug('Failed to scan {}: {}'.format(folder, str(e)), self)
+                names = []
+            for name in names:
+                child = os.path.join(folder, name)
+                try:
+                    st = os.lstat(child)
+                except OSError as e:
+                    logger.debug('Failed to scan {}: {}'.format(child, str(e)), self)
+                    continue
+                batch.append((st.st_ino, child))
+                if stat.S_ISDIR(st.st_mode):
+                    folders.append(child)
+            if batch:
+                yield batch
+
+    def read(self, conn):
+        return {sid: Usage(*row) for sid, *row in conn.execute(
+                'SELECT sid, total, exclusive, shared, inodes FROM snapshots '
+                'WHERE total IS NOT NULL')}
+
+    def sizes(self):
+        """
+        Cached usage of all snapshots without scanning anything.
+
+        Returns:
+            dict:   {sid: :py:class:`Usage`} where ``sid`` is the snapshot ID
+                    as :py:class:`str`. Empty if there is no database
+        """
+        if not os.path.exists(self.fileName):
+            return {}
+        uri = 'file:{}?mode=ro'.format(urllib.parse.quote(self.fileName))
+        try:
+            conn = sqlite3.connect(uri, uri = True)
+            try:
+                return self.read(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.debug('Failed to read snapshot usage database {}: {}'.format(
+                         self.fileName, str(e)), self)
+            return {}
@@ -0,0 +1,240 @@
+# Back In Time
+# Copyright (C) 2008-2021 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import sqlite3
+
+import logger
+
+
+class VersionIndex(object):
+    """
+    Per path history of all snapshots of one profile which answers which
+    snapshots contain a path and in which snapshots it changed without
+    touching the snapshot trees.
+
+    For every snapshot only differences to the previous snapshot are stored:
+    paths which are new or whose content changed (``NEW``) and paths which
+    are gone (``DELETED``). Changes are taken from rsync's itemized output,
+    new and deleted paths by comparing the paths in ``fileinfo.db`` with the
+    previous snapshot. A snapshot without a usable previous snapshot is a
+    *base* which stores all of its paths as ``NEW``.
+
+    Removed snapshots are merged into the next newer snapshot so the history
+    of all remaining snapshots stays intact.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    VERSION = 1
+    DELETED = 0
+    NEW = 1
+    SCHEMA = ('CREATE TABLE meta (key TEXT PRIMARY KEY, value)',
+              'CREATE TABLE snapshots (sid TEXT PRIMARY KEY, prev TEXT)',
+              'CREATE TABLE changes (path BLOB, sid TEXT, kind INTEGER, '
+              'type TEXT, PRIMARY KEY (path, sid)) WITHOUT ROWID')
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.currentProfile()
+        self.profileID = profile_id
+        self.path = cfg.snapshotsFullPath(profile_id)
+        self.fileName = cfg.versionIndexFile(profile_id)
+
+    @property
+    def supported(self):
+        # rsync itemizes encrypted paths in ssh_encfs mode
+        return self.config.snapshotsMode(self.profileID) != 'ssh_encfs'
+
+    def connect(self):
+        """
+        Open the index and create it if necessary. The index is reset if it
+        was created for a different snapshot folder.
+
+        Returns:
+            sqlite3.Connection: open database connection
+        """
+        conn = sqlite3.connect(self.fileName)
+        try:
+            meta = {}
+            if conn.execute("SELECT name FROM sqlite_master "
+                            "WHERE type = 'table' AND name = 'meta'").fetchone():
+                meta = dict(conn.execute('SELECT key, value FROM meta'))
+            if meta.get('version') != self.VERSION or meta.get('path') != self.path:
+                if meta:
+                    logger.debug('Reset version index {}'.format(self.fileName), self)
+                with conn:
+                    for table in ('meta', 'snapshots', 'changes'):
+                        conn.execute('DROP TABLE IF EXISTS {}'.format(table))
+                    for sql in self.SCHEMA:
+                        conn.execute(sql)
+                    conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                                     (('version', self.VERSION), ('path', self.path)))
+        except:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def fileType(mode):
+        """
+        Short type of a path stored in ``fileinfo.db``.
+
+        Args:
+            mode (int): ``st_mode``
+
+        Returns:
+            str:        'd' for folders, 'f' for files or 'o' for all other
+        """
+        if stat.S_ISDIR(mode):
+            return 'd'
+        if stat.S_ISREG(mode):
+            return 'f'
+        return 'o'
+
+    def add(self, sid, prevSid, changed, allSids):
+        """
+        Add snapshot ``sid`` to the index. ``sid`` is stored as base if
+        ``prevSid`` is not the newest snapshot in the index.
+
+        Args:
+            sid (snapshots.SID):        new snapshot
+            prevSid (snapshots.SID):    snapshot which rsync compared ``sid``
+                                        with or ``None`` if ``changed`` is
+                                        incomplete
+            changed (list):             paths of changed files as printed by
+                                        rsync (relative to the backup folder)
+            allSids (list):             all other existing
+                                        :py:class:`snapshots.SID`. Used to
+                                        find removed snapshots
+
+        Raises:
+            sqlite3.Error:              if the index can not be written
+        """
+        fileInfo = sid.fileInfo
+        conn = self.connect()
+        try:
+            self.sync(conn, allSids)
+            with conn:
+                row = conn.execute('SELECT sid FROM snapshots WHERE sid < ? '
+                                   'ORDER BY sid DESC LIMIT 1', (sid.sid,)).fetchone()
+                if prevSid and row and row[0] == prevSid.sid:
+                    prev = prevSid.sid
+                    prevFileInfo = prevSid.fileInfo
+                    changes = [(path, self.DELETED, None)
+                               for path in prevFileInfo if path not in fileInfo]
+                    new = set(path for path, info in fileInfo.items()
+                              if path not in prevFileInfo
+                              or self.fileType(info[0]) != self.fileType(prevFileInfo[path][0]))
+                    for name in changed:
+                        path = os.fsencode(os.path.normpath(os.sep + name))
+                        if path in fileInfo:
+                            new.add(path)
+                    changes.extend((path, self.NEW, self.fileType(fileInfo[path][0]))
+                                   for path in new)
+                else:
+                    # base snapshot
+                    prev = None
+                    changes = [(path, self.NEW, self.fileType(info[0]))
+                               for path, info in fileInfo.items()]
+                conn.execute('DELETE FROM changes WHERE sid = ?', (sid.sid,))
+                conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?)', (sid.sid, prev))
+                conn.executemany('INSERT INTO changes VALUES (?, ?, ?, ?)',
+                                 [(path, sid.sid, kind, fileType)
+                                  for path, kind, fileType in changes])
+        finally:
+            conn.close()
+        logger.debug('Added {} with {} changes to version index{}'.format(
+                     sid, len(changes), '' if prev else ' as base'), self)
+
+    def sync(self, conn, sids):
+        """
+        Merge snapshots which were removed into their next newer snapshot.
+        Changes of the removed snapshot are moved to the next snapshot unless
+        that one has its own change for the same path.
+
+        Args:
+            conn (sqlite3.Connection):  open database
+            sids (list):                all existing :py:class:`snapshots.SID`
+        """
+        existing = set(sid.sid for sid in sids)
+        indexed = [row[0] for row in conn.execute('SELECT sid FROM snapshots ORDER BY sid')]
+        removed = [sid for sid in indexed if sid not in existing]
+        if not removed:
+            return
+        with conn:
+            for sid in removed:
+                prev, = conn.execute('SELECT prev FROM snapshots WHERE sid = ?', (sid,)).fetchone()
+                row = conn.execute('SELECT sid, prev FROM snapshots WHERE sid > ? '
+                                   'ORDER BY sid LIMIT 1', (sid,)).fetchone()
+                if row and row[1] == sid:
+                    conn.execute('UPDATE OR IGNORE changes SET sid = ? WHERE sid = ?', (row[0], sid))
+                    conn.execute('UPDATE snapshots SET prev = ? WHERE sid = ?', (prev, row[0]))
+                conn.execute('DELETE FROM changes WHERE sid = ?', (sid,))
+                conn.execute('DELETE FROM snapshots WHERE sid = ?', (sid,))
+        logger.debug('Merged {} removed snapshots in version index'.format(len(removed)), self)
+
+    def history(self, path, sids, allSids):
+        """
+        Version of ``path`` in each snapshot of ``sids``. Versions are counted
+        from the oldest indexed snapshot. Every ``NEW`` change starts a new
+        version. Because a base snapshot stores all its paths as ``NEW`` the
+        version also changes at a base even if the file didn't.
+
+        Args:
+            path (str):         path to file or folder on root filesystem
+            sids (list):        :py:class:`snapshots.SID` objects
+            allSids (list):     all existing :py:class:`snapshots.SID`.
+                                Used to find removed snapshots
+
+        Returns:
+            list:               tuple (version, type) for each item in
+                                ``sids`` or ``None`` if ``path`` doesn't exist
+                                in that snapshot. ``None`` instead of the list
+                                if any of ``sids`` is not in the index
+        """
+        key = os.fsencode(os.path.normpath(path))
+        try:
+            conn = self.connect()
+        except sqlite3.Error as e:
+            logger.debug('Failed to open version index: {}'.format(str(e)), self)
+            return None
+        try:
+            self.sync(conn, allSids)
+            indexed = set(row[0] for row in conn.execute('SELECT sid FROM snapshots'))
+            if not all(sid.sid in indexed for sid in sids):
+                return None
+            changes = conn.execute('SELECT sid, kind, type FROM changes WHERE path = ? '
+                                   'ORDER BY sid', (key,)).fetchall()
+        except sqlite3.Error as e:
+            logger.debug('Failed to read version index: {}'.format(str(e)), self)
+            return None
+        finally:
+            conn.close()
+
+        ret = []
+        for sid in sids:
+            current = None
+            for version, (changeSid, kind, fileType) in enumerate(changes):
+                if changeSid > sid.sid:
+                    break
+                current = (version, fileType) if kind == self.NEW else None
+            ret.append(current)
+        return ret
@@ -724,11 +724,10 @@ class MainWindow(QMainWindow):
 
             self.status.setText(message)
 
-        pg = progress.ProgressFile(self.config)
-        if pg.fileReadable():
+        pg = progress.current(self.config)
+        if pg is not None:
             self.progressBar.setVisible(True)
             self.progressBarDummy.setVisible(False)
-            pg.load()
             self.progressBar.setValue(pg.intValue('percent'))
             message = ' | '.join(self.getProgressBarFormat(pg, message))
             self.status.setText(message)
@@ -46,6 +46,7 @@ class LogViewDialog(QDialog):
         self.sid = sid
         self.enableUpdate = False
         self.decode = None
+        self.logReader = None
 
         w = self.config.intValue('qt.logview.width', 800)
         h = self.config.intValue('qt.logview.height', 500)
@@ -250,11 +251,19 @@ class LogViewDialog(QDialog):
             # remove path from watch to prevent multiple updates at the same time
             self.watcher.removePath(watchPath)
             # append only new lines to txtLogView
-            log = snapshotlog.SnapshotLog(self.config, self.comboProfiles.currentProfileID())
-            for line in log.get(mode = mode,
-                                decode = self.decode,
-                                skipLines = self.txtLogView.document().lineCount() - 1):
-                self.txtLogView.appendPlainText(line)
+            lines = None
+            if self.logReader:
+                try:
+                    lines = self.logReader.tail(mode)
+                except OSError:
+                    pass
+            if lines is None or self.logReader.truncated:
+                self.reloadLog(mode)
+            else:
+                logFilter = snapshotlog.LogFilter(mode, self.decode)
+                for line in logFilter.filterLines(lines):
+                    if not line is None:
+                        self.txtLogView.appendPlainText(line)
 
             # re-add path to watch after 5sec delay
             alarm = tools.Alarm(callback = lambda: self.watcher.addPath(watchPath),
@@ -262,11 +271,17 @@ class LogViewDialog(QDialog):
             alarm.start(5)
 
         elif self.sid is None:
-            log = snapshotlog.SnapshotLog(self.config, self.comboProfiles.currentProfileID())
-            self.txtLogView.setPlainText('\n'.join(log.get(mode = mode, decode = self.decode)))
+            self.reloadLog(mode)
         else:
+            self.logReader = None
             self.txtLogView.setPlainText('\n'.join(self.sid.log(mode, decode = self.decode)))
 
+    def reloadLog(self, mode):
+        log = snapshotlog.SnapshotLog(self.config, self.comboProfiles.currentProfileID())
+        self.txtLogView.setPlainText('\n'.join(log.get(mode = mode, decode = self.decode)))
+        # keep the reader to append new lines only
+        self.logReader = log.logReader
+
     def closeEvent(self, event):
         self.config.setIntValue('qt.logview.width', self.width())
         self.config.setIntValue('qt.logview.height', self.height())
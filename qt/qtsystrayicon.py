@@ -168,9 +168,8 @@ class QtSysTrayIcon:
                                                                        ))
                 self.status_icon.setToolTip(message[1])
 
-        pg = progress.ProgressFile(self.config)
-        if pg.fileReadable():
-            pg.load()
+        pg = progress.current(self.config)
+        if pg is not None:
             percent = pg.intValue('percent')
             ## disable progressbar in icon until BiT has it's own icon
             ## fixes bug #902
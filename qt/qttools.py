@@ -45,6 +45,8 @@ def registerBackintimePath(*path):
 
 registerBackintimePath('common')
 import snapshots
+import tools
+import usage
 
 def fontBold(font):
     font.setWeight(QFont.Bold)
@@ -207,11 +209,21 @@ class TimeLine(QTreeWidget):
         self.parent = parent
         self.snapshots = parent.snapshots
         self._resetHeaderData()
+        self._resetUsage()
 
     def clear(self):
         self._resetHeaderData()
+        self._resetUsage()
         return super(TimeLine, self).clear()
 
+    def _resetUsage(self):
+        #only read cached sizes. Scanning is done after taking a snapshot
+        config = self.snapshots.config
+        if config.snapshotUsage():
+            self.usage = usage.SnapshotUsage(config).sizes()
+        else:
+            self.usage = {}
+
     def _resetHeaderData(self):
         self.now = date.today()
         #list of tuples with (text, startDate, endDate)
@@ -252,7 +264,7 @@ class TimeLine(QTreeWidget):
 
     @pyqtSlot(snapshots.SID)
     def addSnapshot(self, sid):
-        item = SnapshotItem(sid)
+        item = SnapshotItem(sid, self.usage.get(str(sid)))
 
         self.addTopLevelItem(item)
 
@@ -342,7 +354,7 @@ class TimeLineItem(QTreeWidgetItem):
         return self.data(0, Qt.UserRole)
 
 class SnapshotItem(TimeLineItem):
-    def __init__(self, sid):
+    def __init__(self, sid, snapshotUsage = None):
         super(SnapshotItem, self).__init__()
         self.setText(0, sid.displayName)
         self.setFont(0, fontNormal(self.font(0)))
@@ -352,7 +364,12 @@ class SnapshotItem(TimeLineItem):
         if sid.isRoot:
             self.setToolTip(0, _('This is NOT a snapshot but a live view of your local files'))
         else:
-            self.setToolTip(0, _('Last check %s') %sid.lastChecked)
+            toolTip = _('Last check %s') %sid.lastChecked
+            if snapshotUsage is not None:
+                toolTip += '\n' + _('Exclusive: %(exclusive)s, shared: %(shared)s') \
+                           %{'exclusive': tools.formatBytes(snapshotUsage.exclusive),
+                             'shared': tools.formatBytes(snapshotUsage.shared)}
+            self.setToolTip(0, toolTip)
 
     def updateText(self):
         sid = self.snapshotID()